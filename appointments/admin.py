@@ -1,12 +1,86 @@
-from django.contrib import admin
-from .models import Cliente, Barbiere, Servizio, Appuntamento
+import csv
+from functools import partial
+
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from .archivio import archivia, giorni_orizzonte, orizzonte, ripristina
+from .disponibilita import STATI_OCCUPANTI
+from .elenchi_admin import CHANGE_LIST_INDICIZZATA, FiltroBarbiere, FiltroServizio, PaginatorStimato
+from .esportazione import esporta, sommario_barbiere
+from .importazione import ImportaClientiForm, apri_testo, formato_da_nome, importa_clienti, righe
+from .models import Cliente, Barbiere, Servizio, Appuntamento, AppuntamentoArchiviato, Lavoro, RichiestaAttesa
+from .prenotazioni import cambia_stato_in_blocco, conferma_in_blocco
+from . import coda, ricerca
+
+
+@admin.action(description="Esporta in CSV")
+def esporta_csv(modeladmin, request, queryset):
+    return esporta(request, 'csv', 'appuntamenti', queryset)
+
+
+@admin.action(description="Esporta in iCalendar")
+def esporta_ics(modeladmin, request, queryset):
+    return esporta(request, 'ics', 'appuntamenti', queryset, sommario=sommario_barbiere)
+
+
+class RicercaIndicizzataMixin:
+    """
+    Ricerca della changelist sull'indice full-text (ricerca.py) invece che
+    con LIKE '%...%' su ogni riga; le parole troppo corte per l'indice si
+    cercano con la ricerca standard, ma solo tra le righe già trovate
+    """
+    # Funzione (queryset, parole) -> queryset filtrato sull'indice;
+    # None: la changelist usa solo la ricerca standard
+    ricerca_indicizzata = None
+
+    def get_search_results(self, request, queryset, search_term):
+        parole, corte = ricerca.dividi(search_term)
+        if self.ricerca_indicizzata is None or not parole or not ricerca.disponibile(queryset.db):
+            return super().get_search_results(request, queryset, search_term)
+        queryset = self.ricerca_indicizzata(queryset, parole)
+        return super().get_search_results(request, queryset, ' '.join(corte))
 
 
 @admin.register(Cliente)
-class ClienteAdmin(admin.ModelAdmin):
+class ClienteAdmin(RicercaIndicizzataMixin, admin.ModelAdmin):
     list_display = ['nome', 'email', 'telefono', 'data_registrazione']
-    search_fields = ['nome', 'email']
+    search_fields = ['nome', 'email', 'telefono']
     list_filter = ['data_registrazione']
+    change_list_template = 'admin/appointments/cliente/change_list.html'
+    ricerca_indicizzata = staticmethod(ricerca.filtra_clienti)
+    # Righe scartate mostrate dopo un'importazione
+    scarti_mostrati = 200
+
+    def get_urls(self):
+        return [
+            path('importa/', self.admin_site.admin_view(self.importa_view), name='appointments_cliente_importa'),
+        ] + super().get_urls()
+
+    def importa_view(self, request):
+        """Importazione in blocco da CSV/JSON (vedi importazione.py)"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        esito = None
+        form = ImportaClientiForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                esito = importa_clienti(righe(apri_testo(upload.file), formato_da_nome(upload.name)))
+            except (UnicodeDecodeError, ValueError, csv.Error) as errore:
+                form.add_error('file', f"Importazione interrotta (i lotti già scritti restano): {errore}")
+            else:
+                self.message_user(request, f"Clienti importati: {esito.importati}, scartati: {len(esito.scarti)}")
+        return TemplateResponse(request, 'admin/appointments/cliente/importa.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Importa clienti",
+            'form': form,
+            'esito': esito,
+            'scarti': esito.scarti[:self.scarti_mostrati] if esito else [],
+        })
 
 
 @admin.register(Barbiere)
@@ -23,9 +97,118 @@ class ServizioAdmin(admin.ModelAdmin):
     search_fields = ['nome']
 
 
-@admin.register(Appuntamento)
-class AppuntamentoAdmin(admin.ModelAdmin):
-    list_display = ['cliente', 'barbiere', 'servizio', 'data_ora', 'stato', 'creato_il']
-    list_filter = ['stato', 'barbiere', 'data_ora']
+class ElencoScalabileAdmin(RicercaIndicizzataMixin, admin.ModelAdmin):
+    """
+    Changelist per tabelle grandi (vedi elenchi_admin.py): relazioni nella
+    stessa query, conteggio stimato, filtri dalla cache, date_hierarchy
+    sull'indice, ricerca full-text e niente conteggi per i filtri
+    """
+    list_display = ['cliente', 'barbiere', 'servizio', 'data_ora', 'stato']
+    list_select_related = ['cliente', 'barbiere', 'servizio']
+    list_filter = ['stato', FiltroBarbiere, FiltroServizio, 'data_ora']
     search_fields = ['cliente__nome', 'cliente__email']
     date_hierarchy = 'data_ora'
+    paginator = PaginatorStimato
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    change_list_template = CHANGE_LIST_INDICIZZATA
+    ricerca_indicizzata = staticmethod(partial(ricerca.filtra_appuntamenti, note=False))
+
+
+@admin.register(Appuntamento)
+class AppuntamentoAdmin(ElencoScalabileAdmin):
+    list_display = ElencoScalabileAdmin.list_display + ['creato_il']
+    # Chiave esterna come id: niente <select> con tutti i clienti nel form
+    raw_id_fields = ['cliente']
+    search_fields = ElencoScalabileAdmin.search_fields + ['note']
+    ricerca_indicizzata = staticmethod(ricerca.filtra_appuntamenti)
+    actions = [
+        'conferma_selezionati', 'completa_selezionati', 'cancella_selezionati',
+        'archivia_selezionati', esporta_csv, esporta_ics,
+    ]
+
+    @admin.action(description="Conferma gli appuntamenti selezionati", permissions=['change'])
+    def conferma_selezionati(self, request, queryset):
+        confermati, conflitti = conferma_in_blocco(queryset)
+        self.message_user(request, f"Appuntamenti confermati: {confermati}")
+        if conflitti:
+            self.message_user(
+                request, f"Non confermati perché sovrapposti ad altri appuntamenti: {conflitti}", messages.WARNING
+            )
+
+    @admin.action(description="Segna come completati gli appuntamenti passati selezionati", permissions=['change'])
+    def completa_selezionati(self, request, queryset):
+        # Solo quelli che occupavano la poltrona: un cancellato resta cancellato
+        completati = cambia_stato_in_blocco(
+            queryset.filter(data_ora__lt=timezone.now(), stato__in=STATI_OCCUPANTI), 'completato'
+        )
+        self.message_user(request, f"Appuntamenti completati: {completati}")
+
+    @admin.action(description="Cancella gli appuntamenti selezionati", permissions=['change'])
+    def cancella_selezionati(self, request, queryset):
+        cancellati = cambia_stato_in_blocco(queryset, 'cancellato')
+        self.message_user(request, f"Appuntamenti cancellati: {cancellati}")
+
+    @admin.action(
+        description="Archivia gli appuntamenti completati o cancellati selezionati oltre l'orizzonte",
+        permissions=['delete'],
+    )
+    def archivia_selezionati(self, request, queryset):
+        archiviati = archivia(queryset.filter(data_ora__lt=orizzonte()))
+        self.message_user(request, f"Appuntamenti archiviati: {archiviati}")
+        # Quelli archiviati non sono più nel queryset
+        rimasti = queryset.count()
+        if rimasti:
+            self.message_user(
+                request,
+                f"Non archiviati perché non completati o cancellati, o più recenti di "
+                f"{giorni_orizzonte()} giorni: {rimasti}",
+                messages.WARNING,
+            )
+
+
+@admin.register(AppuntamentoArchiviato)
+class AppuntamentoArchiviatoAdmin(ElencoScalabileAdmin):
+    """Storico archiviato: si consulta e si ripristina, non si modifica"""
+    list_display = ElencoScalabileAdmin.list_display + ['archiviato_il']
+    actions = ['ripristina_selezionati', esporta_csv, esporta_ics]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description="Ripristina gli appuntamenti selezionati", permissions=['delete'])
+    def ripristina_selezionati(self, request, queryset):
+        ripristinati = ripristina(queryset)
+        self.message_user(request, f"Appuntamenti ripristinati: {ripristinati}")
+
+
+@admin.register(RichiestaAttesa)
+class RichiestaAttesaAdmin(admin.ModelAdmin):
+    list_display = ['cliente', 'barbiere', 'servizio', 'giorno', 'dalle', 'alle', 'creata_il', 'promossa_il']
+    list_select_related = ['cliente', 'barbiere', 'servizio']
+    list_filter = [FiltroBarbiere, 'giorno', ('promossa_il', admin.EmptyFieldListFilter)]
+    raw_id_fields = ['cliente', 'appuntamento']
+    readonly_fields = ['creata_il', 'promossa_il', 'appuntamento']
+    date_hierarchy = 'giorno'
+
+
+@admin.register(Lavoro)
+class LavoroAdmin(admin.ModelAdmin):
+    list_display = ['tipo', 'stato', 'tentativi', 'max_tentativi', 'disponibile_dal', 'creato_il', 'completato_il']
+    list_filter = ['stato', 'tipo']
+    search_fields = ['chiave']
+    readonly_fields = [campo.name for campo in Lavoro._meta.fields]
+    actions = ['rimetti_in_coda']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Rimetti in coda i lavori falliti selezionati", permissions=['change'])
+    def rimetti_in_coda(self, request, queryset):
+        rimessi = queryset.filter(stato=coda.FALLITO).update(
+            stato=coda.IN_CODA, tentativi=0, disponibile_dal=timezone.now(), completato_il=None
+        )
+        self.message_user(request, f"Lavori rimessi in coda: {rimessi}")
@@ -0,0 +1,223 @@
+"""
+Analisi dell'utilizzo delle poltrone con NumPy: mappe di occupazione
+giorno della settimana × ora per barbiere, tassi di cancellazione e di
+mancata presentazione, ore di punta.
+
+Gli appuntamenti (attivi e archiviati) si leggono come colonne:
+``values_list('barbiere_id', 'data_ora', 'servizio__durata_minuti', 'stato')``
+eseguito direttamente sul cursore, senza creare un oggetto per riga. Su SQLite
+data_ora si legge come testo (CAST), così il driver non crea un datetime per
+riga e NumPy converte tutte le date insieme; gli altri database restituiscono
+datetime, convertiti con un ciclo sulla sola colonna.
+Da lì in poi ogni calcolo è vettoriale: l'ora locale si ricava con lo
+scostamento del fuso di ciascuna ora UTC distinta (una manciata di
+chiamate a zoneinfo anche su milioni di righe), i minuti occupati si
+distribuiscono sulle ore toccate da ogni appuntamento e si sommano con
+``np.bincount``.
+
+Definizioni:
+- occupazione: minuti confermati o completati in una cella / (60 × numero
+  di quei giorni della settimana nel periodo);
+- mancata presentazione: appuntamento passato rimasto "confermato" (mai
+  segnato come completato), sul totale dei passati non cancellati;
+- cancellazioni: cancellati sul totale degli appuntamenti.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import connections
+from django.db.models import CharField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .disponibilita import APERTURA, CHIUSURA, intervallo_giorni
+from .models import Appuntamento, AppuntamentoArchiviato
+from .riepilogo import STATI_PRENOTATI, STATO_CANCELLATO
+
+GIORNI_SETTIMANA = ['lun', 'mar', 'mer', 'gio', 'ven', 'sab', 'dom']
+ORE_APERTURA = list(range(APERTURA.hour, CHIUSURA.hour + (1 if CHIUSURA.minute else 0)))
+PICCHI = 5
+
+COLONNE = ('barbiere_id', 'data_ora', 'servizio__durata_minuti', 'stato')
+
+
+# ===== LETTURA =====
+def _secondi_utc(valori):
+    """Secondi dall'epoca (UTC) di una colonna di date, come array int64"""
+    if not valori:
+        return np.empty(0, dtype=np.int64)
+    if isinstance(valori[0], str):
+        # SQLite: 'AAAA-MM-GG HH:MM:SS[.ffffff]' in UTC
+        return np.array(valori, dtype='datetime64[s]').astype(np.int64)
+    # Dal cursore senza i convertitori dell'ORM: datetime naive sono in UTC
+    return np.fromiter(
+        (
+            (valore if valore.tzinfo else valore.replace(tzinfo=dt_timezone.utc)).timestamp()
+            for valore in valori
+        ),
+        dtype=np.float64,
+        count=len(valori),
+    ).astype(np.int64)
+
+
+def colonne(queryset):
+    """
+    Colonne NumPy degli appuntamenti di ``queryset``: barbiere, inizio (secondi
+    UTC), durata (minuti) e stato
+    """
+    campi = list(COLONNE)
+    if connections[queryset.db].vendor == 'sqlite':
+        queryset = queryset.annotate(data_ora_testo=Cast('data_ora', CharField()))
+        campi[1] = 'data_ora_testo'
+    sql, parametri = queryset.order_by().values_list(*campi).query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, parametri)
+        righe = cursor.fetchall()
+    barbieri, inizi, durate, stati = zip(*righe) if righe else ((), (), (), ())
+    return {
+        'barbiere': np.array(barbieri, dtype=np.int64),
+        'inizio': _secondi_utc(inizi),
+        'durata': np.array(durate, dtype=np.int32),
+        'stato': np.array(stati, dtype=str),
+    }
+
+
+def unisci(*parti):
+    return {nome: np.concatenate([parte[nome] for parte in parti]) for nome in parti[0]}
+
+
+def carica(dal, al, barbieri=None):
+    """Colonne degli appuntamenti attivi e archiviati dei giorni da ``dal`` ad ``al``"""
+    inizio, fine = intervallo_giorni(dal, al)
+    parti = []
+    for modello in (Appuntamento, AppuntamentoArchiviato):
+        queryset = modello.objects.filter(data_ora__gte=inizio, data_ora__lt=fine)
+        if barbieri:
+            queryset = queryset.filter(barbiere_id__in=barbieri)
+        parti.append(colonne(queryset))
+    return unisci(*parti)
+
+
+# ===== CALCOLI =====
+def secondi_locali(secondi_utc, fuso=None):
+    """Secondi UTC -> secondi nell'ora locale, con lo scostamento giusto per ogni ora (ora legale)"""
+    fuso = fuso or timezone.get_current_timezone()
+    ore, posizioni = np.unique(secondi_utc // 3600, return_inverse=True)
+    scostamenti = np.array(
+        [
+            datetime.fromtimestamp(int(ora) * 3600, dt_timezone.utc).astimezone(fuso).utcoffset().total_seconds()
+            for ora in ore
+        ],
+        dtype=np.int64,
+    )
+    return secondi_utc + scostamenti[posizioni.reshape(-1)]
+
+
+def conta_giorni_settimana(dal, al):
+    """Quante volte compare ogni giorno della settimana (lunedì = 0) da ``dal`` ad ``al``"""
+    giorni = np.arange(np.datetime64(dal), np.datetime64(al + timedelta(days=1)))
+    # 1970-01-01 era un giovedì
+    return np.bincount((giorni.astype(np.int64) + 3) % 7, minlength=7)
+
+
+def minuti_per_cella(giorno, minuto, durata, gruppo, gruppi):
+    """
+    Minuti occupati per (gruppo, giorno della settimana, ora): array
+    gruppi × 7 × 24. Un appuntamento a cavallo di più ore conta in ognuna
+    per i minuti che ci passa (anche oltre la mezzanotte).
+    """
+    totale = np.zeros(gruppi * 7 * 24, dtype=np.int64)
+    if not len(durata):
+        return totale.reshape(gruppi, 7, 24)
+    fine = minuto + durata
+    ora = minuto // 60
+    for passo in range(int(((minuto % 60) + durata).max() + 59) // 60):
+        ora_passo = ora + passo
+        minuti = np.minimum(fine, (ora_passo + 1) * 60) - np.maximum(minuto, ora_passo * 60)
+        validi = minuti > 0
+        cella = ((gruppo * 7 + (giorno + ora_passo // 24) % 7) * 24 + ora_passo % 24)[validi]
+        totale += np.bincount(cella, weights=minuti[validi], minlength=totale.size).astype(np.int64)
+    return totale.reshape(gruppi, 7, 24)
+
+
+def _tasso(parte, totale):
+    return np.divide(parte, totale, out=np.zeros(len(totale)), where=totale > 0)
+
+
+def analizza(dati, dal, al, adesso=None):
+    """
+    Mappe di occupazione e statistiche per barbiere a partire dalle colonne
+    di ``carica``. Restituisce un dizionario pronto per JSON.
+    """
+    adesso = adesso or timezone.now()
+    barbieri, gruppo = np.unique(dati['barbiere'], return_inverse=True)
+    gruppo = gruppo.reshape(-1)
+    gruppi = len(barbieri)
+
+    locali = secondi_locali(dati['inizio'])
+    giorno = (locali // 86400 + 3) % 7
+    minuto = (locali % 86400) // 60
+
+    prenotati = np.isin(dati['stato'], STATI_PRENOTATI)
+    cancellati = dati['stato'] == STATO_CANCELLATO
+    passati = dati['inizio'] < int(adesso.timestamp())
+    assenti = passati & (dati['stato'] == 'confermato')
+
+    minuti = minuti_per_cella(giorno[prenotati], minuto[prenotati], dati['durata'][prenotati], gruppo[prenotati], gruppi)
+    capienza = conta_giorni_settimana(dal, al)[:, None] * 60
+    with np.errstate(divide='ignore', invalid='ignore'):
+        occupazione = np.where(capienza > 0, 100 * minuti / capienza, 0)
+
+    totali = np.bincount(gruppo, minlength=gruppi)
+    n_cancellati = np.bincount(gruppo, weights=cancellati, minlength=gruppi)
+    n_passati = np.bincount(gruppo, weights=passati & ~cancellati, minlength=gruppi)
+    n_assenti = np.bincount(gruppo, weights=assenti, minlength=gruppi)
+    tasso_cancellazioni = _tasso(n_cancellati, totali)
+    tasso_assenze = _tasso(n_assenti, n_passati)
+
+    ore = np.array(ORE_APERTURA)
+    risultato = []
+    for indice, barbiere_id in enumerate(barbieri):
+        mappa = occupazione[indice][:, ore]
+        giorno_punta, ora_punta = np.unravel_index(np.argmax(mappa), mappa.shape)
+        risultato.append({
+            'barbiere_id': int(barbiere_id),
+            'appuntamenti': int(totali[indice]),
+            'minuti_prenotati': int(minuti[indice].sum()),
+            'tasso_cancellazioni': round(float(tasso_cancellazioni[indice]), 4),
+            'tasso_assenze': round(float(tasso_assenze[indice]), 4),
+            'ora_di_punta': {
+                'giorno': GIORNI_SETTIMANA[giorno_punta],
+                'ora': int(ore[ora_punta]),
+                'occupazione': round(float(mappa[giorno_punta, ora_punta]), 1),
+            },
+            'occupazione': np.round(mappa, 1).tolist(),
+        })
+
+    # Ore di punta del negozio: occupazione media delle poltrone per cella
+    negozio = occupazione[:, :, ore].mean(axis=0) if gruppi else np.zeros((7, len(ore)))
+    migliori = np.argsort(negozio, axis=None)[::-1][:PICCHI]
+    picchi = [
+        {'giorno': GIORNI_SETTIMANA[g], 'ora': int(ore[o]), 'occupazione': round(float(negozio[g, o]), 1)}
+        for g, o in zip(*np.unravel_index(migliori, negozio.shape))
+        if negozio[g, o] > 0
+    ]
+    return {
+        'dal': dal.isoformat(),
+        'al': al.isoformat(),
+        'giorni': GIORNI_SETTIMANA,
+        'ore': ORE_APERTURA,
+        'barbieri': risultato,
+        'negozio': {
+            'appuntamenti': int(len(gruppo)),
+            'tasso_cancellazioni': round(float(cancellati.mean()), 4) if len(gruppo) else 0,
+            'tasso_assenze': round(float(assenti.sum() / max(1, (passati & ~cancellati).sum())), 4),
+            'occupazione': np.round(negozio, 1).tolist(),
+            'picchi': picchi,
+        },
+    }
+
+
+def analisi(dal, al, barbieri=None):
+    """Legge e analizza gli appuntamenti dei giorni da ``dal`` ad ``al``"""
+    return analizza(carica(dal, al, barbieri), dal, al)
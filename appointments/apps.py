@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class AppointmentsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "appointments"
+
+    def ready(self):
+        # Registra i segnali (invalidazione delle cache)
+        from . import signals  # noqa: F401
+        # Registra i lavori della coda in background
+        from . import lavori  # noqa: F401
+        from . import strumentazione
+
+        # Misura delle query per la strumentazione e i budget di query
+        strumentazione.installa()
@@ -0,0 +1,126 @@
+"""
+Archivio degli appuntamenti passati.
+
+Le cancellazioni cambiano solo lo stato, quindi la tabella di Appuntamento
+cresce per sempre. ``archivia`` sposta in AppuntamentoArchiviato gli
+appuntamenti completati o cancellati più vecchi di ARCHIVIO_ORIZZONTE_GIORNI,
+``ripristina`` li riporta indietro con lo stesso id. Si lavora a lotti di
+ARCHIVIO_LOTTO righe, ognuno in una transazione breve (copia + DELETE):
+le prenotazioni non restano bloccate per tutta l'operazione.
+
+Gli stati archiviati non occupano la poltrona (vedi STATI_OCCUPANTI in
+disponibilita.py) e il riepilogo giornaliero copre entrambe le tabelle:
+durante uno spostamento (``in_spostamento``) i segnali di eliminazione non
+toccano né le agende in cache né il riepilogo.
+
+Lo storico del cliente e l'admin leggono entrambe le tabelle: gli id sono
+unici tra le due, così un cursore di paginazione vale per tutte e due
+(vedi ``pagina_keyset_unita`` in paginazione.py).
+"""
+import time as cronometro
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+
+from .models import Appuntamento, AppuntamentoArchiviato
+
+STATI_ARCHIVIABILI = ('completato', 'cancellato')
+CAMPI = (
+    'id', 'cliente_id', 'barbiere_id', 'servizio_id', 'data_ora', 'stato', 'note', 'creato_il', 'modificato_il',
+)
+
+# True mentre archivia o ripristina spostano righe tra le due tabelle
+_spostamento = ContextVar('spostamento_archivio', default=False)
+
+
+def in_spostamento():
+    """Le eliminazioni in corso sono spostamenti tra tabella principale e archivio?"""
+    return _spostamento.get()
+
+
+@contextmanager
+def _spostando():
+    token = _spostamento.set(True)
+    try:
+        yield
+    finally:
+        _spostamento.reset(token)
+
+
+def giorni_orizzonte():
+    """Età in giorni oltre la quale un appuntamento concluso è archiviabile"""
+    return getattr(settings, 'ARCHIVIO_ORIZZONTE_GIORNI', 365)
+
+
+def orizzonte(giorni=None):
+    """Gli appuntamenti prima di questo istante sono archiviabili"""
+    if giorni is None:
+        giorni = giorni_orizzonte()
+    return timezone.now() - timedelta(days=giorni)
+
+
+def archiviabili(prima_di=None):
+    return Appuntamento.objects.filter(
+        stato__in=STATI_ARCHIVIABILI, data_ora__lt=prima_di or orizzonte()
+    )
+
+
+def _lotto(queryset, dimensione):
+    return list(queryset.order_by('data_ora', 'id').select_for_update().values(*CAMPI)[:dimensione])
+
+
+def _sposta(queryset, sposta_lotto, dimensione, pausa):
+    dimensione = dimensione or getattr(settings, 'ARCHIVIO_LOTTO', 1000)
+    totale = 0
+    while True:
+        with _spostando(), transaction.atomic(using=router.db_for_write(queryset.model)):
+            righe = _lotto(queryset, dimensione)
+            if righe:
+                sposta_lotto(righe)
+        totale += len(righe)
+        if len(righe) < dimensione:
+            return totale
+        if pausa:
+            # Lascia spazio alle scritture delle richieste tra un lotto e l'altro
+            cronometro.sleep(pausa)
+
+
+def _archivia_lotto(righe):
+    AppuntamentoArchiviato.objects.bulk_create(AppuntamentoArchiviato(**riga) for riga in righe)
+    # delete() pubblico: rispetta on_delete delle relazioni verso Appuntamento
+    # (es. le iscrizioni promosse della lista d'attesa restano senza
+    # collegamento). I segnali post_delete vedono in_spostamento() e non
+    # toccano agende e riepilogo
+    Appuntamento.objects.filter(id__in=[riga['id'] for riga in righe]).delete()
+
+
+def _ripristina_lotto(righe):
+    ripristinati = Appuntamento.objects.bulk_create(Appuntamento(**riga) for riga in righe)
+    # bulk_create applica auto_now e auto_now_add: rimette le date originali
+    for appuntamento, riga in zip(ripristinati, righe):
+        appuntamento.creato_il = riga['creato_il']
+        appuntamento.modificato_il = riga['modificato_il']
+    Appuntamento.objects.bulk_update(ripristinati, ['creato_il', 'modificato_il'])
+    AppuntamentoArchiviato.objects.filter(id__in=[riga['id'] for riga in righe]).delete()
+
+
+def archivia(queryset=None, lotto=None, pausa=0):
+    """
+    Sposta nell'archivio gli appuntamenti di ``queryset`` (default: tutti
+    quelli archiviabili) che sono completati o cancellati. Restituisce il
+    numero di appuntamenti spostati.
+    """
+    if queryset is None:
+        queryset = archiviabili()
+    return _sposta(queryset.filter(stato__in=STATI_ARCHIVIABILI), _archivia_lotto, lotto, pausa)
+
+
+def ripristina(queryset=None, lotto=None, pausa=0):
+    """Riporta nella tabella principale gli appuntamenti archiviati di ``queryset`` (default: tutti)"""
+    if queryset is None:
+        queryset = AppuntamentoArchiviato.objects.all()
+    return _sposta(queryset, _ripristina_lotto, lotto, pausa)
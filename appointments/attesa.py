@@ -0,0 +1,174 @@
+"""
+Lista d'attesa: promozione automatica quando si libera un posto.
+
+Ci sono due tipi di attesa per un barbiere in un giorno:
+- le iscrizioni (RichiestaAttesa): un servizio da iniziare e finire tra
+  ``dalle`` e ``alle``;
+- gli appuntamenti "in_attesa": un orario preciso non ancora confermato.
+
+Quando un posto si libera (cancellazione, vedi prenotazioni.py) si leggono
+solo le attese di quel barbiere e di quel giorno che toccano l'intervallo
+liberato: l'indice parziale attesa_barbiere_giorno_idx per le iscrizioni,
+app_barbiere_data_stato_idx per gli appuntamenti. Il costo dipende da quante
+persone aspettano quel giorno, non dalla lunghezza della lista.
+
+Tra le attese che entrano nell'agenda vince quella che occupa più minuti
+del posto liberato, a parità la più vecchia; si ripete finché qualcuno entra.
+Le iscrizioni partono dal primo orario libero della griglia (o dall'inizio
+esatto del posto liberato) dentro la loro finestra.
+
+``promuovi`` va chiamata nella transazione che libera il posto, dopo il lock
+sul barbiere: la promozione entra o esce insieme alla cancellazione.
+"""
+from datetime import datetime, time
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import coda
+from .disponibilita import (
+    APERTURA, CHIUSURA, MINUTI_GIORNO, carica_agenda, giorno_e_minuto, griglia_slot, intervallo_giorni,
+)
+from .models import Appuntamento, RichiestaAttesa
+
+STATO_IN_ATTESA = 'in_attesa'
+STATO_PROMOSSO = 'confermato'
+NOTA_PROMOZIONE = "Prenotato dalla lista d'attesa"
+
+
+def minuti(ora):
+    return ora.hour * 60 + ora.minute
+
+
+def _ora(minuto):
+    minuto = min(max(minuto, 0), MINUTI_GIORNO - 1)
+    return time(minuto // 60, minuto % 60)
+
+
+def _data_ora(giorno, minuto):
+    data_ora = datetime.combine(giorno, _ora(minuto))
+    return timezone.make_aware(data_ora) if settings.USE_TZ else data_ora
+
+
+class Attesa:
+    """Un candidato alla promozione: iscrizione o appuntamento in attesa"""
+
+    def __init__(self, durata, dal, al, creata_il, richiesta=None, appuntamento=None):
+        self.durata = durata
+        self.dal = dal
+        self.al = al
+        self.creata_il = creata_il
+        self.richiesta = richiesta
+        self.appuntamento = appuntamento
+
+    def inizio(self, agenda, partenze, primo):
+        """
+        Primo minuto tra ``partenze`` (da ``primo`` in poi) in cui il servizio
+        entra nella finestra e nell'agenda; un appuntamento in attesa ha solo il suo
+        """
+        if self.appuntamento is not None:
+            partenze = [self.dal] if self.dal >= primo else []
+        for minuto in partenze:
+            if minuto < self.dal:
+                continue
+            if minuto + self.durata > self.al:
+                return None
+            if agenda.entra(minuto, self.durata):
+                return minuto
+        return None
+
+
+def _attese(barbiere_id, giorno, dal, al):
+    """Iscrizioni e appuntamenti in attesa di un barbiere e di un giorno che toccano [dal, al)"""
+    richieste = (
+        RichiestaAttesa.objects.filter(
+            barbiere_id=barbiere_id, giorno=giorno, promossa_il__isnull=True, dalle__lt=_ora(al), alle__gt=_ora(dal)
+        )
+        .select_related('servizio')
+        .order_by()
+    )
+    attese = [
+        Attesa(
+            richiesta.servizio.durata_minuti, minuti(richiesta.dalle), minuti(richiesta.alle),
+            richiesta.creata_il, richiesta=richiesta,
+        )
+        for richiesta in richieste
+    ]
+    inizio, fine = intervallo_giorni(giorno)
+    appuntamenti = Appuntamento.objects.filter(
+        barbiere_id=barbiere_id,
+        data_ora__gte=inizio,
+        data_ora__lt=min(fine, _data_ora(giorno, al)),
+        stato=STATO_IN_ATTESA,
+    ).select_related('servizio')
+    for appuntamento in appuntamenti:
+        minuto = giorno_e_minuto(appuntamento.data_ora)[1]
+        durata = appuntamento.servizio.durata_minuti
+        if minuto + durata > dal:
+            attese.append(Attesa(durata, minuto, minuto + durata, appuntamento.creato_il, appuntamento=appuntamento))
+    return attese
+
+
+def _promuovi(attesa, giorno, minuto, adesso):
+    if attesa.appuntamento is not None:
+        appuntamento = attesa.appuntamento
+        appuntamento.stato = STATO_PROMOSSO
+        # save(): i segnali aggiornano agende in cache e riepilogo giornaliero
+        appuntamento.save()
+        coda.accoda('conferma_prenotazione', appuntamento_id=appuntamento.pk)
+        return appuntamento
+    richiesta = attesa.richiesta
+    appuntamento = Appuntamento(
+        cliente_id=richiesta.cliente_id,
+        barbiere_id=richiesta.barbiere_id,
+        servizio=richiesta.servizio,
+        data_ora=_data_ora(giorno, minuto),
+        stato=STATO_PROMOSSO,
+        note=NOTA_PROMOZIONE,
+    )
+    appuntamento.save()
+    richiesta.appuntamento, richiesta.promossa_il = appuntamento, adesso
+    richiesta.save(update_fields=['appuntamento', 'promossa_il'])
+    coda.accoda('conferma_prenotazione', appuntamento_id=appuntamento.pk)
+    return appuntamento
+
+
+def promuovi(barbiere_id, giorno, dal=None, al=None):
+    """
+    Promuove le attese che entrano nel posto liberato [``dal``, ``al``)
+    (minuti dalla mezzanotte; default tutto l'orario di apertura) del giorno
+    ``giorno``. Richiede la transazione e il lock sul barbiere del chiamante.
+    Restituisce gli appuntamenti confermati.
+    """
+    dal = minuti(APERTURA) if dal is None else dal
+    al = minuti(CHIUSURA) if al is None else al
+    adesso = timezone.now()
+    oggi, minuto_adesso = giorno_e_minuto(adesso)
+    if giorno < oggi:
+        return []
+    primo = minuto_adesso + 1 if giorno == oggi else 0
+
+    attese = _attese(barbiere_id, giorno, dal, al)
+    if not attese:
+        return []
+    agenda = carica_agenda(barbiere_id, giorno)
+    partenze = [minuto for minuto in sorted({minuti(ora) for ora in griglia_slot()} | {dal}) if minuto >= primo]
+
+    promossi = []
+    while attese:
+        migliore = None
+        for attesa in attese:
+            inizio = attesa.inizio(agenda, partenze, primo)
+            if inizio is None:
+                continue
+            # Più minuti dentro il posto liberato, poi la richiesta più vecchia
+            chiave = (-(min(inizio + attesa.durata, al) - max(inizio, dal)), attesa.creata_il)
+            if migliore is None or chiave < migliore[0]:
+                migliore = (chiave, attesa, inizio)
+        if migliore is None:
+            break
+        _, attesa, inizio = migliore
+        agenda.occupa(inizio, attesa.durata)
+        promossi.append(_promuovi(attesa, giorno, inizio, adesso))
+        attese.remove(attesa)
+    return promossi
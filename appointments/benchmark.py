@@ -0,0 +1,194 @@
+"""
+Suite di benchmark per viste, API e percorsi ORM più usati.
+
+Ogni scenario esegue più volte una richiesta con il client di test di Django
+e registra latenze (p50/p95/p99) e numero di query. I risultati si salvano
+in JSON e si possono confrontare con una baseline: uno scenario che peggiora
+oltre la soglia, o che fa più query, fa fallire il confronto.
+Si usa dal comando ``manage.py benchmark``.
+"""
+import json
+import platform
+import statistics
+import time as cronometro
+from datetime import datetime, time, timedelta
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .disponibilita import DURATA_SLOT
+from .models import Appuntamento, Barbiere, Cliente, Servizio
+
+# Giorni nel futuro usati dalle prenotazioni del benchmark, oltre i dati generati
+GIORNI_PRENOTAZIONI = 400
+
+
+class Scenario:
+    """Una richiesta ripetuta: ``richiesta(n)`` esegue l'iterazione n-esima"""
+
+    def __init__(self, nome, richiesta, stato_atteso=200):
+        self.nome = nome
+        self.richiesta = richiesta
+        self.stato_atteso = stato_atteso
+
+
+def _percentile(valori, p):
+    if len(valori) == 1:
+        return valori[0]
+    return statistics.quantiles(valori, n=100, method='inclusive')[p - 1]
+
+
+def misura(scenario, ripetizioni, riscaldamento=3):
+    """Esegue lo scenario e restituisce latenze in ms e query per richiesta"""
+    cache.clear()
+    for n in range(riscaldamento):
+        scenario.richiesta(-1 - n)
+
+    latenze, query = [], []
+    for n in range(ripetizioni):
+        with CaptureQueriesContext(connection) as contesto:
+            inizio = cronometro.perf_counter()
+            response = scenario.richiesta(n)
+            latenze.append((cronometro.perf_counter() - inizio) * 1000)
+        if response.status_code != scenario.stato_atteso:
+            raise AssertionError(
+                f"{scenario.nome}: status {response.status_code}, atteso {scenario.stato_atteso}"
+            )
+        query.append(len(contesto.captured_queries))
+
+    return {
+        'ripetizioni': ripetizioni,
+        'media_ms': round(statistics.fmean(latenze), 3),
+        'p50_ms': round(_percentile(latenze, 50), 3),
+        'p95_ms': round(_percentile(latenze, 95), 3),
+        'p99_ms': round(_percentile(latenze, 99), 3),
+        'query': max(query),
+    }
+
+
+def scenari():
+    """Scenari sul dataset presente nel database (vedi popola_dati)"""
+    # Il cliente con lo storico più lungo è il caso peggiore per la lista
+    cliente = (
+        Cliente.objects.filter(user__isnull=False)
+        .annotate(n=Count('appuntamenti'))
+        .order_by('-n', 'id')
+        .first()
+    )
+    barbiere = Barbiere.objects.filter(attivo=True).order_by('id').first()
+    barbieri = list(Barbiere.objects.filter(attivo=True).values_list('id', flat=True))
+    servizio = Servizio.objects.order_by('durata_minuti').first()
+    if cliente is None or barbiere is None or servizio is None:
+        raise ValueError("Dataset vuoto: servono clienti con utente, barbieri attivi e servizi")
+
+    staff, _ = User.objects.get_or_create(
+        username='benchmark-admin', defaults={'is_staff': True, 'is_superuser': True}
+    )
+    anonimo, utente, admin = Client(), Client(), Client()
+    utente.force_login(cliente.user)
+    admin.force_login(staff)
+
+    oggi = timezone.localdate()
+    stato_frequente = Appuntamento.objects.filter(cliente=cliente).values_list('stato', flat=True).first()
+
+    def giorno(n):
+        return (oggi + timedelta(days=n % 60)).isoformat()
+
+    def prenota(n):
+        # Ogni iterazione prende uno slot diverso, lontano dai dati generati
+        slot_per_giorno = 18
+        indice = n % (slot_per_giorno * len(barbieri) * 300)
+        barbiere_id = barbieri[indice % len(barbieri)]
+        indice //= len(barbieri)
+        data = oggi + timedelta(days=GIORNI_PRENOTAZIONI + indice // slot_per_giorno)
+        minuti = 9 * 60 + (indice % slot_per_giorno) * DURATA_SLOT
+        data_ora = datetime.combine(data, time(minuti // 60, minuti % 60))
+        return utente.post(reverse('crea_appuntamento'), {
+            'barbiere': barbiere_id,
+            'servizio': servizio.id,
+            'data_ora': data_ora.strftime('%Y-%m-%dT%H:%M'),
+            'stato': 'confermato',
+        })
+
+    return [
+        Scenario('home', lambda n: anonimo.get(reverse('home'))),
+        Scenario('lista_appuntamenti', lambda n: utente.get(reverse('lista_appuntamenti'))),
+        Scenario('lista_appuntamenti_filtri', lambda n: utente.get(reverse('lista_appuntamenti'), {
+            'barbiere': barbiere.id, 'stato': stato_frequente or 'confermato',
+        })),
+        Scenario('lista_appuntamenti_data', lambda n: utente.get(reverse('lista_appuntamenti'), {
+            'data': giorno(n),
+        })),
+        Scenario('crea_appuntamento', prenota, stato_atteso=302),
+        Scenario('api_slot_disponibili', lambda n: utente.get(reverse('api_slot'), {
+            'data': giorno(n), 'barbiere': barbieri[n % len(barbieri)],
+        })),
+        Scenario('api_disponibilita_mese', lambda n: utente.get(reverse('api_disponibilita'), {
+            'dal': giorno(n), 'al': (oggi + timedelta(days=n % 60 + 30)).isoformat(),
+        })),
+        Scenario('admin_changelist', lambda n: admin.get(
+            reverse('admin:appointments_appuntamento_changelist')
+        )),
+    ]
+
+
+def esegui(ripetizioni, filtro=None, log=print):
+    """Esegue tutti gli scenari (o quelli il cui nome contiene ``filtro``)"""
+    risultati = {}
+    for scenario in scenari():
+        if filtro and filtro not in scenario.nome:
+            continue
+        risultati[scenario.nome] = misura(scenario, ripetizioni)
+        r = risultati[scenario.nome]
+        log(f"{scenario.nome:<28} p50 {r['p50_ms']:>8.2f} ms  p95 {r['p95_ms']:>8.2f} ms  "
+            f"p99 {r['p99_ms']:>8.2f} ms  query {r['query']}")
+
+    return {
+        'meta': {
+            'data': timezone.now().isoformat(),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'appuntamenti': Appuntamento.objects.count(),
+            'clienti': Cliente.objects.count(),
+        },
+        'scenari': risultati,
+    }
+
+
+def confronta(risultati, baseline, soglia_percentuale):
+    """
+    Regressioni rispetto alla baseline: p95 peggiorato oltre la soglia
+    o più query per richiesta. Restituisce una lista di messaggi (vuota = ok).
+    """
+    regressioni = []
+    for nome, base in baseline.get('scenari', {}).items():
+        attuale = risultati['scenari'].get(nome)
+        if attuale is None:
+            continue
+        limite = base['p95_ms'] * (1 + soglia_percentuale / 100)
+        if attuale['p95_ms'] > limite:
+            regressioni.append(
+                f"{nome}: p95 {attuale['p95_ms']:.2f} ms > {limite:.2f} ms "
+                f"(baseline {base['p95_ms']:.2f} ms + {soglia_percentuale}%)"
+            )
+        if attuale['query'] > base['query']:
+            regressioni.append(f"{nome}: {attuale['query']} query (baseline {base['query']})")
+    return regressioni
+
+
+def salva(risultati, percorso):
+    with open(percorso, 'w') as f:
+        json.dump(risultati, f, indent=2)
+
+
+def carica(percorso):
+    with open(percorso) as f:
+        return json.load(f)
@@ -0,0 +1,146 @@
+"""
+Cache del catalogo: barbieri attivi, servizi e stati degli appuntamenti.
+
+Il catalogo cambia poche volte l'anno ma è letto da quasi ogni pagina, quindi
+sta in cache (alias CATALOGO_CACHE) sotto una chiave versionata. Ogni
+salvataggio o eliminazione di Barbiere o Servizio incrementa la versione
+(vedi signals.py): le chiavi vecchie non vengono più lette e scadono da sole.
+La stessa versione vale per i frammenti di template e la pagina home in
+cache, che quindi si aggiornano insieme al catalogo.
+"""
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Appuntamento, Barbiere, Servizio
+
+CHIAVE_VERSIONE = 'catalogo:versione'
+
+
+class Catalogo(NamedTuple):
+    barbieri: list
+    servizi: list
+    stati: list
+
+
+def _cache():
+    return caches[getattr(settings, 'CATALOGO_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'CATALOGO_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def _chiave(versione, nome):
+    return f'catalogo:{versione}:{nome}'
+
+
+def _carica():
+    return Catalogo(
+        barbieri=list(Barbiere.objects.filter(attivo=True).order_by('id')),
+        servizi=list(Servizio.objects.order_by('id')),
+        stati=list(Appuntamento.STATI),
+    )
+
+
+async def _acarica():
+    return Catalogo(
+        barbieri=[barbiere async for barbiere in Barbiere.objects.filter(attivo=True).order_by('id')],
+        servizi=[servizio async for servizio in Servizio.objects.order_by('id')],
+        stati=list(Appuntamento.STATI),
+    )
+
+
+def versione():
+    """Versione corrente del catalogo (da usare nelle chiavi di cache derivate)"""
+    return _cache().get(CHIAVE_VERSIONE, 0)
+
+
+async def aversione():
+    return await _cache().aget(CHIAVE_VERSIONE, 0)
+
+
+def catalogo(versione=None):
+    """Barbieri attivi, servizi e stati; ``versione`` evita una lettura se già nota"""
+    cache = _cache()
+    if versione is None:
+        versione = cache.get(CHIAVE_VERSIONE, 0)
+    chiave = _chiave(versione, 'dati')
+    dati = cache.get(chiave)
+    if dati is None:
+        dati = _carica()
+        cache.set(chiave, dati, _timeout())
+    return dati
+
+
+async def acatalogo(versione=None):
+    cache = _cache()
+    if versione is None:
+        versione = await cache.aget(CHIAVE_VERSIONE, 0)
+    chiave = _chiave(versione, 'dati')
+    dati = await cache.aget(chiave)
+    if dati is None:
+        dati = await _acarica()
+        await cache.aset(chiave, dati, _timeout())
+    return dati
+
+
+def _durata(servizi, servizio_id):
+    try:
+        servizio_id = int(servizio_id)
+    except (TypeError, ValueError):
+        raise Servizio.DoesNotExist(servizio_id)
+    for servizio in servizi:
+        if servizio.pk == servizio_id:
+            return servizio.durata_minuti
+    raise Servizio.DoesNotExist(servizio_id)
+
+
+def durata_servizio(servizio_id):
+    """Durata in minuti di un servizio; Servizio.DoesNotExist se non c'è"""
+    return _durata(catalogo().servizi, servizio_id)
+
+
+async def adurata_servizio(servizio_id):
+    return _durata((await acatalogo()).servizi, servizio_id)
+
+
+def nomi(modello):
+    """[(pk, nome)] di tutti i barbieri o servizi, attivi o no (filtri dell'admin)"""
+    cache = _cache()
+    chiave = _chiave(versione(), f'nomi:{modello._meta.model_name}')
+    elenco = cache.get(chiave)
+    if elenco is None:
+        elenco = list(modello.objects.order_by('nome').values_list('pk', 'nome'))
+        cache.set(chiave, elenco, _timeout())
+    return elenco
+
+
+def invalida_catalogo():
+    cache = _cache()
+    cache.add(CHIAVE_VERSIONE, 0, None)
+    try:
+        cache.incr(CHIAVE_VERSIONE)
+    except ValueError:
+        # La chiave è stata rimossa tra add() e incr()
+        cache.set(CHIAVE_VERSIONE, 1, None)
+
+
+# ===== PAGINE IN CACHE =====
+
+def pagina_in_cache(nome, versione):
+    """Contenuto in cache di una pagina legata alla versione del catalogo"""
+    return _cache().get(_chiave(versione, f'pagina:{nome}'))
+
+
+async def apagina_in_cache(nome, versione):
+    return await _cache().aget(_chiave(versione, f'pagina:{nome}'))
+
+
+def salva_pagina_in_cache(nome, versione, contenuto):
+    _cache().set(_chiave(versione, f'pagina:{nome}'), contenuto, _timeout())
+
+
+async def asalva_pagina_in_cache(nome, versione, contenuto):
+    await _cache().aset(_chiave(versione, f'pagina:{nome}'), contenuto, _timeout())
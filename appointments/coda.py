@@ -0,0 +1,264 @@
+"""
+Coda dei lavori in background, sul database: niente broker esterno.
+
+Un lavoro è una riga di ``Lavoro`` con il nome di una funzione registrata con
+``@lavoro`` (vedi lavori.py) e i suoi argomenti JSON. ``accoda`` la inserisce
+nella transazione corrente: il lavoro esiste solo se la prenotazione che lo
+crea va a buon fine, e non si perde se il processo si ferma subito dopo.
+
+I worker (python manage.py lavora) prendono i lavori con un UPDATE
+condizionato che li marca con un segno proprio: due worker non possono
+prendere la stessa riga, su SQLite come su PostgreSQL, senza lock espliciti.
+Un lavoro preso resta invisibile per CODA_VISIBILITA secondi: se il worker
+muore a metà torna disponibile da solo. Se la funzione solleva un'eccezione
+si riprova dopo CODA_ATTESA_BASE secondi, poi il doppio a ogni fallimento
+(fino a CODA_ATTESA_MASSIMA); dopo l'ultimo tentativo il lavoro resta
+"fallito" con il traceback, da rimettere in coda dall'admin.
+
+I lavori periodici (``@lavoro(ogni=...)``) si accodano con una chiave per
+periodo: con più worker accesi parte comunque un'esecuzione per periodo.
+"""
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Lavoro
+
+logger = logging.getLogger(__name__)
+
+IN_CODA = 'in_coda'
+IN_CORSO = 'in_corso'
+COMPLETATO = 'completato'
+FALLITO = 'fallito'
+DA_FARE = (IN_CODA, IN_CORSO)
+
+# nome -> Registrato
+_registro = {}
+
+
+class Registrato:
+    """Funzione registrata come lavoro"""
+
+    def __init__(self, nome, funzione, tentativi=None, ogni=None):
+        self.nome = nome
+        self.funzione = funzione
+        self.tentativi = tentativi
+        self.ogni = ogni
+
+    def __repr__(self):
+        return f'<Registrato {self.nome}>'
+
+
+def lavoro(nome, tentativi=None, ogni=None):
+    """
+    Registra una funzione come lavoro ``nome``. ``tentativi``: al posto di
+    CODA_TENTATIVI; ``ogni``: timedelta per i lavori periodici (senza argomenti).
+    """
+    def decoratore(funzione):
+        if nome in _registro:
+            raise ValueError(f"Lavoro già registrato: {nome!r}")
+        _registro[nome] = Registrato(nome, funzione, tentativi, ogni)
+        return funzione
+    return decoratore
+
+
+def registrati():
+    return dict(_registro)
+
+
+def _nuovo(nome, argomenti, esegui_dal=None, chiave=None):
+    if nome not in _registro:
+        raise ValueError(f"Lavoro non registrato: {nome!r}")
+    return Lavoro(
+        tipo=nome,
+        argomenti=argomenti,
+        disponibile_dal=esegui_dal or timezone.now(),
+        max_tentativi=_registro[nome].tentativi or settings.CODA_TENTATIVI,
+        chiave=chiave,
+    )
+
+
+def accoda(nome, esegui_dal=None, chiave=None, **argomenti):
+    """
+    Accoda il lavoro ``nome`` con ``argomenti`` (serializzabili in JSON), da
+    eseguire da ``esegui_dal`` (default subito). Con ``chiave`` il lavoro si
+    accoda una volta sola: se esiste già non succede niente.
+    """
+    nuovo = _nuovo(nome, argomenti, esegui_dal, chiave)
+    if chiave is None:
+        nuovo.save()
+    else:
+        Lavoro.objects.bulk_create([nuovo], ignore_conflicts=True)
+    return nuovo
+
+
+def accoda_in_blocco(lavori, lotto=500):
+    """
+    Accoda molti lavori (tuple nome, argomenti, esegui_dal, chiave) con
+    INSERT a lotti; quelli con una chiave già presente si saltano
+    """
+    Lavoro.objects.bulk_create(
+        [_nuovo(nome, argomenti, esegui_dal, chiave) for nome, argomenti, esegui_dal, chiave in lavori],
+        batch_size=lotto,
+        ignore_conflicts=True,
+    )
+
+
+# ===== PRELIEVO ED ESECUZIONE =====
+def preleva(quanti, worker=''):
+    """
+    Prende fino a ``quanti`` lavori disponibili e li rende invisibili agli
+    altri worker per CODA_VISIBILITA secondi. Ogni prelievo ha un segno
+    nuovo (``worker`` ne è solo il prefisso, per l'admin).
+    """
+    adesso = timezone.now()
+    segno = f'{worker[:31]}:{uuid.uuid4().hex}' if worker else uuid.uuid4().hex
+    disponibili = Lavoro.objects.filter(stato__in=DA_FARE, disponibile_dal__lte=adesso)
+    ids = list(disponibili.order_by('disponibile_dal', 'id').values_list('id', flat=True)[:quanti])
+    if not ids:
+        return []
+    # La condizione si ricontrolla nell'UPDATE: se un altro worker ha preso
+    # una riga nel frattempo, quella riga qui non cambia
+    disponibili.filter(id__in=ids).update(
+        stato=IN_CORSO,
+        preso_da=segno,
+        tentativi=F('tentativi') + 1,
+        disponibile_dal=adesso + timedelta(seconds=settings.CODA_VISIBILITA),
+    )
+    return list(Lavoro.objects.filter(id__in=ids, preso_da=segno, stato=IN_CORSO).order_by('disponibile_dal', 'id'))
+
+
+def attesa_nuovo_tentativo(tentativi):
+    """Secondi prima del prossimo tentativo: raddoppiano, con un po' di casualità"""
+    attesa = min(settings.CODA_ATTESA_BASE * 2 ** max(tentativi - 1, 0), settings.CODA_ATTESA_MASSIMA)
+    return attesa * random.uniform(0.9, 1.1)
+
+
+def _chiudi(preso, **campi):
+    # Solo se nessun altro l'ha ripreso dopo la scadenza della visibilità
+    return Lavoro.objects.filter(pk=preso.pk, preso_da=preso.preso_da, stato=IN_CORSO).update(**campi)
+
+
+def esegui(preso):
+    """Esegue un lavoro preso con ``preleva`` e ne registra l'esito; True se riuscito"""
+    registrato = _registro.get(preso.tipo)
+    try:
+        if registrato is None:
+            raise LookupError(f"Lavoro non registrato: {preso.tipo!r}")
+        registrato.funzione(**preso.argomenti)
+    except Exception:
+        errore = traceback.format_exc()
+        if preso.tentativi >= preso.max_tentativi or registrato is None:
+            logger.error("Lavoro %s fallito definitivamente:\n%s", preso, errore)
+            _chiudi(preso, stato=FALLITO, errore=errore, completato_il=timezone.now())
+        else:
+            attesa = timedelta(seconds=attesa_nuovo_tentativo(preso.tentativi))
+            logger.warning("Lavoro %s fallito, nuovo tentativo tra %s", preso, attesa)
+            _chiudi(preso, stato=IN_CODA, errore=errore, disponibile_dal=timezone.now() + attesa)
+        return False
+    _chiudi(preso, stato=COMPLETATO, errore='', completato_il=timezone.now())
+    return True
+
+
+def pulisci(giorni=None):
+    """Elimina i lavori completati da più di CODA_CONSERVA_GIORNI giorni; restituisce quanti"""
+    limite = timezone.now() - timedelta(days=settings.CODA_CONSERVA_GIORNI if giorni is None else giorni)
+    eliminati, _ = Lavoro.objects.filter(stato=COMPLETATO, completato_il__lt=limite).delete()
+    return eliminati
+
+
+class Worker:
+    """
+    Ciclo di un worker: prende lavori finché ha thread liberi, li esegue nel
+    pool e quando la coda è vuota aspetta ``intervallo`` secondi
+    """
+
+    def __init__(self, thread=1, intervallo=1.0):
+        self.thread = thread
+        self.intervallo = intervallo
+        self.nome = f'{socket.gethostname()}:{os.getpid()}'
+        self.eseguiti = 0
+        self.falliti = 0
+        self._ferma = threading.Event()
+        self._periodi = {}
+
+    def ferma(self, *args):
+        """Smette di prendere lavori; quelli in corso si finiscono"""
+        self._ferma.set()
+
+    def gestisci_segnali(self):
+        signal.signal(signal.SIGTERM, self.ferma)
+        signal.signal(signal.SIGINT, self.ferma)
+
+    def accoda_periodici(self):
+        """Un'esecuzione per periodo di ogni lavoro periodico (chiave nome:periodo)"""
+        adesso = timezone.now()
+        for registrato in _registro.values():
+            if not registrato.ogni:
+                continue
+            periodo = int(adesso.timestamp() // registrato.ogni.total_seconds())
+            if self._periodi.get(registrato.nome) != periodo:
+                accoda(registrato.nome, chiave=f'{registrato.nome}:{periodo}')
+                self._periodi[registrato.nome] = periodo
+
+    def _esegui(self, preso):
+        try:
+            return esegui(preso)
+        finally:
+            # Ogni thread ha le sue connessioni
+            connections.close_all()
+
+    def _conta(self, futuri):
+        for futuro in futuri:
+            if futuro.result():
+                self.eseguiti += 1
+            else:
+                self.falliti += 1
+
+    def avvia(self, una_volta=False):
+        """
+        Esegue lavori fino a ``ferma()``; con ``una_volta`` si ferma quando
+        la coda non ha più lavori disponibili
+        """
+        in_corso = set()
+        with ThreadPoolExecutor(self.thread, thread_name_prefix='lavoro') as pool:
+            while not self._ferma.is_set():
+                self.accoda_periodici()
+                presi = preleva(self.thread - len(in_corso), self.nome) if len(in_corso) < self.thread else []
+                in_corso |= {pool.submit(self._esegui, preso) for preso in presi}
+                if not in_corso:
+                    if una_volta:
+                        break
+                    self._ferma.wait(self.intervallo)
+                    continue
+                finiti, in_corso = wait(in_corso, timeout=0 if presi else self.intervallo, return_when=FIRST_COMPLETED)
+                self._conta(finiti)
+            self._conta(wait(in_corso).done)
+        connections.close_all()
+        return self.eseguiti, self.falliti
+
+
+def esegui_tutti():
+    """Esegue nel thread corrente i lavori disponibili (test e comandi); restituisce (riusciti, falliti)"""
+    riusciti = falliti = 0
+    while True:
+        presi = preleva(100)
+        if not presi:
+            return riusciti, falliti
+        for preso in presi:
+            if esegui(preso):
+                riusciti += 1
+            else:
+                falliti += 1
@@ -0,0 +1,430 @@
+"""
+Motore di disponibilità dei barbieri.
+
+La giornata di un barbiere è rappresentata come una bitmap di minuti
+(un semplice intero Python): il bit ``m`` è acceso se il minuto ``m``
+dopo la mezzanotte (ora locale del negozio) è occupato da un appuntamento.
+Chiedere "il servizio X entra alle ore T?" diventa così un'unica
+operazione di maschera, qualunque sia il numero di appuntamenti del giorno.
+
+Lo stesso motore è usato dall'API degli slot e dalla validazione di
+``AppuntamentoForm``, così i due non possono dare risposte diverse.
+
+Le bitmap calcolate vengono tenute in cache (barbiere + giorno) e invalidate
+dai segnali in ``signals.py`` quando gli appuntamenti cambiano.
+"""
+import threading
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Appuntamento
+
+# Orario di apertura del negozio e passo della griglia degli slot
+APERTURA = time(9, 0)
+CHIUSURA = time(18, 0)
+DURATA_SLOT = 30
+
+# Solo questi stati occupano davvero la poltrona del barbiere
+STATI_OCCUPANTI = ('confermato',)
+
+MINUTI_GIORNO = 24 * 60
+
+
+def _minuti(ora):
+    """Minuti trascorsi dalla mezzanotte"""
+    return ora.hour * 60 + ora.minute
+
+
+_MINUTO_APERTURA = _minuti(APERTURA)
+_MINUTO_CHIUSURA = _minuti(CHIUSURA)
+
+# Inizio (in minuti) e orario di ogni slot della griglia
+_GRIGLIA = [
+    (inizio, time(inizio // 60, inizio % 60))
+    for inizio in range(_MINUTO_APERTURA, _MINUTO_CHIUSURA, DURATA_SLOT)
+]
+
+
+def _locale(data_ora):
+    """Converte un datetime nell'ora locale del negozio (se ha un fuso)"""
+    if timezone.is_aware(data_ora):
+        return timezone.localtime(data_ora)
+    return data_ora
+
+
+def intervallo_giorni(dal, al=None):
+    """
+    Intervallo semiaperto [inizio, fine) che copre i giorni da ``dal`` ad ``al``
+    compresi nel fuso del negozio. Filtrare con data_ora__gte/__lt invece che
+    con data_ora__date evita il cast per riga e permette di usare gli indici.
+    """
+    inizio = datetime.combine(dal, time.min)
+    fine = datetime.combine((al or dal) + timedelta(days=1), time.min)
+    if settings.USE_TZ:
+        inizio, fine = timezone.make_aware(inizio), timezone.make_aware(fine)
+    return inizio, fine
+
+
+def _maschera(inizio, durata):
+    """Bitmap con accesi i minuti [inizio, inizio + durata)"""
+    return ((1 << durata) - 1) << inizio
+
+
+class AgendaGiornaliera:
+    """Occupazione di un barbiere in una singola giornata"""
+
+    def __init__(self, giorno, occupato=0):
+        self.giorno = giorno
+        self.occupato = occupato
+
+    @classmethod
+    def da_appuntamenti(cls, giorno, appuntamenti):
+        """
+        Costruisce l'agenda da coppie (data_ora, durata_minuti).
+        Gli appuntamenti a cavallo della mezzanotte vengono tagliati sul giorno.
+        """
+        agenda = cls(giorno)
+        for data_ora, durata in appuntamenti:
+            locale = _locale(data_ora)
+            inizio = locale.hour * 60 + locale.minute
+            if locale.date() != giorno:
+                inizio += (locale.date() - giorno).days * MINUTI_GIORNO
+            agenda.occupa(inizio, durata)
+        return agenda
+
+    def occupa(self, inizio, durata):
+        """Segna come occupati i minuti [inizio, inizio + durata)"""
+        fine = min(inizio + durata, MINUTI_GIORNO)
+        inizio = max(inizio, 0)
+        if fine > inizio:
+            self.occupato |= _maschera(inizio, fine - inizio)
+
+    def entra(self, inizio, durata):
+        """True se un servizio di ``durata`` minuti può iniziare al minuto ``inizio``"""
+        if inizio < _MINUTO_APERTURA or inizio + durata > _MINUTO_CHIUSURA:
+            return False
+        return not (self.occupato & _maschera(inizio, durata))
+
+    def slot_liberi(self, durata=DURATA_SLOT):
+        """Orari della griglia in cui un servizio di ``durata`` minuti entra"""
+        maschera = (1 << durata) - 1
+        occupato = self.occupato
+        return [
+            ora for inizio, ora in _GRIGLIA
+            if inizio + durata <= _MINUTO_CHIUSURA and not (occupato >> inizio) & maschera
+        ]
+
+    def bitmap_slot(self, durata=DURATA_SLOT):
+        """
+        Codifica compatta della giornata: un carattere per slot della griglia,
+        '1' se il servizio entra, '0' altrimenti (es. '110011...').
+        """
+        liberi = set(self.slot_liberi(durata))
+        return ''.join('1' if ora in liberi else '0' for _, ora in _GRIGLIA)
+
+
+def _occupanti():
+    """
+    Appuntamenti che occupano la poltrona. L'exclude è ridondante con il
+    filtro sugli stati ma ricalca la condizione dell'indice parziale
+    app_barbiere_attivi_idx, così il planner può usarlo.
+    """
+    return Appuntamento.objects.exclude(stato='cancellato').filter(stato__in=STATI_OCCUPANTI)
+
+
+def carica_agenda(barbiere_id, giorno, escludi_id=None):
+    """Legge dal database l'agenda di un barbiere per un giorno"""
+    inizio, fine = intervallo_giorni(giorno)
+    appuntamenti = _occupanti().filter(
+        barbiere_id=barbiere_id,
+        data_ora__gte=inizio,
+        data_ora__lt=fine,
+    )
+    if escludi_id is not None:
+        appuntamenti = appuntamenti.exclude(pk=escludi_id)
+
+    return AgendaGiornaliera.da_appuntamenti(
+        giorno, appuntamenti.values_list('data_ora', 'servizio__durata_minuti')
+    )
+
+
+def _giorni(dal, al):
+    return [dal + timedelta(days=n) for n in range((al - dal).days + 1)]
+
+
+def _query_agende(barbieri_ids, dal, al, using=None):
+    inizio, fine = intervallo_giorni(dal, al)
+    return _occupanti().using(using).filter(
+        barbiere_id__in=barbieri_ids,
+        data_ora__gte=inizio,
+        data_ora__lt=fine,
+    ).values_list('barbiere_id', 'data_ora', 'servizio__durata_minuti')
+
+
+def _raggruppa(barbieri_ids, dal, al, righe):
+    """Distribuisce le righe (barbiere_id, data_ora, durata) nelle agende giornaliere"""
+    agende = {
+        barbiere_id: {giorno: AgendaGiornaliera(giorno) for giorno in _giorni(dal, al)}
+        for barbiere_id in barbieri_ids
+    }
+    for barbiere_id, data_ora, durata in righe:
+        locale = _locale(data_ora)
+        agenda = agende[barbiere_id].get(locale.date())
+        if agenda is not None:
+            agenda.occupa(_minuti(locale), durata)
+    return agende
+
+
+def carica_agende(barbieri_ids, dal, al, using=None):
+    """
+    Agende di più barbieri per tutti i giorni da ``dal`` ad ``al`` compresi,
+    lette con un'unica query. Restituisce {barbiere_id: {giorno: AgendaGiornaliera}}.
+    """
+    return _raggruppa(barbieri_ids, dal, al, _query_agende(barbieri_ids, dal, al, using))
+
+
+# Intervalli (barbiere, giorni consecutivi) per query: le condizioni in OR
+# restano sotto il limite di profondità delle espressioni di SQLite
+LOTTO_INTERVALLI = 200
+
+
+def _intervalli(coppie):
+    """(barbiere_id, primo giorno, ultimo giorno) per ogni serie di giorni consecutivi di un barbiere"""
+    intervalli = []
+    for barbiere_id, giorno in sorted(coppie):
+        if intervalli and intervalli[-1][0] == barbiere_id and intervalli[-1][2] + timedelta(days=1) == giorno:
+            intervalli[-1][2] = giorno
+        else:
+            intervalli.append([barbiere_id, giorno, giorno])
+    return intervalli
+
+
+def carica_agende_giorni(coppie, using=None):
+    """
+    Agende delle sole coppie (barbiere_id, giorno) di ``coppie``, senza i
+    giorni in mezzo: i giorni consecutivi di un barbiere si leggono come un
+    intervallo, LOTTO_INTERVALLI intervalli per query.
+    Restituisce {barbiere_id: {giorno: AgendaGiornaliera}}.
+    """
+    agende = {}
+    for barbiere_id, giorno in coppie:
+        agende.setdefault(barbiere_id, {})[giorno] = AgendaGiornaliera(giorno)
+    intervalli = _intervalli(coppie)
+    for inizio in range(0, len(intervalli), LOTTO_INTERVALLI):
+        filtro = Q()
+        for barbiere_id, dal, al in intervalli[inizio:inizio + LOTTO_INTERVALLI]:
+            da, a = intervallo_giorni(dal, al)
+            filtro |= Q(barbiere_id=barbiere_id, data_ora__gte=da, data_ora__lt=a)
+        righe = _occupanti().using(using).filter(filtro).values_list('barbiere_id', 'data_ora', 'servizio__durata_minuti')
+        for barbiere_id, data_ora, durata in righe:
+            locale = _locale(data_ora)
+            agenda = agende[barbiere_id].get(locale.date())
+            if agenda is not None:
+                agenda.occupa(_minuti(locale), durata)
+    return agende
+
+
+async def acarica_agende(barbieri_ids, dal, al, using=None):
+    """Versione asincrona di ``carica_agende``"""
+    righe = [riga async for riga in _query_agende(barbieri_ids, dal, al, using)]
+    return _raggruppa(barbieri_ids, dal, al, righe)
+
+
+def griglia_slot():
+    """Orari della griglia, nello stesso ordine dei caratteri di ``bitmap_slot``"""
+    return [ora for _, ora in _GRIGLIA]
+
+
+# ===== CACHE DELLE AGENDE =====
+# Chiave: disponibilita:<barbiere>:<versione>:<giorno>. La versione combina un
+# contatore globale (cambia se cambia la durata di un servizio) e uno per
+# barbiere (cambia se il barbiere viene disattivato): incrementarli rende
+# irraggiungibili in un colpo tutte le chiavi vecchie.
+CHIAVE_GENERAZIONE = 'disponibilita:generazione'
+
+_statistiche = {'hit': 0, 'miss': 0}
+_statistiche_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'DISPONIBILITA_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'DISPONIBILITA_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def _chiave_versione(barbiere_id):
+    return f'disponibilita:{barbiere_id}:versione'
+
+
+def _chiave(barbiere_id, versione, giorno):
+    return f'disponibilita:{barbiere_id}:{versione}:{giorno.isoformat()}'
+
+
+def _versioni(cache, barbieri_ids):
+    """Versione corrente delle chiavi di ogni barbiere, con un solo accesso alla cache"""
+    valori = cache.get_many([CHIAVE_GENERAZIONE, *map(_chiave_versione, barbieri_ids)])
+    return _versioni_da_valori(valori, barbieri_ids)
+
+
+def _versioni_da_valori(valori, barbieri_ids):
+    generazione = valori.get(CHIAVE_GENERAZIONE, 0)
+    return {
+        barbiere_id: f'{generazione}.{valori.get(_chiave_versione(barbiere_id), 0)}'
+        for barbiere_id in barbieri_ids
+    }
+
+
+def _incrementa(cache, chiave):
+    cache.add(chiave, 0, None)
+    try:
+        cache.incr(chiave)
+    except ValueError:
+        # La chiave è stata rimossa tra add() e incr()
+        cache.set(chiave, 1, None)
+
+
+def _conta(hit, miss):
+    with _statistiche_lock:
+        _statistiche['hit'] += hit
+        _statistiche['miss'] += miss
+
+
+def statistiche_cache():
+    """Contatori hit/miss della cache delle agende (per processo)"""
+    with _statistiche_lock:
+        hit, miss = _statistiche['hit'], _statistiche['miss']
+    totale = hit + miss
+    return {'hit': hit, 'miss': miss, 'rapporto_hit': hit / totale if totale else None}
+
+
+def azzera_statistiche_cache():
+    with _statistiche_lock:
+        _statistiche['hit'] = _statistiche['miss'] = 0
+
+
+def agenda_giornaliera(barbiere_id, giorno):
+    """Agenda di un barbiere per un giorno, dalla cache se presente"""
+    return agende([barbiere_id], giorno, giorno)[barbiere_id][giorno]
+
+
+def _chiavi_agende(versioni, dal, al):
+    return {
+        (barbiere_id, giorno): _chiave(barbiere_id, versione, giorno)
+        for barbiere_id, versione in versioni.items()
+        for giorno in _giorni(dal, al)
+    }
+
+
+def _dalla_cache(chiavi, trovate):
+    """Agende trovate in cache e barbieri per cui manca almeno un giorno"""
+    risultato = {barbiere_id: {} for barbiere_id, _ in chiavi}
+    mancanti = set()
+    for (barbiere_id, giorno), chiave in chiavi.items():
+        if chiave in trovate:
+            risultato[barbiere_id][giorno] = AgendaGiornaliera(giorno, trovate[chiave])
+        else:
+            mancanti.add(barbiere_id)
+    _conta(len(trovate), len(chiavi) - len(trovate))
+    return risultato, sorted(mancanti)
+
+
+def _da_salvare(chiavi, lette):
+    return {
+        chiavi[(barbiere_id, giorno)]: agenda.occupato
+        for barbiere_id, giorni_letti in lette.items()
+        for giorno, agenda in giorni_letti.items()
+    }
+
+
+def agende(barbieri_ids, dal, al):
+    """
+    Come ``carica_agende`` ma passando dalla cache: solo i barbieri con almeno
+    un giorno mancante vengono letti dal database (sempre con una sola query).
+    """
+    cache = _cache()
+    chiavi = _chiavi_agende(_versioni(cache, barbieri_ids), dal, al)
+    risultato, mancanti = _dalla_cache(chiavi, cache.get_many(list(chiavi.values())))
+
+    if mancanti:
+        # La cache si riempie dal primario: una replica in ritardo vi
+        # fisserebbe un'agenda vecchia fino alla prossima invalidazione
+        lette = carica_agende(mancanti, dal, al, using=DEFAULT_DB_ALIAS)
+        cache.set_many(_da_salvare(chiavi, lette), _timeout())
+        risultato.update(lette)
+
+    return risultato
+
+
+async def aagende(barbieri_ids, dal, al):
+    """Versione asincrona di ``agende``, per le viste servite via ASGI"""
+    cache = _cache()
+    valori = await cache.aget_many([CHIAVE_GENERAZIONE, *map(_chiave_versione, barbieri_ids)])
+    chiavi = _chiavi_agende(_versioni_da_valori(valori, barbieri_ids), dal, al)
+    risultato, mancanti = _dalla_cache(chiavi, await cache.aget_many(list(chiavi.values())))
+
+    if mancanti:
+        lette = await acarica_agende(mancanti, dal, al, using=DEFAULT_DB_ALIAS)
+        await cache.aset_many(_da_salvare(chiavi, lette), _timeout())
+        risultato.update(lette)
+
+    return risultato
+
+
+def invalida_giorno(barbiere_id, giorno):
+    """Rimuove dalla cache l'agenda di un barbiere per un giorno"""
+    cache = _cache()
+    versione = _versioni(cache, [barbiere_id])[barbiere_id]
+    cache.delete(_chiave(barbiere_id, versione, giorno))
+
+
+def invalida_barbiere(barbiere_id):
+    """Invalida tutte le agende di un barbiere"""
+    _incrementa(_cache(), _chiave_versione(barbiere_id))
+
+
+def invalida_tutto():
+    """Invalida le agende di tutti i barbieri (es. cambia la durata di un servizio)"""
+    _incrementa(_cache(), CHIAVE_GENERAZIONE)
+
+
+def giorno_locale(data_ora):
+    """Giorno (nell'ora locale del negozio) a cui appartiene un datetime"""
+    return _locale(data_ora).date()
+
+
+def giorno_e_minuto(data_ora):
+    """(giorno, minuti dalla mezzanotte) nell'ora locale del negozio"""
+    locale = _locale(data_ora)
+    return locale.date(), _minuti(locale)
+
+
+def slot_liberi(barbiere_id, giorno, durata=DURATA_SLOT):
+    """Orari liberi di un barbiere in un giorno per un servizio di ``durata`` minuti"""
+    return agenda_giornaliera(barbiere_id, giorno).slot_liberi(durata)
+
+
+def dentro_orario(data_ora, durata):
+    """True se il servizio inizia e finisce nell'orario di apertura"""
+    locale = _locale(data_ora)
+    inizio = _minuti(locale)
+    return _MINUTO_APERTURA <= inizio and inizio + durata <= _MINUTO_CHIUSURA
+
+
+def servizio_disponibile(barbiere_id, servizio, data_ora, escludi_id=None):
+    """
+    Il servizio entra all'orario richiesto?
+    ``escludi_id`` permette di ignorare l'appuntamento che si sta modificando.
+    """
+    locale = _locale(data_ora)
+    if escludi_id is None:
+        agenda = agenda_giornaliera(barbiere_id, locale.date())
+    else:
+        agenda = carica_agenda(barbiere_id, locale.date(), escludi_id=escludi_id)
+    return agenda.entra(_minuti(locale), servizio.durata_minuti)
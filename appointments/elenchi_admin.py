@@ -0,0 +1,150 @@
+"""
+Strumenti per changelist dell'admin su tabelle da milioni di righe.
+
+- ``PaginatorStimato``: niente COUNT(*) esatto su tutta la tabella a ogni
+  pagina. Conta esattamente fino ad ADMIN_LIMITE_CONTEGGIO righe; oltre,
+  senza filtri usa la stima delle statistiche del database (``pg_class``
+  su PostgreSQL, ``sqlite_stat1`` su SQLite dopo ANALYZE), con filtri si
+  ferma al limite.
+- ``FiltroBarbiere`` / ``FiltroServizio``: le scelte vengono dalla cache del
+  catalogo (``nomi`` in catalogo.py) invece che da una query a ogni pagina.
+- ``CHANGE_LIST_INDICIZZATA``: template di changelist in cui la barra
+  ``date_hierarchy`` ricava anni, mesi e giorni da MIN/MAX sull'indice di
+  data_ora invece che da un SELECT DISTINCT con conversione di fuso su ogni
+  riga (tag ``{% gerarchia_date %}``). Può proporre periodi senza
+  appuntamenti (es. una domenica): aprendoli la lista è vuota.
+"""
+import copy
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import F, Max, Min
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .catalogo import nomi
+from .models import Barbiere, Servizio
+
+CHANGE_LIST_INDICIZZATA = 'admin/appointments/change_list_indicizzata.html'
+
+
+def stima_righe(modello, using):
+    """Righe della tabella secondo le statistiche del database, o None"""
+    connection = connections[using]
+    tabella = modello._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [tabella])
+            elif connection.vendor == 'sqlite':
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [tabella])
+            else:
+                return None
+            riga = cursor.fetchone()
+    except DatabaseError:
+        # Es. sqlite_stat1 non esiste finché non si lancia ANALYZE
+        return None
+    if not riga or riga[0] is None:
+        return None
+    stima = int(str(riga[0]).split()[0])
+    return stima if stima >= 0 else None
+
+
+class PaginatorStimato(Paginator):
+
+    @cached_property
+    def count(self):
+        limite = getattr(settings, 'ADMIN_LIMITE_CONTEGGIO', 10000)
+        # COUNT su una sottoquery con LIMIT: costa al massimo ``limite`` righe
+        contate = self.object_list.order_by()[:limite + 1].count()
+        if contate <= limite:
+            return contate
+        if not self.object_list.query.where:
+            stima = stima_righe(self.object_list.model, self.object_list.db)
+            if stima:
+                return max(stima, contate)
+        return limite
+
+
+class _FiltroCatalogo(admin.SimpleListFilter):
+    modello = None
+
+    def lookups(self, request, model_admin):
+        return [(str(pk), nome) for pk, nome in nomi(self.modello)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{f'{self.parameter_name}_id': self.value()})
+        return queryset
+
+
+class FiltroBarbiere(_FiltroCatalogo):
+    title = 'barbiere'
+    parameter_name = 'barbiere'
+    modello = Barbiere
+
+
+class FiltroServizio(_FiltroCatalogo):
+    title = 'servizio'
+    parameter_name = 'servizio'
+    modello = Servizio
+
+
+class _QuerysetGerarchia:
+    """
+    Il queryset della changelist per il tag date_hierarchy: MIN e MAX con due
+    query ordinate sull'indice (un unico SELECT MIN(), MAX() su SQLite scorre
+    la tabella) e datetimes() come elenco dei periodi tra i due estremi.
+    """
+
+    def __init__(self, queryset):
+        self._queryset = queryset
+        self._estremi = {}
+
+    def __getattr__(self, nome):
+        return getattr(self._queryset, nome)
+
+    def _estremo(self, campo, massimo):
+        if (campo, massimo) not in self._estremi:
+            ordine = f'-{campo}' if massimo else campo
+            self._estremi[campo, massimo] = self._queryset.order_by(ordine).values_list(campo, flat=True).first()
+        return self._estremi[campo, massimo]
+
+    def aggregate(self, *args, **kwargs):
+        semplici = not args and all(
+            isinstance(aggregato, (Min, Max)) and isinstance(aggregato.source_expressions[0], F)
+            for aggregato in kwargs.values()
+        )
+        if not semplici:
+            return self._queryset.aggregate(*args, **kwargs)
+        return {
+            nome: self._estremo(aggregato.source_expressions[0].name, isinstance(aggregato, Max))
+            for nome, aggregato in kwargs.items()
+        }
+
+    def datetimes(self, campo, tipo, *args, **kwargs):
+        """Anni, mesi o giorni tra il primo e l'ultimo valore di ``campo``"""
+        primo, ultimo = self._estremo(campo, False), self._estremo(campo, True)
+        if primo is None:
+            return []
+        primo, ultimo = timezone.localtime(primo).date(), timezone.localtime(ultimo).date()
+        if tipo == 'year':
+            return [datetime(anno, 1, 1) for anno in range(primo.year, ultimo.year + 1)]
+        if tipo == 'month':
+            mesi = range(primo.year * 12 + primo.month - 1, ultimo.year * 12 + ultimo.month)
+            return [datetime(mese // 12, mese % 12 + 1, 1) for mese in mesi]
+        return [
+            datetime.combine(primo + timedelta(days=n), time.min) for n in range((ultimo - primo).days + 1)
+        ]
+
+    dates = datetimes
+
+
+def changelist_gerarchia(cl):
+    """Copia della changelist da passare al tag date_hierarchy di Django"""
+    copia = copy.copy(cl)
+    copia.queryset = _QuerysetGerarchia(cl.queryset)
+    return copia
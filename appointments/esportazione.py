@@ -0,0 +1,210 @@
+"""
+Esportazione degli appuntamenti in CSV e iCalendar (.ics) in streaming.
+
+Le righe arrivano dal database a blocchi di BLOCCO_RIGHE con
+``.iterator(chunk_size=...)`` e barbiere, cliente e servizio nella stessa
+query; il testo esce a pezzi da circa BLOCCO_BYTE. La memoria usata non
+dipende quindi dal numero di appuntamenti esportati. Sotto ASGI il
+generatore viene consumato a blocchi in un thread, invece che tutto insieme
+come farebbe StreamingHttpResponse con un iteratore sincrono.
+
+Usata dalle viste di esportazione (views.py) e dalle azioni dell'admin.
+"""
+import csv
+import heapq
+from datetime import timedelta, timezone as dt_timezone
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+BLOCCO_RIGHE = 2000
+BLOCCO_BYTE = 64 * 1024
+
+FORMATI = {
+    'csv': 'text/csv; charset=utf-8',
+    'ics': 'text/calendar; charset=utf-8',
+}
+
+INTESTAZIONE_CSV = [
+    'id', 'inizio', 'fine', 'cliente', 'email', 'barbiere', 'servizio', 'durata_minuti', 'prezzo', 'stato', 'note',
+]
+
+STATI_ICS = {
+    'confermato': 'CONFIRMED',
+    'completato': 'CONFIRMED',
+    'cancellato': 'CANCELLED',
+    'in_attesa': 'TENTATIVE',
+}
+
+
+def prepara(queryset):
+    """Solo le colonne esportate, relazioni comprese, in ordine cronologico"""
+    return queryset.select_related('cliente', 'barbiere', 'servizio').only(
+        'data_ora', 'stato', 'note', 'modificato_il',
+        'cliente__nome', 'cliente__email', 'barbiere__nome',
+        'servizio__nome', 'servizio__durata_minuti', 'servizio__prezzo',
+    ).order_by('data_ora', 'id')
+
+
+def appuntamenti(*querysets):
+    """
+    Itera uno o più queryset con id disgiunti (es. attivi e archiviati) in
+    ordine di data, leggendo ognuno a blocchi
+    """
+    iteratori = [prepara(queryset).iterator(chunk_size=BLOCCO_RIGHE) for queryset in querysets]
+    if len(iteratori) == 1:
+        return iteratori[0]
+    return heapq.merge(*iteratori, key=lambda appuntamento: (appuntamento.data_ora, appuntamento.pk))
+
+
+def _fine(appuntamento):
+    return appuntamento.data_ora + timedelta(minutes=appuntamento.servizio.durata_minuti)
+
+
+def _a_blocchi(parti):
+    """Raggruppa pezzi di testo piccoli in blocchi di circa BLOCCO_BYTE"""
+    buffer, lunghezza = [], 0
+    for parte in parti:
+        buffer.append(parte)
+        lunghezza += len(parte)
+        if lunghezza >= BLOCCO_BYTE:
+            yield ''.join(buffer)
+            buffer, lunghezza = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+# ===== CSV =====
+class _Eco:
+    """Pseudo-file per csv.writer: restituisce la riga invece di scriverla"""
+
+    def write(self, valore):
+        return valore
+
+
+def _cella(valore):
+    # Niente formule nei fogli di calcolo: =, +, -, @ iniziali diventano testo
+    valore = '' if valore is None else str(valore)
+    if valore[:1] in ('=', '+', '-', '@', '\t', '\r'):
+        return "'" + valore
+    return valore
+
+
+def righe_csv(appuntamenti):
+    scrittore = csv.writer(_Eco())
+    fuso = timezone.get_current_timezone()
+    # BOM: Excel riconosce l'UTF-8 (nomi accentati)
+    yield '\ufeff' + scrittore.writerow(INTESTAZIONE_CSV)
+    for appuntamento in appuntamenti:
+        yield scrittore.writerow([
+            appuntamento.pk,
+            appuntamento.data_ora.astimezone(fuso).isoformat(timespec='minutes'),
+            _fine(appuntamento).astimezone(fuso).isoformat(timespec='minutes'),
+            _cella(appuntamento.cliente.nome),
+            _cella(appuntamento.cliente.email),
+            _cella(appuntamento.barbiere.nome),
+            _cella(appuntamento.servizio.nome),
+            appuntamento.servizio.durata_minuti,
+            appuntamento.servizio.prezzo,
+            appuntamento.stato,
+            _cella(appuntamento.note),
+        ])
+
+
+# ===== iCalendar (RFC 5545) =====
+def _testo_ics(valore):
+    return (
+        (valore or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def _data_ics(data_ora):
+    return data_ora.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _linea(linea):
+    """Una linea di contenuto, ripiegata a 75 byte come chiede la RFC"""
+    dati = linea.encode()
+    if len(dati) <= 75:
+        return linea + '\r\n'
+    pezzi, inizio, limite = [], 0, 75
+    while inizio < len(dati):
+        fine = min(inizio + limite, len(dati))
+        # Mai a metà di un carattere UTF-8
+        while fine < len(dati) and (dati[fine] & 0xC0) == 0x80:
+            fine -= 1
+        pezzi.append(dati[inizio:fine].decode())
+        inizio, limite = fine, 74
+    return '\r\n '.join(pezzi) + '\r\n'
+
+
+def sommario_cliente(appuntamento):
+    return f'{appuntamento.servizio.nome} - {appuntamento.barbiere.nome}'
+
+
+def sommario_barbiere(appuntamento):
+    return f'{appuntamento.servizio.nome} - {appuntamento.cliente.nome}'
+
+
+def righe_ics(appuntamenti, nome_calendario, dominio, sommario=sommario_cliente):
+    yield ''.join(_linea(linea) for linea in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Barber Shop//Appuntamenti//IT',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        'X-WR-CALNAME:' + _testo_ics(nome_calendario),
+    ))
+    for appuntamento in appuntamenti:
+        linee = [
+            'BEGIN:VEVENT',
+            # Stabile tra un'esportazione e l'altra: il calendario aggiorna invece di duplicare
+            f'UID:appuntamento-{appuntamento.pk}@{dominio}',
+            'DTSTAMP:' + _data_ics(appuntamento.modificato_il),
+            'DTSTART:' + _data_ics(appuntamento.data_ora),
+            'DTEND:' + _data_ics(_fine(appuntamento)),
+            'SUMMARY:' + _testo_ics(sommario(appuntamento)),
+            'STATUS:' + STATI_ICS.get(appuntamento.stato, 'CONFIRMED'),
+        ]
+        if appuntamento.note:
+            linee.append('DESCRIPTION:' + _testo_ics(appuntamento.note))
+        linee.append('END:VEVENT')
+        yield ''.join(_linea(linea) for linea in linee)
+    yield _linea('END:VCALENDAR')
+
+
+# ===== RISPOSTE =====
+async def _consuma_a_blocchi(iteratore, blocchi=16):
+    """Versione asincrona di un iteratore sincrono, letta a gruppi di ``blocchi`` pezzi"""
+    while True:
+        # thread_sensitive: il cursore del database resta sul thread che l'ha aperto
+        parti = await sync_to_async(lambda: list(islice(iteratore, blocchi)), thread_sensitive=True)()
+        if not parti:
+            return
+        for parte in parti:
+            yield parte
+
+
+def risposta(request, formato, righe, nome_file):
+    """StreamingHttpResponse da scaricare come ``<nome_file>.<formato>``"""
+    contenuto = _a_blocchi(righe)
+    if isinstance(request, ASGIRequest):
+        contenuto = _consuma_a_blocchi(contenuto)
+    response = StreamingHttpResponse(contenuto, content_type=FORMATI[formato])
+    response['Content-Disposition'] = f'attachment; filename="{nome_file}.{formato}"'
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+
+def esporta(request, formato, nome_file, *querysets, nome_calendario='Appuntamenti', sommario=sommario_cliente):
+    """Risposta di esportazione di ``querysets`` nel formato 'csv' o 'ics'"""
+    righe = appuntamenti(*querysets)
+    if formato == 'csv':
+        return risposta(request, formato, righe_csv(righe), nome_file)
+    return risposta(
+        request, formato, righe_ics(righe, nome_calendario, request.get_host().split(':')[0], sommario), nome_file
+    )
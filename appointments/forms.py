@@ -1,6 +1,9 @@
 from django import forms
 from django.contrib.auth.models import User
-from .models import Appuntamento, Cliente
+from django.utils import timezone
+from .models import Appuntamento, Cliente, RichiestaAttesa
+from .catalogo import catalogo
+from .disponibilita import APERTURA, CHIUSURA, STATI_OCCUPANTI, dentro_orario, servizio_disponibile
 
 
 class RegistrazioneForm(forms.Form):
@@ -59,6 +62,11 @@ class AppuntamentoForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         # Mostra solo barbieri attivi
         self.fields['barbiere'].queryset = self.fields['barbiere'].queryset.filter(attivo=True)
+        # Opzioni delle select dal catalogo in cache; la validazione usa sempre il queryset
+        dati_catalogo = catalogo()
+        for nome, oggetti in (('barbiere', dati_catalogo.barbieri), ('servizio', dati_catalogo.servizi)):
+            campo = self.fields[nome]
+            campo.choices = [('', campo.empty_label), *((oggetto.pk, str(oggetto)) for oggetto in oggetti)]
         # Se è una creazione, aggiungi stato nascosto con default
         if not self.instance:
             self.fields['stato'] = forms.CharField(
@@ -71,4 +79,61 @@ class AppuntamentoForm(forms.ModelForm):
                 choices=self.instance.STATI,
                 initial=self.instance.stato,
                 widget=forms.Select(attrs={'class': 'form-control'})
-            )
\ No newline at end of file
+            )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        barbiere = cleaned_data.get('barbiere')
+        servizio = cleaned_data.get('servizio')
+        data_ora = cleaned_data.get('data_ora')
+        # Lo stato scelto nel form, non quello salvato: confermare un appuntamento in attesa va controllato
+        stato = cleaned_data.get('stato', self.instance.stato)
+        
+        # Controlla che il servizio entri nell'agenda del barbiere (durata compresa)
+        if barbiere and servizio and data_ora and stato in STATI_OCCUPANTI:
+            if not dentro_orario(data_ora, servizio.durata_minuti):
+                raise forms.ValidationError("Il servizio deve iniziare e finire nell'orario di apertura (9:00 - 18:00).")
+            if not servizio_disponibile(barbiere.pk, servizio, data_ora, escludi_id=self.instance.pk):
+                raise forms.ValidationError("Il barbiere è già occupato in questo orario per la durata del servizio scelto.")
+        
+        return cleaned_data
+
+
+class RichiestaAttesaForm(forms.ModelForm):
+    """Iscrizione alla lista d'attesa per un barbiere, un servizio e una fascia oraria"""
+    class Meta:
+        model = RichiestaAttesa
+        fields = ['barbiere', 'servizio', 'giorno', 'dalle', 'alle']
+        widgets = {
+            'barbiere': forms.Select(attrs={'class': 'form-control'}),
+            'servizio': forms.Select(attrs={'class': 'form-control'}),
+            'giorno': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}, format='%Y-%m-%d'),
+            'dalle': forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}, format='%H:%M'),
+            'alle': forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}, format='%H:%M'),
+        }
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['barbiere'].queryset = self.fields['barbiere'].queryset.filter(attivo=True)
+        dati_catalogo = catalogo()
+        for nome, oggetti in (('barbiere', dati_catalogo.barbieri), ('servizio', dati_catalogo.servizi)):
+            campo = self.fields[nome]
+            campo.choices = [('', campo.empty_label), *((oggetto.pk, str(oggetto)) for oggetto in oggetti)]
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        servizio = cleaned_data.get('servizio')
+        giorno = cleaned_data.get('giorno')
+        dalle = cleaned_data.get('dalle')
+        alle = cleaned_data.get('alle')
+        
+        if giorno and giorno < timezone.localdate():
+            raise forms.ValidationError("Scegli un giorno a partire da oggi.")
+        if dalle and alle:
+            if not (APERTURA <= dalle < alle <= CHIUSURA):
+                raise forms.ValidationError("La fascia oraria deve essere nell'orario di apertura (9:00 - 18:00).")
+            minuti = (alle.hour * 60 + alle.minute) - (dalle.hour * 60 + dalle.minute)
+            if servizio and minuti < servizio.durata_minuti:
+                raise forms.ValidationError("La fascia oraria è più corta del servizio scelto.")
+        
+        return cleaned_data
@@ -0,0 +1,143 @@
+"""
+Foto dei barbieri: salvataggio deduplicato e varianti ridimensionate.
+
+``StorageFoto`` dà a ogni upload il nome dell'hash del suo contenuto, così
+due upload identici finiscono nello stesso file invece di accumulare copie
+(es. ``Salvone_il_barbiere_818u8Ly.png``). Da ogni foto si generano varianti
+WebP e JPEG a più larghezze in ``<cartella>/varianti/``, con il nome
+``<nome foto>-<larghezza>.<formato>``; la generazione è un lavoro della
+coda in background (lavori.py), mai nella richiesta. Il tag ``{% foto_responsive %}``
+(templatetags/immagini.py) usa le varianti presenti per il ``srcset``.
+"""
+import hashlib
+import os
+import posixpath
+import re
+from io import BytesIO
+
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from PIL import Image, ImageOps
+
+# Larghezze delle varianti in pixel; le foto non vengono mai ingrandite
+LARGHEZZE = (160, 320, 480, 640)
+# Formato -> (formato Pillow, opzioni di salvataggio)
+FORMATI = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+CARTELLA_VARIANTI = 'varianti'
+# Caratteri esadecimali dell'hash usati nel nome del file
+LUNGHEZZA_IMPRONTA = 20
+
+
+def impronta(contenuto):
+    """SHA-256 del contenuto di un File, letto a blocchi"""
+    sha = hashlib.sha256()
+    for blocco in contenuto.chunks():
+        sha.update(blocco)
+    return sha.hexdigest()[:LUNGHEZZA_IMPRONTA]
+
+
+@deconstructible
+class StorageFoto(FileSystemStorage):
+    """FileSystemStorage con nomi basati sul contenuto e senza duplicati"""
+
+    def save(self, name, content, max_length=None):
+        if content is None:
+            return super().save(name, content, max_length)
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        cartella, nome = posixpath.split(name.replace('\\', '/'))
+        estensione = os.path.splitext(nome)[1].lower()
+        name = posixpath.join(cartella, impronta(content) + estensione)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def salva_variante(self, name, content):
+        """Salva senza rinominare (le varianti hanno già un nome derivato)"""
+        return super().save(name, content)
+
+
+def _cartella_varianti(nome_foto):
+    return posixpath.join(posixpath.dirname(nome_foto), CARTELLA_VARIANTI)
+
+
+def _radice(nome_foto):
+    return os.path.splitext(posixpath.basename(nome_foto))[0]
+
+
+def e_gia_deduplicata(nome_foto):
+    """True se il nome della foto è già l'impronta del contenuto (salvata da StorageFoto)"""
+    return re.fullmatch(r'[0-9a-f]{%d}' % LUNGHEZZA_IMPRONTA, _radice(nome_foto)) is not None
+
+
+def nome_variante(nome_foto, larghezza, formato):
+    return posixpath.join(_cartella_varianti(nome_foto), f'{_radice(nome_foto)}-{larghezza}.{formato}')
+
+
+def larghezze_varianti(larghezza_originale):
+    """Larghezze da generare: quelle minori dell'originale più l'originale stessa"""
+    larghezze = [larghezza for larghezza in LARGHEZZE if larghezza < larghezza_originale]
+    if larghezza_originale <= LARGHEZZE[-1]:
+        larghezze.append(larghezza_originale)
+    return larghezze
+
+
+def _codifica(immagine, formato):
+    formato_pil, opzioni = FORMATI[formato]
+    if formato_pil == 'JPEG' and immagine.mode != 'RGB':
+        # Il JPEG non ha trasparenza: sfondo bianco
+        sfondo = Image.new('RGB', immagine.size, (255, 255, 255))
+        rgba = immagine.convert('RGBA')
+        sfondo.paste(rgba, mask=rgba.getchannel('A'))
+        immagine = sfondo
+    buffer = BytesIO()
+    immagine.save(buffer, formato_pil, **opzioni)
+    return ContentFile(buffer.getvalue())
+
+
+def genera_varianti(nome_foto, storage):
+    """Crea le varianti mancanti di una foto; restituisce i nomi creati"""
+    with storage.open(nome_foto, 'rb') as f:
+        originale = ImageOps.exif_transpose(Image.open(f))
+        originale.load()
+
+    create = []
+    for larghezza in larghezze_varianti(originale.width):
+        nomi = {formato: nome_variante(nome_foto, larghezza, formato) for formato in FORMATI}
+        mancanti = [formato for formato, nome in nomi.items() if not storage.exists(nome)]
+        if not mancanti:
+            continue
+        altezza = max(1, round(originale.height * larghezza / originale.width))
+        ridotta = originale if larghezza == originale.width else originale.resize(
+            (larghezza, altezza), Image.Resampling.LANCZOS
+        )
+        for formato in mancanti:
+            create.append(storage.salva_variante(nomi[formato], _codifica(ridotta, formato)))
+    return create
+
+
+def varianti_disponibili(nome_foto, storage):
+    """{formato: [(larghezza, nome), ...]} delle varianti già generate, per larghezza"""
+    varianti = {formato: [] for formato in FORMATI}
+    prefisso = _radice(nome_foto) + '-'
+    try:
+        _, file = storage.listdir(_cartella_varianti(nome_foto))
+    except FileNotFoundError:
+        return varianti
+    for nome in file:
+        radice, estensione = os.path.splitext(nome)
+        formato = estensione[1:]
+        if not radice.startswith(prefisso) or formato not in varianti:
+            continue
+        try:
+            larghezza = int(radice[len(prefisso):])
+        except ValueError:
+            continue
+        varianti[formato].append((larghezza, posixpath.join(_cartella_varianti(nome_foto), nome)))
+    for elenco in varianti.values():
+        elenco.sort()
+    return varianti
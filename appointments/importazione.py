@@ -0,0 +1,275 @@
+"""
+Importazione in blocco di clienti (con il loro utente) da CSV o JSON.
+
+Il file si legge in streaming: CSV con intestazione, JSON Lines (un oggetto
+per riga) o un array JSON, decodificato un oggetto alla volta. Colonne:
+``nome``, ``email``, ``telefono`` e, facoltativa, ``password`` (senza, l'utente
+riceve una password inutilizzabile e dovrà reimpostarla).
+
+Ogni riga passa le regole di RegistrazioneForm più il validatore di
+``Cliente.telefono``; le email già registrate o ripetute nel file si
+controllano con una query per lotto. Gli hash PBKDF2, la parte costosa, si
+calcolano in un pool di processi mentre il lotto precedente viene scritto
+con bulk_create di User e Cliente nella stessa transazione.
+
+Le righe scartate non fermano l'importazione: finiscono in
+``EsitoImportazione.scarti`` con il numero di riga e il motivo.
+"""
+import csv
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django import forms
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from .forms import RegistrazioneForm
+from .models import Cliente
+
+COLONNE = ('nome', 'email', 'telefono', 'password')
+FORMATI = ('csv', 'json', 'jsonl')
+BLOCCO_JSON = 64 * 1024
+
+
+class Scarto:
+    """Riga non importata"""
+
+    def __init__(self, riga, email, motivo):
+        self.riga = riga
+        self.email = email
+        self.motivo = motivo
+
+    def __repr__(self):
+        return f'<Scarto riga {self.riga}: {self.motivo}>'
+
+
+class EsitoImportazione:
+
+    def __init__(self):
+        self.importati = 0
+        self.scarti = []
+
+    def __repr__(self):
+        return f'<EsitoImportazione importati={self.importati} scarti={len(self.scarti)}>'
+
+
+def formato_da_nome(nome_file):
+    """'csv', 'json' o 'jsonl' dall'estensione del file, o None"""
+    estensione = os.path.splitext(nome_file)[1].lower().lstrip('.')
+    return 'jsonl' if estensione == 'ndjson' else estensione if estensione in FORMATI else None
+
+
+# ===== LETTURA =====
+def _oggetti_array_json(testo):
+    """Gli elementi di un array JSON, decodificati uno alla volta da un file di testo"""
+    decoder = json.JSONDecoder()
+    buffer = testo.read(BLOCCO_JSON).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("Il file JSON deve contenere un array di oggetti")
+    posizione = 1
+    while True:
+        # Spazi e virgole tra gli elementi, anche a cavallo di due blocchi
+        while True:
+            while posizione < len(buffer) and buffer[posizione] in ' \t\r\n,':
+                posizione += 1
+            if posizione < len(buffer):
+                break
+            buffer, posizione = testo.read(BLOCCO_JSON), 0
+            if not buffer:
+                raise ValueError("JSON incompleto: manca la ']' finale")
+        if buffer[posizione] == ']':
+            return
+        try:
+            oggetto, posizione = decoder.raw_decode(buffer, posizione)
+        except json.JSONDecodeError:
+            # Elemento a cavallo della fine del blocco: si legge il successivo
+            blocco = testo.read(BLOCCO_JSON)
+            if not blocco:
+                raise ValueError("JSON non valido")
+            buffer, posizione = buffer[posizione:] + blocco, 0
+            continue
+        yield oggetto
+
+
+def _oggetti_json_lines(testo):
+    for numero, linea in enumerate(testo, start=1):
+        if not linea.strip():
+            continue
+        try:
+            yield numero, json.loads(linea)
+        except ValueError:
+            # Diventa uno scarto, come ogni riga che non è un oggetto
+            yield numero, None
+
+
+def righe(testo, formato):
+    """(numero di riga, dizionario) per ogni cliente del file di testo ``testo``"""
+    if formato == 'csv':
+        lettore = csv.DictReader(testo)
+        # Numero di riga del file, intestazione compresa
+        return ((lettore.line_num, riga) for riga in lettore)
+    if formato == 'jsonl':
+        return _oggetti_json_lines(testo)
+    return enumerate(_oggetti_array_json(testo), start=1)
+
+
+def apri_testo(file_binario):
+    """Vista di testo UTF-8 (con o senza BOM) di un file binario, senza leggerlo tutto"""
+    return io.TextIOWrapper(file_binario, encoding='utf-8-sig', newline='')
+
+
+# ===== VALIDAZIONE =====
+class ImportazioneClienteForm(RegistrazioneForm):
+    """
+    Le regole di RegistrazioneForm e del modello per una riga importata.
+    La password è facoltativa; le email già registrate si controllano a lotti.
+    """
+
+    def __init__(self, riga):
+        password = riga.get('password') or ''
+        super().__init__({
+            'nome': riga.get('nome') or '',
+            'email': (riga.get('email') or '').strip(),
+            'telefono': (riga.get('telefono') or '').strip(),
+            'password': password,
+            'conferma_password': password,
+        })
+        self.fields['telefono'].validators += Cliente._meta.get_field('telefono').validators
+        self.fields['password'].required = self.fields['conferma_password'].required = False
+
+    def clean_email(self):
+        return self.cleaned_data.get('email')
+
+    def motivo(self):
+        return '; '.join(
+            f'{campo}: {" ".join(errori)}' if campo != '__all__' else ' '.join(errori)
+            for campo, errori in self.errors.items()
+        )
+
+
+def _valida(lotto, esito, viste):
+    """Righe valide del lotto (riga, dati puliti); le altre vanno negli scarti"""
+    valide = []
+    for numero, riga in lotto:
+        if not isinstance(riga, dict):
+            esito.scarti.append(Scarto(numero, '', "la riga non è un oggetto JSON valido"))
+            continue
+        form = ImportazioneClienteForm(riga)
+        if not form.is_valid():
+            esito.scarti.append(Scarto(numero, riga.get('email') or '', form.motivo()))
+            continue
+        email = form.cleaned_data['email']
+        if email in viste:
+            esito.scarti.append(Scarto(numero, email, "email ripetuta nel file"))
+            continue
+        viste.add(email)
+        valide.append((numero, form.cleaned_data))
+
+    if not valide:
+        return valide
+    email = [dati['email'] for _, dati in valide]
+    registrate = set(User.objects.filter(username__in=email).values_list('username', flat=True))
+    registrate.update(Cliente.objects.filter(email__in=email).values_list('email', flat=True))
+    if registrate:
+        for numero, dati in valide:
+            if dati['email'] in registrate:
+                esito.scarti.append(Scarto(numero, dati['email'], "email già registrata"))
+        valide = [(numero, dati) for numero, dati in valide if dati['email'] not in registrate]
+    return valide
+
+
+class ImportaClientiForm(forms.Form):
+    """Upload dell'admin (ClienteAdmin, "Importa clienti")"""
+    file = forms.FileField(help_text=f"CSV, JSON o JSON Lines con le colonne {', '.join(COLONNE)} (password facoltativa)")
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if not formato_da_nome(file.name):
+            raise forms.ValidationError("Formato non supportato: usa .csv, .json o .jsonl")
+        return file
+
+
+# ===== SCRITTURA =====
+def _hash(password):
+    return make_password(password or None)
+
+
+def _avvia_processo():
+    # Con il metodo "spawn" (macOS, Windows) il processo figlio parte senza Django configurato
+    if not apps.ready:
+        django.setup()
+
+
+def _utente(dati, hash_password):
+    return User(username=dati['email'], email=dati['email'], password=hash_password)
+
+
+def _cliente(dati, utente):
+    return Cliente(user=utente, nome=dati['nome'], email=dati['email'], telefono=dati['telefono'])
+
+
+def _scrivi(valide, hash_lotto, esito):
+    """Un lotto di User + Cliente in una transazione; se fallisce, riga per riga"""
+    hash_lotto = list(hash_lotto)
+    try:
+        with transaction.atomic():
+            utenti = User.objects.bulk_create([
+                _utente(dati, hash_password) for (_, dati), hash_password in zip(valide, hash_lotto)
+            ])
+            Cliente.objects.bulk_create([_cliente(dati, utente) for (_, dati), utente in zip(valide, utenti)])
+        esito.importati += len(valide)
+        return
+    except IntegrityError:
+        # Es. la stessa email registrata da qualcun altro dopo il controllo del lotto
+        pass
+    for (numero, dati), hash_password in zip(valide, hash_lotto):
+        try:
+            with transaction.atomic():
+                utente = _utente(dati, hash_password)
+                utente.save()
+                _cliente(dati, utente).save()
+            esito.importati += 1
+        except IntegrityError:
+            esito.scarti.append(Scarto(numero, dati['email'], "email già registrata"))
+
+
+def importa_clienti(sorgente, lotto=None, processi=None):
+    """
+    Importa le righe di ``sorgente`` (vedi ``righe()``) a lotti di
+    IMPORTAZIONE_LOTTO. ``processi``: processi per gli hash (default
+    IMPORTAZIONE_PROCESSI, o tutti i core); con 1 si calcolano qui.
+    """
+    lotto = lotto or settings.IMPORTAZIONE_LOTTO
+    processi = processi or settings.IMPORTAZIONE_PROCESSI or os.cpu_count() or 1
+    esito, viste = EsitoImportazione(), set()
+    sorgente = iter(sorgente)
+    pool = ProcessPoolExecutor(processi, initializer=_avvia_processo) if processi > 1 else None
+    in_corso = None
+    try:
+        while True:
+            corrente = list(islice(sorgente, lotto))
+            valide = _valida(corrente, esito, viste)
+            passwords = [dati['password'] for _, dati in valide]
+            if pool:
+                # map() invia subito il lavoro: gli hash di questo lotto si
+                # calcolano mentre si scrive il precedente
+                hash_lotto = pool.map(_hash, passwords, chunksize=max(1, len(passwords) // (processi * 4)))
+            else:
+                hash_lotto = map(_hash, passwords)
+            if in_corso:
+                _scrivi(*in_corso, esito)
+            in_corso = (valide, hash_lotto) if valide else None
+            if not corrente:
+                break
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+    esito.scarti.sort(key=lambda scarto: scarto.riga)
+    return esito
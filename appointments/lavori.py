@@ -0,0 +1,46 @@
+"""
+Lavori in background registrati nella coda (vedi coda.py). Importato da
+AppointmentsConfig.ready(), così web e worker conoscono gli stessi lavori.
+"""
+from datetime import date, timedelta
+
+from . import coda, promemoria, riepilogo
+from .catalogo import invalida_catalogo
+from .immagini import genera_varianti
+from .models import Barbiere
+
+
+@coda.lavoro('conferma_prenotazione')
+def conferma_prenotazione(appuntamento_id):
+    promemoria.invia_conferma(appuntamento_id)
+
+
+@coda.lavoro('invia_promemoria')
+def invia_promemoria(appuntamento_id, data_ora):
+    promemoria.invia_promemoria(appuntamento_id, data_ora)
+
+
+@coda.lavoro('pianifica_promemoria', tentativi=1, ogni=promemoria.PERIODO)
+def pianifica_promemoria():
+    # Un giro fallito non si ripete: ci pensa quello del periodo successivo
+    promemoria.pianifica()
+
+
+@coda.lavoro('varianti_foto')
+def varianti_foto(nome_foto):
+    storage = Barbiere._meta.get_field('foto').storage
+    if not storage.exists(nome_foto):
+        return
+    if genera_varianti(nome_foto, storage):
+        # Le pagine in cache puntano ancora alla foto originale
+        invalida_catalogo()
+
+
+@coda.lavoro('ricostruisci_riepilogo')
+def ricostruisci_riepilogo(servizio_id, dal):
+    riepilogo.ricostruisci(dal=date.fromisoformat(dal), servizi=[servizio_id])
+
+
+@coda.lavoro('pulisci_coda', tentativi=1, ogni=timedelta(days=1))
+def pulisci_coda():
+    coda.pulisci()
@@ -0,0 +1,74 @@
+"""
+Occupazione delle poltrone per giorno della settimana e ora, tassi di
+cancellazione e di mancata presentazione, ore di punta
+(vedi appointments/analitica.py).
+
+    python manage.py analitica [--dal 2025-01-01] [--al 2025-06-30] [--barbiere 3] [--json]
+"""
+import json
+import time as cronometro
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from appointments.analitica import analisi
+from appointments.catalogo import nomi
+from appointments.models import Barbiere
+
+GIORNI = 90
+
+
+def _data(valore):
+    try:
+        return datetime.strptime(valore, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Data non valida: {valore!r} (formato AAAA-MM-GG)")
+
+
+class Command(BaseCommand):
+    help = "Mappe di occupazione e statistiche degli appuntamenti per barbiere"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dal', type=_data, help=f"primo giorno (default: {GIORNI} giorni prima di --al)")
+        parser.add_argument('--al', type=_data, help="ultimo giorno compreso (default: oggi)")
+        parser.add_argument('--barbiere', type=int, action='append', help="solo questo barbiere (ripetibile)")
+        parser.add_argument('--json', action='store_true', help="stampa il risultato completo in JSON")
+
+    def handle(self, *args, **options):
+        al = options['al'] or timezone.localdate()
+        dal = options['dal'] or al - timedelta(days=GIORNI - 1)
+        if dal > al:
+            raise CommandError("--dal è dopo --al")
+
+        inizio = cronometro.perf_counter()
+        risultato = analisi(dal, al, options['barbiere'])
+        durata = cronometro.perf_counter() - inizio
+        if options['json']:
+            self.stdout.write(json.dumps(risultato, indent=2))
+            return
+
+        nomi_barbieri = dict(nomi(Barbiere))
+        ore = risultato['ore']
+        negozio = risultato['negozio']
+        self.stdout.write(
+            f"Dal {dal} al {al}: {negozio['appuntamenti']} appuntamenti, "
+            f"cancellati {negozio['tasso_cancellazioni']:.1%}, assenze {negozio['tasso_assenze']:.1%} "
+            f"({durata:.2f}s)"
+        )
+        for riga in risultato['barbieri']:
+            punta = riga['ora_di_punta']
+            self.stdout.write('')
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{nomi_barbieri.get(riga['barbiere_id'], riga['barbiere_id'])}: {riga['appuntamenti']} appuntamenti, "
+                f"cancellati {riga['tasso_cancellazioni']:.1%}, assenze {riga['tasso_assenze']:.1%}, "
+                f"punta {punta['giorno']} {punta['ora']}:00 ({punta['occupazione']}%)"
+            ))
+            self.stdout.write('     ' + ''.join(f'{ora:>6}' for ora in ore))
+            for giorno, valori in zip(risultato['giorni'], riga['occupazione']):
+                self.stdout.write(f'{giorno:<5}' + ''.join(f'{valore:>6.0f}' for valore in valori))
+        if negozio['picchi']:
+            self.stdout.write('')
+            self.stdout.write("Ore di punta: " + ', '.join(
+                f"{picco['giorno']} {picco['ora']}:00 ({picco['occupazione']}%)" for picco in negozio['picchi']
+            ))
@@ -0,0 +1,58 @@
+"""
+Sposta nell'archivio gli appuntamenti passati (vedi appointments/archivio.py).
+
+    python manage.py archivia_appuntamenti [--giorni 365] [--lotto 1000] [--pausa 0.1] [--dry-run]
+    python manage.py archivia_appuntamenti --ripristina [--cliente ID] [--dal 2024-01-01] [--al 2024-12-31]
+
+Con --ripristina gli appuntamenti archiviati che corrispondono ai filtri
+tornano nella tabella principale.
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.archivio import archiviabili, archivia, orizzonte, ripristina
+from appointments.disponibilita import intervallo_giorni
+from appointments.models import AppuntamentoArchiviato
+
+
+def _data(valore):
+    try:
+        return datetime.strptime(valore, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Data non valida: {valore!r} (formato AAAA-MM-GG)")
+
+
+class Command(BaseCommand):
+    help = "Archivia gli appuntamenti completati e cancellati più vecchi dell'orizzonte, o li ripristina"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--giorni', type=int, help="orizzonte in giorni (default ARCHIVIO_ORIZZONTE_GIORNI)")
+        parser.add_argument('--lotto', type=int, help="righe per transazione (default ARCHIVIO_LOTTO)")
+        parser.add_argument('--pausa', type=float, default=0, help="secondi di pausa tra un lotto e l'altro")
+        parser.add_argument('--dry-run', action='store_true', help="conta soltanto")
+        parser.add_argument('--ripristina', action='store_true')
+        parser.add_argument('--cliente', type=int)
+        parser.add_argument('--dal', type=_data)
+        parser.add_argument('--al', type=_data)
+
+    def handle(self, *args, **options):
+        if options['ripristina']:
+            queryset = AppuntamentoArchiviato.objects.all()
+            if options['cliente']:
+                queryset = queryset.filter(cliente_id=options['cliente'])
+            if options['dal']:
+                queryset = queryset.filter(data_ora__gte=intervallo_giorni(options['dal'])[0])
+            if options['al']:
+                queryset = queryset.filter(data_ora__lt=intervallo_giorni(options['al'])[1])
+            azione, verbo = ripristina, "ripristinati"
+        else:
+            queryset = archiviabili(orizzonte(options['giorni']))
+            azione, verbo = archivia, "archiviati"
+
+        if options['dry_run']:
+            self.stdout.write(f"Appuntamenti da spostare: {queryset.count()}")
+            return
+
+        spostati = azione(queryset, lotto=options['lotto'], pausa=options['pausa'])
+        self.stdout.write(self.style.SUCCESS(f"Appuntamenti {verbo}: {spostati}"))
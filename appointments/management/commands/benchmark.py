@@ -0,0 +1,70 @@
+"""
+Benchmark di viste, API e admin su un database di test popolato.
+
+    python manage.py benchmark --appuntamenti 50000 --output bench.json
+    python manage.py benchmark --baseline bench.json --soglia 20
+
+Crea il database di test (come ``manage.py test``), lo riempie con
+popola_dati e misura ogni scenario di appointments.benchmark. Con
+--baseline esce con errore se uno scenario è peggiorato oltre la soglia.
+"""
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from appointments import benchmark
+from appointments.models import Appuntamento
+
+
+class Command(BaseCommand):
+    help = "Misura latenze e query degli scenari principali su un dataset generato"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clienti', type=int, default=500)
+        parser.add_argument('--barbieri', type=int, default=6)
+        parser.add_argument('--appuntamenti', type=int, default=20000)
+        parser.add_argument('--anni', type=float, default=2)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--ripetizioni', type=int, default=50)
+        parser.add_argument('--scenario', help="esegue solo gli scenari il cui nome contiene questo testo")
+        parser.add_argument('--output', help="file JSON in cui salvare i risultati")
+        parser.add_argument('--baseline', help="file JSON di un'esecuzione precedente da confrontare")
+        parser.add_argument('--soglia', type=float, default=20, help="peggioramento massimo del p95, in %%")
+        parser.add_argument('--riusa-db', action='store_true', help="non ricrea il database di test se esiste già")
+
+    def handle(self, *args, **options):
+        baseline = benchmark.carica(options['baseline']) if options['baseline'] else None
+
+        setup_test_environment()
+        vecchio_nome = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['riusa_db'])
+        try:
+            # Le foto dei barbieri demo finiscono in una cartella temporanea
+            with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+                if not Appuntamento.objects.exists():
+                    call_command(
+                        'popola_dati',
+                        clienti=options['clienti'],
+                        barbieri=options['barbieri'],
+                        appuntamenti=options['appuntamenti'],
+                        anni=options['anni'],
+                        seed=options['seed'],
+                        stdout=self.stdout,
+                    )
+                risultati = benchmark.esegui(options['ripetizioni'], options['scenario'], log=self.stdout.write)
+        finally:
+            connection.creation.destroy_test_db(vecchio_nome, verbosity=0, keepdb=options['riusa_db'])
+            teardown_test_environment()
+
+        if options['output']:
+            benchmark.salva(risultati, options['output'])
+            self.stdout.write(f"Risultati salvati in {options['output']}")
+
+        if baseline is not None:
+            regressioni = benchmark.confronta(risultati, baseline, options['soglia'])
+            if regressioni:
+                raise CommandError("Regressioni rispetto alla baseline:\n" + "\n".join(regressioni))
+            self.stdout.write(self.style.SUCCESS("Nessuna regressione rispetto alla baseline"))
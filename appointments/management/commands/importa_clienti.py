@@ -0,0 +1,59 @@
+"""
+Importa clienti (e i loro utenti) da un file CSV, JSON o JSON Lines
+(vedi appointments/importazione.py).
+
+    python manage.py importa_clienti clienti.csv [--lotto 1000] [--processi 8] [--scarti scarti.csv]
+
+Le righe non valide non fermano l'importazione: con --scarti finiscono in un
+CSV (riga, email, motivo), altrimenti se ne stampano le prime.
+"""
+import csv
+import time as cronometro
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.importazione import COLONNE, FORMATI, apri_testo, formato_da_nome, importa_clienti, righe
+
+SCARTI_MOSTRATI = 20
+
+
+class Command(BaseCommand):
+    help = "Importa clienti da CSV/JSON con validazione, hash in parallelo e inserimenti a lotti"
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help=f"colonne: {', '.join(COLONNE)} (password facoltativa)")
+        parser.add_argument('--formato', choices=FORMATI, help="default: dall'estensione del file")
+        parser.add_argument('--lotto', type=int, help="righe per transazione (default IMPORTAZIONE_LOTTO)")
+        parser.add_argument('--processi', type=int, help="processi per gli hash (default IMPORTAZIONE_PROCESSI)")
+        parser.add_argument('--scarti', help="CSV in cui scrivere le righe scartate")
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or formato_da_nome(options['file'])
+        if not formato:
+            raise CommandError(f"Formato non riconosciuto: usa --formato ({', '.join(FORMATI)})")
+
+        inizio = cronometro.perf_counter()
+        try:
+            with open(options['file'], 'rb') as file_binario:
+                esito = importa_clienti(
+                    righe(apri_testo(file_binario), formato), lotto=options['lotto'], processi=options['processi']
+                )
+        except (OSError, UnicodeDecodeError, ValueError, csv.Error) as errore:
+            raise CommandError(f"Importazione interrotta (i lotti già scritti restano): {errore}")
+        trascorso = cronometro.perf_counter() - inizio
+
+        if options['scarti']:
+            with open(options['scarti'], 'w', newline='', encoding='utf-8') as f:
+                scrittore = csv.writer(f)
+                scrittore.writerow(['riga', 'email', 'motivo'])
+                scrittore.writerows((scarto.riga, scarto.email, scarto.motivo) for scarto in esito.scarti)
+        else:
+            for scarto in esito.scarti[:SCARTI_MOSTRATI]:
+                self.stderr.write(f"Riga {scarto.riga} ({scarto.email or '-'}): {scarto.motivo}")
+            if len(esito.scarti) > SCARTI_MOSTRATI:
+                self.stderr.write(f"... e altre {len(esito.scarti) - SCARTI_MOSTRATI} (usa --scarti per l'elenco)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Clienti importati: {esito.importati}, scartati: {len(esito.scarti)} "
+            f"({esito.importati / trascorso if trascorso else 0:,.0f} clienti/s)"
+        ))
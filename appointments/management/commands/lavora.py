@@ -0,0 +1,72 @@
+"""
+Worker della coda dei lavori in background (vedi appointments/coda.py).
+
+    python manage.py lavora [--thread 4] [--processi 1] [--intervallo 1] [--una-volta]
+
+Ogni processo esegue i lavori in un pool di ``--thread`` thread; con
+``--processi`` se ne avviano più di uno (o più comandi, anche insieme: il
+prelievo dei lavori è atomico). SIGTERM o Ctrl-C: si smette di prendere
+lavori e si finiscono quelli in corso. Con --una-volta si esce quando la
+coda non ha più lavori disponibili (cron, test).
+"""
+import multiprocessing
+import signal
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from appointments.coda import Worker
+
+
+def _processo(thread, intervallo, una_volta):
+    # Con il metodo "spawn" il processo figlio parte senza Django configurato
+    if not apps.ready:
+        django.setup()
+    worker = Worker(thread, intervallo)
+    worker.gestisci_segnali()
+    worker.avvia(una_volta)
+
+
+class Command(BaseCommand):
+    help = "Esegue i lavori in background della coda sul database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--thread', type=int, default=4, help="thread per processo (default 4)")
+        parser.add_argument('--processi', type=int, default=1, help="processi worker (default 1)")
+        parser.add_argument('--intervallo', type=float, default=1.0, help="secondi di attesa a coda vuota")
+        parser.add_argument('--una-volta', action='store_true', help="esce quando la coda è vuota")
+
+    def handle(self, *args, **options):
+        if options['thread'] < 1 or options['processi'] < 1:
+            raise CommandError("--thread e --processi devono essere almeno 1")
+        argomenti = (options['thread'], options['intervallo'], options['una_volta'])
+
+        if options['processi'] == 1:
+            worker = Worker(*argomenti[:2])
+            worker.gestisci_segnali()
+            self.stdout.write(f"Worker {worker.nome} avviato con {options['thread']} thread")
+            eseguiti, falliti = worker.avvia(options['una_volta'])
+            self.stdout.write(self.style.SUCCESS(f"Lavori eseguiti: {eseguiti}, falliti: {falliti}"))
+            return
+
+        # I figli non devono ereditare le connessioni aperte del padre
+        connections.close_all()
+        contesto = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+        processi = [contesto.Process(target=_processo, args=argomenti) for _ in range(options['processi'])]
+        for processo in processi:
+            processo.start()
+
+        def inoltra(numero, frame):
+            for processo in processi:
+                if processo.is_alive():
+                    processo.terminate()
+
+        signal.signal(signal.SIGTERM, inoltra)
+        # Ctrl-C arriva già a tutto il gruppo di processi
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        self.stdout.write(f"Avviati {len(processi)} worker con {options['thread']} thread ciascuno")
+        for processo in processi:
+            processo.join()
+        self.stdout.write(self.style.SUCCESS("Worker terminati"))
@@ -0,0 +1,50 @@
+"""
+Porta le foto dei barbieri già caricate al nuovo schema (vedi immagini.py).
+
+    python manage.py ottimizza_foto [--elimina-originali]
+
+Ogni foto con un nome non basato sul contenuto viene salvata di nuovo:
+i duplicati confluiscono nello stesso file. Poi si generano le varianti
+mancanti. Con --elimina-originali i vecchi file non più usati da nessun
+barbiere vengono cancellati.
+"""
+from django.core.management.base import BaseCommand
+
+from appointments.catalogo import invalida_catalogo
+from appointments.immagini import e_gia_deduplicata, genera_varianti
+from appointments.models import Barbiere
+
+
+class Command(BaseCommand):
+    help = "Deduplica le foto dei barbieri e genera le varianti ridimensionate"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--elimina-originali', action='store_true')
+
+    def handle(self, *args, **options):
+        vecchi = set()
+        for barbiere in Barbiere.objects.exclude(foto='').exclude(foto__isnull=True):
+            foto = barbiere.foto
+            if not foto.storage.exists(foto.name):
+                self.stderr.write(f"{barbiere}: file mancante {foto.name}")
+                continue
+            if not e_gia_deduplicata(foto.name):
+                vecchio = foto.name
+                with foto.storage.open(vecchio, 'rb') as f:
+                    # save() del FieldFile passa dallo StorageFoto: nome = hash del contenuto
+                    foto.save(vecchio.rsplit('/', 1)[-1], f, save=False)
+                Barbiere.objects.filter(pk=barbiere.pk).update(foto=foto.name)
+                vecchi.add(vecchio)
+                self.stdout.write(f"{barbiere}: {vecchio} -> {foto.name}")
+            create = genera_varianti(foto.name, foto.storage)
+            self.stdout.write(f"{barbiere}: {len(create)} varianti create")
+
+        if options['elimina_originali']:
+            in_uso = set(Barbiere.objects.values_list('foto', flat=True))
+            storage = Barbiere._meta.get_field('foto').storage
+            for nome in sorted(vecchi - in_uso):
+                storage.delete(nome)
+                self.stdout.write(f"Eliminato {nome}")
+
+        invalida_catalogo()
+        self.stdout.write(self.style.SUCCESS("Foto ottimizzate"))
@@ -0,0 +1,264 @@
+"""
+Popola il database con dati di esempio o con grandi volumi per i test di carico.
+
+    python manage.py popola_dati                      # dati demo (come scripts/populate_data.py)
+    python manage.py popola_dati --clienti 100000 --barbieri 50 \\
+        --appuntamenti 10000000 --anni 5 --seed 42    # capacity test
+
+Tutto è deterministico a partire da --seed (su un database vuoto). Gli
+inserimenti usano bulk_create a blocchi, ognuno nella sua transazione.
+"""
+import os
+import random
+import time as cronometro
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from appointments import catalogo, disponibilita, riepilogo
+from appointments.models import Appuntamento, Barbiere, Cliente, Servizio
+
+SERVIZI = [
+    {'nome': 'Taglio Capelli', 'descrizione': 'Taglio professionale dei capelli con styling finale', 'durata_minuti': 30, 'prezzo': Decimal('20.00')},
+    {'nome': 'Shampoo', 'descrizione': 'Lavaggio e trattamento shampoo con massaggio', 'durata_minuti': 15, 'prezzo': Decimal('10.00')},
+    {'nome': 'Taglio + Shampoo', 'descrizione': 'Combinazione di taglio e shampoo per un servizio completo', 'durata_minuti': 45, 'prezzo': Decimal('25.00')},
+    {'nome': 'Barba', 'descrizione': 'Modellatura e rifinitura della barba', 'durata_minuti': 20, 'prezzo': Decimal('15.00')},
+    {'nome': 'Taglio + Barba', 'descrizione': 'Taglio capelli e modellatura barba', 'durata_minuti': 50, 'prezzo': Decimal('30.00')},
+    {'nome': 'Pacchetto Completo', 'descrizione': 'Taglio, shampoo, barba e styling finale', 'durata_minuti': 75, 'prezzo': Decimal('45.00')},
+]
+# Quanto spesso viene scelto ogni servizio (stesso ordine di SERVIZI)
+PESI_SERVIZI = [40, 5, 20, 15, 15, 5]
+
+BARBIERI = [
+    {'nome': 'Giuseppe Barbiere', 'specialita': 'Tagli classici e moderni', 'foto': 'giuseppe_il_barbiere.png'},
+    {'nome': 'Antonio Stilista', 'specialita': 'Styling e acconciature', 'foto': 'Salvone_il_barbiere.png'},
+    {'nome': 'Marco Esperto', 'specialita': 'Barbe e tagli tradizionali', 'foto': 'marco.png'},
+    {'nome': 'Davide Giovane', 'specialita': 'Tagli alla moda per giovani', 'foto': 'davide_giovane.png'},
+]
+
+CLIENTI = [
+    {'nome': 'Mario Rossi', 'email': 'mario.rossi@example.com', 'telefono': '+39 333 123 4567'},
+    {'nome': 'Luca Bianchi', 'email': 'luca.bianchi@example.com', 'telefono': '02 9876543'},
+    {'nome': 'Giulia Verdi', 'email': 'giulia.verdi@example.com', 'telefono': '+39 345 678 9012'},
+    {'nome': 'Francesco Neri', 'email': 'francesco.neri@example.com', 'telefono': '06 555 1234'},
+    {'nome': 'Sara Gialli', 'email': 'sara.gialli@example.com', 'telefono': '+39 328 456 7890'},
+]
+
+NOMI = ['Marco', 'Luca', 'Giulia', 'Francesca', 'Andrea', 'Sara', 'Matteo', 'Chiara', 'Paolo', 'Elena',
+        'Davide', 'Anna', 'Simone', 'Laura', 'Alessandro', 'Martina', 'Stefano', 'Valentina']
+COGNOMI = ['Rossi', 'Russo', 'Ferrari', 'Esposito', 'Bianchi', 'Romano', 'Colombo', 'Ricci', 'Marino',
+           'Greco', 'Bruno', 'Gallo', 'Conti', 'De Luca', 'Costa', 'Giordano', 'Mancini', 'Rizzo']
+
+# Affluenza relativa per giorno della settimana (lunedì = 0); domenica e lunedì chiuso
+AFFLUENZA = {1: 8, 2: 9, 3: 10, 4: 12, 5: 14}
+
+# Mix di stati: (stato, peso) per appuntamenti passati e futuri
+STATI_PASSATI = [('completato', 85), ('cancellato', 12), ('confermato', 3)]
+STATI_FUTURI = [('confermato', 88), ('cancellato', 8), ('in_attesa', 4)]
+
+GIORNI_FUTURI = 30
+PASSO_MINUTI = 5
+
+APERTURA = disponibilita.APERTURA.hour * 60 + disponibilita.APERTURA.minute
+CHIUSURA = disponibilita.CHIUSURA.hour * 60 + disponibilita.CHIUSURA.minute
+
+
+class Command(BaseCommand):
+    help = "Genera dati di esempio o grandi volumi deterministici per i test di carico"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clienti', type=int, default=len(CLIENTI))
+        parser.add_argument('--barbieri', type=int, default=len(BARBIERI))
+        parser.add_argument('--appuntamenti', type=int, default=3)
+        parser.add_argument('--anni', type=float, default=1, help="anni di storico (più %d giorni futuri)" % GIORNI_FUTURI)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch', type=int, default=5000, help="righe per bulk_create/transazione")
+        parser.add_argument('--password', default='password123', help="password di tutti gli utenti generati")
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options['seed'])
+        self.batch = options['batch']
+
+        servizi = self.crea_servizi()
+        barbieri_ids = self.crea_barbieri(options['barbieri'])
+        clienti_ids = self.crea_clienti(options['clienti'], options['password'])
+        self.crea_appuntamenti(options['appuntamenti'], options['anni'], barbieri_ids, clienti_ids, servizi)
+
+        # bulk_create non invia segnali: agende e catalogo in cache vanno ricalcolati,
+        # il riepilogo giornaliero ricostruito
+        disponibilita.invalida_tutto()
+        catalogo.invalida_catalogo()
+        riepilogo.ricostruisci()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Totale: {Cliente.objects.count()} clienti, {Barbiere.objects.count()} barbieri, "
+            f"{Servizio.objects.count()} servizi, {Appuntamento.objects.count()} appuntamenti"
+        ))
+
+    # ----- progresso -----
+
+    def avanzamento(self, cosa, fatti, totale, inizio):
+        trascorso = cronometro.perf_counter() - inizio
+        velocita = fatti / trascorso if trascorso else 0
+        self.stdout.write(f"{cosa}: {fatti}/{totale} ({velocita:,.0f} righe/s)")
+
+    # ----- catalogo -----
+
+    def crea_servizi(self):
+        servizi = []
+        for dati in SERVIZI:
+            servizio, _ = Servizio.objects.get_or_create(nome=dati['nome'], defaults=dati)
+            servizi.append(servizio)
+        return servizi
+
+    def crea_barbieri(self, quanti):
+        esistenti = Barbiere.objects.count()
+        nuovi = []
+        for n in range(esistenti, quanti):
+            if n < len(BARBIERI):
+                dati = BARBIERI[n]
+                nuovi.append(Barbiere(nome=dati['nome'], specialita=dati['specialita']))
+            else:
+                nuovi.append(Barbiere(nome=f"Barbiere {n + 1}", specialita=self.rnd.choice(
+                    ['Tagli classici', 'Barbe', 'Tagli moderni', 'Colore', 'Styling'])))
+        Barbiere.objects.bulk_create(nuovi)
+        self.assegna_foto()
+        return list(Barbiere.objects.filter(attivo=True).order_by('id').values_list('id', flat=True)[:quanti])
+
+    def assegna_foto(self):
+        """Foto dei barbieri demo, solo se non ne hanno già una"""
+        cartella = settings.BASE_DIR / 'barber_shop' / 'foto'
+        for dati in BARBIERI:
+            percorso = cartella / dati['foto']
+            barbiere = Barbiere.objects.filter(Q(foto='') | Q(foto__isnull=True), nome=dati['nome']).first()
+            if barbiere and os.path.exists(percorso):
+                with open(percorso, 'rb') as f:
+                    barbiere.foto.save(dati['foto'], f, save=True)
+
+    # ----- clienti -----
+
+    def crea_clienti(self, quanti, password):
+        # Fast path: un solo hash PBKDF2 condiviso da tutti gli utenti generati
+        hash_password = make_password(password)
+        esistenti = Cliente.objects.count()
+        inizio = cronometro.perf_counter()
+
+        for primo in range(esistenti, quanti, self.batch):
+            indici = range(primo, min(primo + self.batch, quanti))
+            dati = [self.dati_cliente(n) for n in indici]
+            with transaction.atomic():
+                utenti = User.objects.bulk_create([
+                    User(username=d['email'], email=d['email'], password=hash_password,
+                         first_name=d['nome'].split()[0], last_name=' '.join(d['nome'].split()[1:]))
+                    for d in dati
+                ])
+                Cliente.objects.bulk_create([
+                    Cliente(user_id=utente.pk, **d) for utente, d in zip(utenti, dati)
+                ])
+            self.avanzamento("Clienti", indici.stop, quanti, inizio)
+
+        return list(Cliente.objects.order_by('id').values_list('id', flat=True))
+
+    def dati_cliente(self, n):
+        if n < len(CLIENTI):
+            return dict(CLIENTI[n])
+        nome, cognome = self.rnd.choice(NOMI), self.rnd.choice(COGNOMI)
+        return {
+            'nome': f"{nome} {cognome}",
+            'email': f"{nome}.{cognome}.{n}@example.com".lower().replace(' ', ''),
+            'telefono': f"+39 3{self.rnd.randrange(10, 100)} {self.rnd.randrange(1000000, 10000000)}",
+        }
+
+    # ----- appuntamenti -----
+
+    def crea_appuntamenti(self, quanti, anni, barbieri_ids, clienti_ids, servizi):
+        if quanti <= 0:
+            return
+        if not barbieri_ids or not clienti_ids:
+            raise CommandError("Servono almeno un barbiere attivo e un cliente per creare appuntamenti")
+
+        oggi = timezone.localdate()
+        primo_giorno = oggi - timedelta(days=int(anni * 365))
+        giorni = [
+            primo_giorno + timedelta(days=n)
+            for n in range((oggi - primo_giorno).days + GIORNI_FUTURI)
+            if (primo_giorno + timedelta(days=n)).weekday() in AFFLUENZA
+        ]
+        if not giorni:
+            raise CommandError("Intervallo di date senza giorni lavorativi: aumenta --anni")
+
+        # Il giorno più affollato non deve superare la capienza di una poltrona
+        peso_totale = sum(AFFLUENZA[g.weekday()] for g in giorni) * len(barbieri_ids)
+        durata_media = sum(s.durata_minuti * p for s, p in zip(servizi, PESI_SERVIZI)) / sum(PESI_SERVIZI)
+        if quanti * max(AFFLUENZA.values()) / peso_totale > (CHIUSURA - APERTURA) / durata_media:
+            raise CommandError(
+                f"{quanti} appuntamenti non entrano in {len(giorni)} giorni per {len(barbieri_ids)} barbieri: "
+                "aumenta --anni o --barbieri"
+            )
+
+        adesso = timezone.now()
+        blocco, creati, previsti, peso = [], 0, 0, 0
+        inizio = cronometro.perf_counter()
+
+        for giorno in giorni:
+            for barbiere_id in barbieri_ids:
+                # Ripartizione intera proporzionale all'affluenza: a fine ciclo
+                # 'previsti' vale esattamente 'quanti'
+                peso += AFFLUENZA[giorno.weekday()]
+                dovuti = quanti * peso // peso_totale - previsti
+                previsti += dovuti
+                for data_ora, servizio in self.agenda_giornata(giorno, dovuti, servizi):
+                    stati = STATI_PASSATI if data_ora < adesso else STATI_FUTURI
+                    blocco.append(Appuntamento(
+                        cliente_id=self.rnd.choice(clienti_ids),
+                        barbiere_id=barbiere_id,
+                        servizio=servizio,
+                        data_ora=data_ora,
+                        stato=self.rnd.choices([s for s, _ in stati], [p for _, p in stati])[0],
+                    ))
+                if len(blocco) >= self.batch:
+                    creati += self.salva(blocco)
+                    blocco = []
+                    self.avanzamento("Appuntamenti", creati, quanti, inizio)
+
+        if blocco:
+            creati += self.salva(blocco)
+            self.avanzamento("Appuntamenti", creati, quanti, inizio)
+
+    def agenda_giornata(self, giorno, quanti, servizi):
+        """
+        Fino a ``quanti`` appuntamenti senza sovrapposizioni: i servizi sono
+        messi in fila e il tempo libero è distribuito a caso tra uno e l'altro.
+        """
+        if quanti <= 0:
+            return []
+        scelti, occupati = [], 0
+        for servizio in self.rnd.choices(servizi, PESI_SERVIZI, k=quanti):
+            if occupati + servizio.durata_minuti <= CHIUSURA - APERTURA:
+                scelti.append(servizio)
+                occupati += servizio.durata_minuti
+
+        # Minuti liberi divisi in len(scelti) + 1 pause, a passi di PASSO_MINUTI
+        passi_liberi = (CHIUSURA - APERTURA - occupati) // PASSO_MINUTI
+        tagli = sorted(self.rnd.randint(0, passi_liberi) for _ in scelti)
+        pause = [b - a for a, b in zip([0] + tagli, tagli)]
+
+        risultato, minuto = [], APERTURA
+        for servizio, pausa in zip(scelti, pause):
+            minuto += pausa * PASSO_MINUTI
+            ora = datetime.combine(giorno, time(minuto // 60, minuto % 60))
+            risultato.append((timezone.make_aware(ora) if settings.USE_TZ else ora, servizio))
+            minuto += servizio.durata_minuti
+        return risultato
+
+    def salva(self, appuntamenti):
+        with transaction.atomic():
+            Appuntamento.objects.bulk_create(appuntamenti)
+        return len(appuntamenti)
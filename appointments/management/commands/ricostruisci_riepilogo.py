@@ -0,0 +1,37 @@
+"""
+Ricalcola il riepilogo giornaliero dalle tabelle degli appuntamenti
+(vedi appointments/riepilogo.py).
+
+    python manage.py ricostruisci_riepilogo [--dal 2024-01-01] [--al 2024-12-31]
+
+Da lanciare la prima volta dopo la migrazione e dopo importazioni che
+scrivono gli appuntamenti senza passare dai segnali.
+"""
+import time as cronometro
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.riepilogo import ricostruisci
+
+
+def _data(valore):
+    try:
+        return datetime.strptime(valore, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Data non valida: {valore!r} (formato AAAA-MM-GG)")
+
+
+class Command(BaseCommand):
+    help = "Ricostruisce il riepilogo giornaliero per barbiere e servizio"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dal', type=_data, help="primo giorno (default: tutto lo storico)")
+        parser.add_argument('--al', type=_data, help="ultimo giorno compreso")
+
+    def handle(self, *args, **options):
+        inizio = cronometro.perf_counter()
+        righe = ricostruisci(options['dal'], options['al'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Righe di riepilogo scritte: {righe} in {cronometro.perf_counter() - inizio:.1f}s"
+        ))
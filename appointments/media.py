@@ -0,0 +1,147 @@
+"""
+Vista per servire i file di MEDIA_ROOT anche in produzione.
+
+- ETag e Last-Modified, con risposta 304 alle richieste condizionali
+- richieste Range a intervallo singolo (206 / 416), utili per file grandi
+- Cache-Control di un anno, ``immutable``, per i file con nome basato sul
+  contenuto (foto e varianti di immagini.py); per gli altri MEDIA_MAX_AGE
+- con MEDIA_SENDFILE = 'x-sendfile' o 'x-accel-redirect' il worker Python
+  risponde solo con gli header e il file lo invia il server davanti
+  (Apache mod_xsendfile, nginx con una location ``internal`` su
+  MEDIA_ACCEL_PREFIX), che gestisce anche i Range
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .immagini import LUNGHEZZA_IMPRONTA
+
+UN_ANNO = 60 * 60 * 24 * 365
+BLOCCO = 64 * 1024
+
+# <hash>.<ext> oppure <hash>-<larghezza>.<ext>: il contenuto non cambia mai
+_NOME_IMMUTABILE = re.compile(r'^[0-9a-f]{%d}(-\d+)?\.\w+$' % LUNGHEZZA_IMPRONTA)
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _cache_control(percorso):
+    if _NOME_IMMUTABILE.match(os.path.basename(percorso)):
+        return f'public, max-age={UN_ANNO}, immutable'
+    return f'public, max-age={getattr(settings, "MEDIA_MAX_AGE", 60 * 60)}'
+
+
+def _intervallo(request, dimensione, etag, ultima_modifica):
+    """
+    (inizio, fine) inclusivi dell'header Range, None per il file intero,
+    oppure False se l'intervallo non è soddisfacibile.
+    """
+    valore = request.META.get('HTTP_RANGE', '').strip()
+    if not valore:
+        return None
+    # If-Range: il Range vale solo se il file è ancora quello che il client ha
+    if_range = request.META.get('HTTP_IF_RANGE', '').strip()
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != ultima_modifica:
+        return None
+    corrispondenza = _RANGE.match(valore)
+    if not corrispondenza:
+        # Sintassi non supportata (es. più intervalli): si invia tutto
+        return None
+    inizio, fine = corrispondenza.groups()
+    if not inizio:
+        # Un file vuoto non ha ultimi N byte da inviare
+        if not fine or int(fine) == 0 or dimensione == 0:
+            return False
+        # bytes=-N: gli ultimi N byte
+        return max(0, dimensione - int(fine)), dimensione - 1
+    inizio = int(inizio)
+    fine = min(int(fine), dimensione - 1) if fine else dimensione - 1
+    if inizio >= dimensione or fine < inizio:
+        return False
+    return inizio, fine
+
+
+def _leggi(percorso, inizio, lunghezza):
+    with open(percorso, 'rb') as f:
+        f.seek(inizio)
+        while lunghezza > 0:
+            blocco = f.read(min(BLOCCO, lunghezza))
+            if not blocco:
+                break
+            lunghezza -= len(blocco)
+            yield blocco
+
+
+def _risposta_sendfile(percorso_assoluto, percorso):
+    modalita = settings.MEDIA_SENDFILE
+    response = HttpResponse()
+    if modalita == 'x-accel-redirect':
+        prefisso = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+        # Codificato come URI: nginx decodifica, l'header resta ASCII (es. sanvitolocaèo.png)
+        response['X-Accel-Redirect'] = prefisso.rstrip('/') + '/' + quote(percorso.lstrip('/'))
+    elif modalita == 'x-sendfile':
+        response['X-Sendfile'] = percorso_assoluto
+    else:
+        raise ValueError(f"MEDIA_SENDFILE non valido: {modalita!r}")
+    # Il Content-Type lo decide il server davanti
+    del response['Content-Type']
+    return response
+
+
+@require_safe
+def servi_media(request, percorso):
+    try:
+        percorso_assoluto = safe_join(settings.MEDIA_ROOT, percorso)
+        info = os.stat(percorso_assoluto)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404("File non trovato")
+    if not stat.S_ISREG(info.st_mode):
+        raise Http404("File non trovato")
+
+    ultima_modifica = int(info.st_mtime)
+    etag = f'"{info.st_size:x}-{info.st_mtime_ns:x}"'
+    intestazioni = {
+        'ETag': etag,
+        'Last-Modified': http_date(ultima_modifica),
+        'Cache-Control': _cache_control(percorso),
+    }
+
+    # 304 / 412 senza aprire il file
+    prototipo = HttpResponse(headers=intestazioni)
+    condizionale = get_conditional_response(request, etag, ultima_modifica, prototipo)
+    if condizionale is not prototipo:
+        return condizionale
+
+    if getattr(settings, 'MEDIA_SENDFILE', None):
+        response = _risposta_sendfile(percorso_assoluto, percorso)
+    else:
+        intervallo = _intervallo(request, info.st_size, etag, ultima_modifica)
+        if intervallo is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{info.st_size}'
+            return response
+        tipo = mimetypes.guess_type(percorso_assoluto)[0] or 'application/octet-stream'
+        if intervallo is None:
+            # FileResponse usa wsgi.file_wrapper (sendfile) dove il server lo offre
+            response = FileResponse(open(percorso_assoluto, 'rb'), content_type=tipo)
+        else:
+            inizio, fine = intervallo
+            response = StreamingHttpResponse(
+                _leggi(percorso_assoluto, inizio, fine - inizio + 1), status=206, content_type=tipo
+            )
+            response['Content-Range'] = f'bytes {inizio}-{fine}/{info.st_size}'
+            response['Content-Length'] = fine - inizio + 1
+        response['Accept-Ranges'] = 'bytes'
+
+    for nome, valore in intestazioni.items():
+        response[nome] = valore
+    return response
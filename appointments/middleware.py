@@ -0,0 +1,108 @@
+"""
+Middleware dell'app appointments.
+
+ClienteMiddleware risolve una sola volta per richiesta il Cliente dell'utente
+loggato. L'associazione utente -> id cliente è tenuta anche in cache (alias
+CLIENTE_CACHE, None per disattivarla) e invalidata dai segnali di Cliente:
+le viste che hanno bisogno solo dell'id non fanno nessuna query.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.functional import SimpleLazyObject
+
+from .models import Cliente
+
+# Valore in cache per "utente senza profilo cliente" (None significherebbe miss)
+_NESSUN_CLIENTE = 0
+
+
+def _cache():
+    alias = getattr(settings, 'CLIENTE_CACHE', 'default')
+    return caches[alias] if alias else None
+
+
+def chiave_cliente(user_id):
+    return f'cliente_utente:{user_id}'
+
+
+def invalida_cliente_utente(user_id):
+    """Da chiamare quando cambia il Cliente associato a un utente"""
+    cache = _cache()
+    if cache is not None and user_id is not None:
+        cache.delete(chiave_cliente(user_id))
+
+
+def _cerca_cliente_id(user):
+    cache = _cache()
+    if cache is not None:
+        cliente_id = cache.get(chiave_cliente(user.pk))
+        if cliente_id is not None:
+            return cliente_id or None
+
+    cliente_id = Cliente.objects.filter(user_id=user.pk).values_list('pk', flat=True).first()
+    if cache is not None:
+        cache.set(chiave_cliente(user.pk), cliente_id or _NESSUN_CLIENTE)
+    return cliente_id
+
+
+async def _acerca_cliente_id(user):
+    cache = _cache()
+    if cache is not None:
+        cliente_id = await cache.aget(chiave_cliente(user.pk))
+        if cliente_id is not None:
+            return cliente_id or None
+
+    cliente_id = await Cliente.objects.filter(user_id=user.pk).values_list('pk', flat=True).afirst()
+    if cache is not None:
+        await cache.aset(chiave_cliente(user.pk), cliente_id or _NESSUN_CLIENTE)
+    return cliente_id
+
+
+def get_cliente_id(request):
+    """Id del Cliente dell'utente loggato (None se anonimo o senza profilo)"""
+    if not hasattr(request, '_cliente_id'):
+        user = request.user
+        request._cliente_id = _cerca_cliente_id(user) if user.is_authenticated else None
+    return request._cliente_id
+
+
+async def aget_cliente_id(request):
+    """Versione asincrona di ``get_cliente_id`` (usa ``request.auser()``)"""
+    if not hasattr(request, '_cliente_id'):
+        user = await request.auser()
+        request._cliente_id = await _acerca_cliente_id(user) if user.is_authenticated else None
+    return request._cliente_id
+
+
+def get_cliente(request):
+    """Il Cliente dell'utente loggato, caricato al primo utilizzo"""
+    if not hasattr(request, '_cliente'):
+        cliente_id = get_cliente_id(request)
+        request._cliente = Cliente.objects.filter(pk=cliente_id).first() if cliente_id else None
+    return request._cliente
+
+
+class ClienteMiddleware:
+    """
+    Aggiunge ``request.cliente`` (pigro). Va messo dopo AuthenticationMiddleware.
+    Attenzione: è un oggetto pigro, quindi si controlla con ``if request.cliente``
+    e non con ``is None``. Supporta sia WSGI che ASGI senza cambi di thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.cliente = SimpleLazyObject(lambda: get_cliente(request))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.cliente = SimpleLazyObject(lambda: get_cliente(request))
+        return await self.get_response(request)
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0002_alter_cliente_telefono"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appuntamento",
+            index=models.Index(
+                fields=["barbiere", "data_ora", "stato"],
+                name="app_barbiere_data_stato_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appuntamento",
+            index=models.Index(
+                fields=["cliente", "-data_ora"], name="app_cliente_data_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appuntamento",
+            index=models.Index(
+                condition=models.Q(("stato", "cancellato"), _negated=True),
+                fields=["barbiere", "data_ora"],
+                name="app_barbiere_attivi_idx",
+            ),
+        ),
+    ]
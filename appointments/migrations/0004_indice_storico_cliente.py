@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0003_indici_appuntamento"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="appuntamento",
+            name="app_cliente_data_idx",
+        ),
+        migrations.AddIndex(
+            model_name="appuntamento",
+            index=models.Index(
+                fields=["cliente", "-data_ora", "-id"], name="app_cliente_data_id_idx"
+            ),
+        ),
+    ]
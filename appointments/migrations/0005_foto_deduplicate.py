@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:28
+
+import appointments.immagini
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0004_indice_storico_cliente"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="barbiere",
+            name="foto",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=appointments.immagini.StorageFoto(),
+                upload_to="barbieri/",
+            ),
+        ),
+    ]
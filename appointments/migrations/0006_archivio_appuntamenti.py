@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0005_foto_deduplicate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AppuntamentoArchiviato",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("data_ora", models.DateTimeField(verbose_name="Data e ora")),
+                (
+                    "stato",
+                    models.CharField(
+                        choices=[
+                            ("confermato", "Confermato"),
+                            ("completato", "Completato"),
+                            ("cancellato", "Cancellato"),
+                            ("in_attesa", "In Attesa"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("note", models.TextField(blank=True, null=True)),
+                ("creato_il", models.DateTimeField()),
+                ("modificato_il", models.DateTimeField()),
+                (
+                    "archiviato_il",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "barbiere",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="appuntamenti_archiviati",
+                        to="appointments.barbiere",
+                    ),
+                ),
+                (
+                    "cliente",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="appuntamenti_archiviati",
+                        to="appointments.cliente",
+                    ),
+                ),
+                (
+                    "servizio",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="appointments.servizio",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Appuntamento archiviato",
+                "verbose_name_plural": "Appuntamenti archiviati",
+                "ordering": ["-data_ora"],
+                "indexes": [
+                    models.Index(
+                        fields=["cliente", "-data_ora", "-id"],
+                        name="arch_cliente_data_id_idx",
+                    ),
+                    models.Index(fields=["data_ora"], name="arch_data_idx"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0006_archivio_appuntamenti"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appuntamento",
+            index=models.Index(fields=["data_ora", "id"], name="app_data_id_idx"),
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Indici full-text FTS5 per la ricerca di clienti e note (appointments.ricerca).
+# Solo su SQLite: sugli altri database la ricerca resta quella standard.
+
+from django.db import migrations
+
+# Il telefono si indicizza con le sole cifre: "+39 333-1234" -> "393331234"
+TELEFONO_NEW = (
+    "replace(replace(replace(replace(replace(new.telefono, ' ', ''), '-', ''), '(', ''), ')', ''), '+', '')"
+)
+
+CREA = [
+    # trigram: trova sottostringhe come LIKE '%...%', senza distinguere maiuscole
+    """
+    CREATE VIRTUAL TABLE appointments_ricerca_cliente
+    USING fts5(nome, email, telefono, tokenize = 'trigram')
+    """,
+    """
+    CREATE VIRTUAL TABLE appointments_ricerca_nota
+    USING fts5(note, tokenize = 'trigram')
+    """,
+    f"""
+    CREATE TRIGGER appointments_ricerca_cliente_ai AFTER INSERT ON appointments_cliente BEGIN
+        INSERT INTO appointments_ricerca_cliente (rowid, nome, email, telefono)
+        VALUES (new.id, new.nome, new.email, {TELEFONO_NEW});
+    END
+    """,
+    f"""
+    CREATE TRIGGER appointments_ricerca_cliente_au
+    AFTER UPDATE OF nome, email, telefono ON appointments_cliente BEGIN
+        UPDATE appointments_ricerca_cliente
+        SET nome = new.nome, email = new.email, telefono = {TELEFONO_NEW}
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER appointments_ricerca_cliente_ad AFTER DELETE ON appointments_cliente BEGIN
+        DELETE FROM appointments_ricerca_cliente WHERE rowid = old.id;
+    END
+    """,
+    # Solo le note non vuote; UPDATE OF note: i cambi di stato in blocco non toccano l'indice
+    """
+    CREATE TRIGGER appointments_ricerca_nota_ai AFTER INSERT ON appointments_appuntamento
+    WHEN coalesce(new.note, '') != '' BEGIN
+        INSERT INTO appointments_ricerca_nota (rowid, note) VALUES (new.id, new.note);
+    END
+    """,
+    """
+    CREATE TRIGGER appointments_ricerca_nota_au AFTER UPDATE OF note ON appointments_appuntamento BEGIN
+        DELETE FROM appointments_ricerca_nota WHERE rowid = old.id;
+        INSERT INTO appointments_ricerca_nota (rowid, note)
+        SELECT new.id, new.note WHERE coalesce(new.note, '') != '';
+    END
+    """,
+    """
+    CREATE TRIGGER appointments_ricerca_nota_ad AFTER DELETE ON appointments_appuntamento
+    WHEN coalesce(old.note, '') != '' BEGIN
+        DELETE FROM appointments_ricerca_nota WHERE rowid = old.id;
+    END
+    """,
+    # Righe già presenti
+    f"""
+    INSERT INTO appointments_ricerca_cliente (rowid, nome, email, telefono)
+    SELECT id, nome, email, {TELEFONO_NEW.replace('new.', '')} FROM appointments_cliente
+    """,
+    """
+    INSERT INTO appointments_ricerca_nota (rowid, note)
+    SELECT id, note FROM appointments_appuntamento WHERE coalesce(note, '') != ''
+    """,
+]
+
+ELIMINA = [
+    "DROP TRIGGER IF EXISTS appointments_ricerca_cliente_ai",
+    "DROP TRIGGER IF EXISTS appointments_ricerca_cliente_au",
+    "DROP TRIGGER IF EXISTS appointments_ricerca_cliente_ad",
+    "DROP TRIGGER IF EXISTS appointments_ricerca_nota_ai",
+    "DROP TRIGGER IF EXISTS appointments_ricerca_nota_au",
+    "DROP TRIGGER IF EXISTS appointments_ricerca_nota_ad",
+    "DROP TABLE IF EXISTS appointments_ricerca_cliente",
+    "DROP TABLE IF EXISTS appointments_ricerca_nota",
+]
+
+
+def _esegui(istruzioni):
+    def esegui(apps, schema_editor):
+        connection = schema_editor.connection
+        # Il tokenizer trigram c'è da SQLite 3.34
+        if connection.vendor != "sqlite" or connection.Database.sqlite_version_info < (3, 34):
+            return
+        for istruzione in istruzioni:
+            schema_editor.execute(istruzione)
+
+    return esegui
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0007_indice_data_admin"),
+    ]
+
+    operations = [
+        migrations.RunPython(_esegui(CREA), _esegui(ELIMINA)),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0008_ricerca_fts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RiepilogoGiornaliero",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("giorno", models.DateField()),
+                ("appuntamenti", models.IntegerField(default=0)),
+                ("minuti", models.IntegerField(default=0)),
+                (
+                    "ricavo",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                ("cancellati", models.IntegerField(default=0)),
+                (
+                    "barbiere",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="riepiloghi",
+                        to="appointments.barbiere",
+                    ),
+                ),
+                (
+                    "servizio",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="riepiloghi",
+                        to="appointments.servizio",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Riepilogo giornaliero",
+                "verbose_name_plural": "Riepiloghi giornalieri",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("giorno", "barbiere", "servizio"),
+                        name="riepilogo_giorno_barbiere_servizio",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0009_riepilogo_giornaliero"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RichiestaAttesa",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("giorno", models.DateField()),
+                ("dalle", models.TimeField()),
+                ("alle", models.TimeField()),
+                ("creata_il", models.DateTimeField(auto_now_add=True)),
+                ("promossa_il", models.DateTimeField(blank=True, null=True)),
+                (
+                    "appuntamento",
+                    models.OneToOneField(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="richiesta_attesa",
+                        to="appointments.appuntamento",
+                    ),
+                ),
+                (
+                    "barbiere",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="richieste_attesa",
+                        to="appointments.barbiere",
+                    ),
+                ),
+                (
+                    "cliente",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="richieste_attesa",
+                        to="appointments.cliente",
+                    ),
+                ),
+                (
+                    "servizio",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="appointments.servizio",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Richiesta in lista d'attesa",
+                "verbose_name_plural": "Lista d'attesa",
+                "ordering": ["giorno", "dalle", "creata_il"],
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("promossa_il__isnull", True)),
+                        fields=["barbiere", "giorno", "dalle"],
+                        name="attesa_barbiere_giorno_idx",
+                    ),
+                    models.Index(
+                        fields=["cliente", "giorno"], name="attesa_cliente_giorno_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
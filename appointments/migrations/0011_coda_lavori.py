@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0010_lista_attesa"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Lavoro",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("tipo", models.CharField(max_length=100)),
+                ("argomenti", models.JSONField(blank=True, default=dict)),
+                (
+                    "stato",
+                    models.CharField(
+                        choices=[
+                            ("in_coda", "In coda"),
+                            ("in_corso", "In corso"),
+                            ("completato", "Completato"),
+                            ("fallito", "Fallito"),
+                        ],
+                        default="in_coda",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "disponibile_dal",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("tentativi", models.PositiveIntegerField(default=0)),
+                ("max_tentativi", models.PositiveIntegerField()),
+                (
+                    "chiave",
+                    models.CharField(blank=True, max_length=200, null=True, unique=True),
+                ),
+                ("preso_da", models.CharField(blank=True, max_length=64)),
+                ("errore", models.TextField(blank=True)),
+                ("creato_il", models.DateTimeField(auto_now_add=True)),
+                ("completato_il", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "Lavoro in background",
+                "verbose_name_plural": "Lavori in background",
+                "ordering": ["-creato_il"],
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("stato__in", ["in_coda", "in_corso"])),
+                        fields=["disponibile_dal", "id"],
+                        name="lavoro_da_fare_idx",
+                    ),
+                    models.Index(
+                        fields=["stato", "completato_il"],
+                        name="lavoro_stato_completato_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import RegexValidator
 from django.core.exceptions import ValidationError
+from .immagini import StorageFoto
 
 
 class Cliente(models.Model):
@@ -27,7 +28,7 @@ class Barbiere(models.Model):
     """Rappresenta un barbiere che lavora nel negozio"""
     nome = models.CharField(max_length=100)
     specialita = models.CharField(max_length=200)
-    foto = models.ImageField(upload_to='barbieri/', null=True, blank=True)
+    foto = models.ImageField(upload_to='barbieri/', storage=StorageFoto(), null=True, blank=True)
     attivo = models.BooleanField(default=True)
     
     def __str__(self):
@@ -75,6 +76,20 @@ class Appuntamento(models.Model):
     class Meta:
         verbose_name_plural = "Appuntamenti"
         ordering = ['-data_ora']
+        indexes = [
+            # Agenda di un barbiere per intervallo di date e stato
+            models.Index(fields=['barbiere', 'data_ora', 'stato'], name='app_barbiere_data_stato_idx'),
+            # Storico di un cliente, nell'ordine della paginazione a cursore
+            models.Index(fields=['cliente', '-data_ora', '-id'], name='app_cliente_data_id_idx'),
+            # Solo gli appuntamenti che occupano ancora la poltrona
+            models.Index(
+                fields=['barbiere', 'data_ora'],
+                condition=~models.Q(stato='cancellato'),
+                name='app_barbiere_attivi_idx',
+            ),
+            # Ordinamento e date_hierarchy dell'admin su tutta la tabella
+            models.Index(fields=['data_ora', 'id'], name='app_data_id_idx'),
+        ]
         
     def is_passato(self):
         """Verifica se l'appuntamento è nel passato"""
@@ -88,3 +103,149 @@ class Appuntamento(models.Model):
         if self.data_ora < now:
             raise ValidationError("Per favore controlla la data e anche i dati mancanti per favore")
         super().clean()
+
+
+class AppuntamentoArchiviato(models.Model):
+    """
+    Appuntamento completato o cancellato spostato fuori dalla tabella
+    principale (vedi archivio.py). Conserva l'id originale, così i cursori
+    della paginazione valgono per entrambe le tabelle.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='appuntamenti_archiviati')
+    barbiere = models.ForeignKey(Barbiere, on_delete=models.CASCADE, related_name='appuntamenti_archiviati')
+    servizio = models.ForeignKey(Servizio, on_delete=models.CASCADE)
+    data_ora = models.DateTimeField(verbose_name="Data e ora")
+    stato = models.CharField(max_length=20, choices=Appuntamento.STATI)
+    note = models.TextField(blank=True, null=True)
+    creato_il = models.DateTimeField()
+    modificato_il = models.DateTimeField()
+    archiviato_il = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.cliente.nome} - {self.data_ora.strftime('%d/%m/%Y %H:%M')}"
+    
+    class Meta:
+        verbose_name = "Appuntamento archiviato"
+        verbose_name_plural = "Appuntamenti archiviati"
+        ordering = ['-data_ora']
+        indexes = [
+            models.Index(fields=['cliente', '-data_ora', '-id'], name='arch_cliente_data_id_idx'),
+            models.Index(fields=['data_ora'], name='arch_data_idx'),
+        ]
+    
+    def is_passato(self):
+        return self.data_ora < timezone.now()
+
+
+class RiepilogoGiornaliero(models.Model):
+    """
+    Totali degli appuntamenti (attivi e archiviati) per giorno, barbiere e
+    servizio, aggiornati a ogni cambio (vedi riepilogo.py): i report leggono
+    da qui invece di aggregare tutto lo storico.
+    """
+    giorno = models.DateField()
+    barbiere = models.ForeignKey(Barbiere, on_delete=models.CASCADE, related_name='riepiloghi')
+    servizio = models.ForeignKey(Servizio, on_delete=models.CASCADE, related_name='riepiloghi')
+    # Confermati e completati
+    appuntamenti = models.IntegerField(default=0)
+    minuti = models.IntegerField(default=0)
+    ricavo = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    cancellati = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.giorno} - {self.barbiere_id}/{self.servizio_id}"
+    
+    class Meta:
+        verbose_name = "Riepilogo giornaliero"
+        verbose_name_plural = "Riepiloghi giornalieri"
+        constraints = [
+            models.UniqueConstraint(fields=['giorno', 'barbiere', 'servizio'], name='riepilogo_giorno_barbiere_servizio'),
+        ]
+
+
+class RichiestaAttesa(models.Model):
+    """
+    Iscrizione alla lista d'attesa: il cliente vuole ``servizio`` con
+    ``barbiere`` il giorno ``giorno``, iniziando e finendo tra ``dalle`` e
+    ``alle``. Quando si libera un posto viene promossa (vedi attesa.py).
+    """
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='richieste_attesa')
+    barbiere = models.ForeignKey(Barbiere, on_delete=models.CASCADE, related_name='richieste_attesa')
+    servizio = models.ForeignKey(Servizio, on_delete=models.CASCADE)
+    giorno = models.DateField()
+    dalle = models.TimeField()
+    alle = models.TimeField()
+    creata_il = models.DateTimeField(auto_now_add=True)
+    promossa_il = models.DateTimeField(null=True, blank=True)
+    appuntamento = models.OneToOneField(
+        Appuntamento, on_delete=models.SET_NULL, null=True, blank=True, related_name='richiesta_attesa'
+    )
+    
+    def __str__(self):
+        return f"{self.cliente.nome} - {self.giorno.strftime('%d/%m/%Y')} {self.dalle:%H:%M}-{self.alle:%H:%M}"
+    
+    class Meta:
+        verbose_name = "Richiesta in lista d'attesa"
+        verbose_name_plural = "Lista d'attesa"
+        ordering = ['giorno', 'dalle', 'creata_il']
+        indexes = [
+            # Solo le richieste ancora in attesa, per barbiere e giorno: quando
+            # si libera un posto si leggono queste e non tutta la lista
+            models.Index(
+                fields=['barbiere', 'giorno', 'dalle'],
+                condition=models.Q(promossa_il__isnull=True),
+                name='attesa_barbiere_giorno_idx',
+            ),
+            models.Index(fields=['cliente', 'giorno'], name='attesa_cliente_giorno_idx'),
+        ]
+    
+    def in_attesa(self):
+        return self.promossa_il is None
+
+
+class Lavoro(models.Model):
+    """
+    Lavoro in background nella coda sul database (vedi coda.py): la funzione
+    registrata come ``tipo`` da chiamare con ``argomenti``.
+    """
+    STATI = [
+        ('in_coda', 'In coda'),
+        ('in_corso', 'In corso'),
+        ('completato', 'Completato'),
+        ('fallito', 'Fallito'),
+    ]
+    
+    tipo = models.CharField(max_length=100)
+    argomenti = models.JSONField(default=dict, blank=True)
+    stato = models.CharField(max_length=20, choices=STATI, default='in_coda')
+    # Prima di questo istante il lavoro non si prende: esecuzione programmata,
+    # attesa prima di un nuovo tentativo o lavoro preso da un worker
+    disponibile_dal = models.DateTimeField(default=timezone.now)
+    tentativi = models.PositiveIntegerField(default=0)
+    max_tentativi = models.PositiveIntegerField()
+    # Chiave facoltativa: un lavoro con la stessa chiave si accoda una volta sola
+    chiave = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    # Segno del worker che l'ha preso: solo lui può chiuderlo
+    preso_da = models.CharField(max_length=64, blank=True)
+    errore = models.TextField(blank=True)
+    creato_il = models.DateTimeField(auto_now_add=True)
+    completato_il = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.tipo} #{self.pk} ({self.get_stato_display()})"
+    
+    class Meta:
+        verbose_name = "Lavoro in background"
+        verbose_name_plural = "Lavori in background"
+        ordering = ['-creato_il']
+        indexes = [
+            # I worker leggono solo i lavori da fare, in ordine di disponibilità
+            models.Index(
+                fields=['disponibile_dal', 'id'],
+                condition=models.Q(stato__in=['in_coda', 'in_corso']),
+                name='lavoro_da_fare_idx',
+            ),
+            # Pulizia dei lavori chiusi
+            models.Index(fields=['stato', 'completato_il'], name='lavoro_stato_completato_idx'),
+        ]
@@ -0,0 +1,95 @@
+"""
+Paginazione keyset (a cursore) per le liste di appuntamenti.
+
+Invece di OFFSET, che costringe il database a scorrere tutte le righe delle
+pagine precedenti, ogni pagina riparte dall'ultima riga vista: la coppia
+(data_ora, id) codificata nel parametro ``dopo``. Il costo di una pagina non
+dipende quindi dalla lunghezza dello storico.
+
+``pagina_keyset_unita`` fa lo stesso su più queryset con id disgiunti (es.
+appuntamenti attivi e archiviati, vedi archivio.py) unendo le righe in ordine.
+"""
+import heapq
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+
+PAGINA_APPUNTAMENTI = 20
+
+_EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECONDO = timedelta(microseconds=1)
+
+
+def codifica_cursore(data_ora, pk):
+    """Cursore compatto e sicuro per l'URL: '<microsecondi UTC>-<id>'"""
+    if data_ora.tzinfo is None:
+        data_ora = data_ora.replace(tzinfo=dt_timezone.utc)
+    return f'{(data_ora - _EPOCA) // _MICROSECONDO}-{pk}'
+
+
+def decodifica_cursore(cursore):
+    """(data_ora, id) dal cursore, oppure None se non è valido"""
+    try:
+        microsecondi, pk = cursore.split('-')
+        return _EPOCA + int(microsecondi) * _MICROSECONDO, int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def _ordina_e_filtra(queryset, cursore):
+    queryset = queryset.order_by('-data_ora', '-id')
+
+    posizione = decodifica_cursore(cursore) if cursore else None
+    if posizione:
+        data_ora, pk = posizione
+        # Il data_ora__lte rende la condizione utilizzabile come range sull'indice
+        queryset = queryset.filter(data_ora__lte=data_ora).filter(
+            Q(data_ora__lt=data_ora) | Q(id__lt=pk)
+        )
+    return queryset
+
+
+def _unisci(liste):
+    """Unisce liste già ordinate per (-data_ora, -id)"""
+    return list(heapq.merge(*liste, key=lambda riga: (riga.data_ora, riga.pk), reverse=True))
+
+
+def _taglia(righe, dimensione):
+    # Una riga in più dice se esiste una pagina successiva senza COUNT(*)
+    if len(righe) > dimensione:
+        ultima = righe[dimensione - 1]
+        return righe[:dimensione], codifica_cursore(ultima.data_ora, ultima.pk)
+    return righe, None
+
+
+def pagina_keyset(queryset, cursore=None, dimensione=PAGINA_APPUNTAMENTI):
+    """
+    Una pagina di ``queryset`` ordinata per (-data_ora, -id) a partire dal cursore.
+    Restituisce (righe, cursore_successivo); il secondo è None sull'ultima pagina.
+    """
+    righe = list(_ordina_e_filtra(queryset, cursore)[:dimensione + 1])
+    return _taglia(righe, dimensione)
+
+
+async def apagina_keyset(queryset, cursore=None, dimensione=PAGINA_APPUNTAMENTI):
+    """Versione asincrona di ``pagina_keyset``"""
+    righe = [riga async for riga in _ordina_e_filtra(queryset, cursore)[:dimensione + 1]]
+    return _taglia(righe, dimensione)
+
+
+def pagina_keyset_unita(querysets, cursore=None, dimensione=PAGINA_APPUNTAMENTI):
+    """
+    Come ``pagina_keyset`` su più queryset insieme: da ognuno bastano
+    ``dimensione + 1`` righe dopo il cursore, ognuna con la sua query a indice.
+    """
+    righe = _unisci(list(_ordina_e_filtra(queryset, cursore)[:dimensione + 1]) for queryset in querysets)
+    return _taglia(righe, dimensione)
+
+
+async def apagina_keyset_unita(querysets, cursore=None, dimensione=PAGINA_APPUNTAMENTI):
+    """Versione asincrona di ``pagina_keyset_unita``"""
+    righe = _unisci([
+        [riga async for riga in _ordina_e_filtra(queryset, cursore)[:dimensione + 1]]
+        for queryset in querysets
+    ])
+    return _taglia(righe, dimensione)
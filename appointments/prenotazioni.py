@@ -0,0 +1,231 @@
+"""
+Servizio di prenotazione: l'unico punto da cui si scrivono gli appuntamenti.
+
+Il controllo di sovrapposizione fatto dal form non basta: due clienti che
+prenotano lo stesso slot nello stesso istante passano entrambi la
+validazione. Qui il controllo e il salvataggio avvengono nella stessa
+transazione, serializzata per barbiere con un lock sulla sua riga:
+le prenotazioni per barbieri diversi continuano a procedere in parallelo.
+
+Le operazioni in blocco dell'admin (``conferma_in_blocco``,
+``cambia_stato_in_blocco``) scrivono con UPDATE sull'insieme invece di un
+save() per riga: i segnali non partono, quindi invalidano loro le agende
+dei barbieri coinvolti e aggiornano il riepilogo giornaliero.
+
+Le cancellazioni promuovono la lista d'attesa (attesa.py) nella stessa
+transazione e sotto lo stesso lock: il posto liberato non resta mai vuoto
+con qualcuno in attesa, né va a due persone.
+"""
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import attesa, coda, disponibilita, riepilogo
+from .disponibilita import STATI_OCCUPANTI, carica_agenda, carica_agende_giorni, giorno_e_minuto
+from .models import Appuntamento, Barbiere
+
+# id per UPDATE ... WHERE id IN (...): sotto il limite di parametri di SQLite
+LOTTO_ID = 500
+
+
+class EsitoPrenotazione:
+    """Risultato di una prenotazione: o l'appuntamento salvato o un conflitto"""
+
+    def __init__(self, appuntamento, conflitto=False, messaggio=''):
+        self.appuntamento = appuntamento
+        self.conflitto = conflitto
+        self.messaggio = messaggio
+
+    def __bool__(self):
+        return not self.conflitto
+
+    def __repr__(self):
+        return f"<EsitoPrenotazione {'conflitto' if self.conflitto else 'ok'}: {self.appuntamento}>"
+
+
+def _blocca_barbiere(barbiere_id):
+    """
+    Serializza le scritture sull'agenda di un barbiere fino al commit.
+    Deve essere la prima istruzione della transazione.
+    """
+    if connection.features.has_select_for_update:
+        list(Barbiere.objects.select_for_update().filter(pk=barbiere_id).values_list('pk'))
+    elif getattr(connection, 'transaction_mode', None) in ('IMMEDIATE', 'EXCLUSIVE'):
+        # SQLite con BEGIN IMMEDIATE (barber_shop/database.py): il lock di
+        # scrittura è già preso all'apertura della transazione
+        return
+    else:
+        # SQLite ignora FOR UPDATE: un UPDATE che non cambia nulla prende
+        # subito il lock di scrittura e fa attendere le altre prenotazioni
+        Barbiere.objects.filter(pk=barbiere_id).update(attivo=F('attivo'))
+
+
+def salva_appuntamento(appuntamento):
+    """
+    Crea o sposta un appuntamento solo se il servizio entra nell'agenda
+    del barbiere al momento del commit. Non solleva eccezioni per i
+    conflitti: restituisce un EsitoPrenotazione da controllare.
+    Una nuova prenotazione confermata accoda l'email di conferma.
+    """
+    # Letture fuori dalla transazione: il lock deve essere la prima istruzione
+    durata = appuntamento.servizio.durata_minuti
+    giorno, minuto = giorno_e_minuto(appuntamento.data_ora)
+    nuovo = appuntamento.pk is None
+
+    with transaction.atomic():
+        _blocca_barbiere(appuntamento.barbiere_id)
+
+        if appuntamento.stato in STATI_OCCUPANTI:
+            agenda = carica_agenda(appuntamento.barbiere_id, giorno, escludi_id=appuntamento.pk)
+            if not agenda.entra(minuto, durata):
+                return EsitoPrenotazione(
+                    appuntamento,
+                    conflitto=True,
+                    messaggio='Questo orario è appena stato prenotato da un altro cliente. Scegli un altro slot.',
+                )
+
+        appuntamento.save()
+        if nuovo and appuntamento.stato in STATI_OCCUPANTI:
+            coda.accoda('conferma_prenotazione', appuntamento_id=appuntamento.pk)
+
+    return EsitoPrenotazione(appuntamento)
+
+
+def cancella_e_promuovi(appuntamento):
+    """
+    Cancella un appuntamento e conferma, nella stessa transazione, le attese
+    che entrano nel posto liberato. Restituisce gli appuntamenti promossi.
+    """
+    durata = appuntamento.servizio.durata_minuti
+    giorno, minuto = giorno_e_minuto(appuntamento.data_ora)
+    occupava = appuntamento.stato in STATI_OCCUPANTI
+
+    with transaction.atomic():
+        _blocca_barbiere(appuntamento.barbiere_id)
+        appuntamento.stato = 'cancellato'
+        appuntamento.save()  # il segnale post_save libera lo slot nella cache delle agende
+        if not occupava:
+            return []
+        return attesa.promuovi(appuntamento.barbiere_id, giorno, minuto, minuto + durata)
+
+
+def iscrivi_in_attesa(richiesta):
+    """
+    Salva una RichiestaAttesa; se nella sua finestra c'è già posto viene
+    promossa subito. Restituisce l'appuntamento confermato o None.
+    """
+    with transaction.atomic():
+        _blocca_barbiere(richiesta.barbiere_id)
+        richiesta.save()
+        attesa.promuovi(
+            richiesta.barbiere_id, richiesta.giorno, attesa.minuti(richiesta.dalle), attesa.minuti(richiesta.alle)
+        )
+        richiesta.refresh_from_db(fields=['promossa_il', 'appuntamento'])
+    return richiesta.appuntamento
+
+
+def _invalida_barbieri(barbieri_ids):
+    """Come i segnali: subito e di nuovo al commit"""
+    def invalida():
+        for barbiere_id in barbieri_ids:
+            disponibilita.invalida_barbiere(barbiere_id)
+    invalida()
+    transaction.on_commit(invalida)
+
+
+def _barbieri(queryset):
+    """
+    Barbieri degli appuntamenti di ``queryset``, da leggere prima della
+    transazione: il lock sui barbieri deve esserne la prima istruzione
+    """
+    return sorted(set(queryset.order_by().values_list('barbiere_id', flat=True).distinct()))
+
+
+def _blocca_barbieri(barbieri_ids):
+    for barbiere_id in barbieri_ids:
+        _blocca_barbiere(barbiere_id)
+
+
+def cambia_stato_in_blocco(queryset, stato):
+    """
+    Porta a ``stato`` gli appuntamenti di ``queryset`` con un solo UPDATE.
+    Per confermare usare ``conferma_in_blocco``, che controlla le sovrapposizioni.
+    Restituisce il numero di appuntamenti modificati.
+    """
+    if stato in STATI_OCCUPANTI:
+        raise ValueError("Per confermare usare conferma_in_blocco")
+    queryset = queryset.exclude(stato=stato)
+    barbieri = _barbieri(queryset)
+    if not barbieri:
+        return 0
+    with transaction.atomic():
+        _blocca_barbieri(barbieri)
+        # Sotto il lock: gli stati letti per il riepilogo sono quelli che l'UPDATE cambia
+        variazioni = riepilogo.variazioni_cambio_stato(queryset, stato)
+        # Appuntamenti spostati su un altro barbiere nel frattempo
+        _blocca_barbieri(sorted({barbiere_id for _, barbiere_id, _, _, _ in variazioni} - set(barbieri)))
+        modificati = queryset.update(stato=stato, modificato_il=timezone.now())
+        riepilogo.registra(variazioni)
+        _invalida_barbieri(sorted({barbiere_id for _, barbiere_id, _, _, _ in variazioni}))
+        if stato == 'cancellato':
+            # Giornate in cui si è liberato almeno un posto
+            liberati = sorted({
+                (barbiere_id, giorno) for quanti, barbiere_id, giorno, _, precedente in variazioni
+                if quanti < 0 and precedente in STATI_OCCUPANTI
+            })
+            for barbiere_id, giorno in liberati:
+                attesa.promuovi(barbiere_id, giorno)
+    return modificati
+
+
+def conferma_in_blocco(queryset):
+    """
+    Conferma gli appuntamenti di ``queryset`` che entrano ancora nelle agende.
+    Le agende coinvolte si leggono con una query, i controlli sono in memoria
+    (anche tra gli appuntamenti selezionati, in ordine di data) e le scritture
+    sono UPDATE a lotti. Restituisce (confermati, in conflitto).
+    """
+    queryset = queryset.exclude(stato__in=STATI_OCCUPANTI)
+    barbieri = _barbieri(queryset)
+    if not barbieri:
+        return 0, 0
+
+    with transaction.atomic():
+        _blocca_barbieri(barbieri)
+        # Sotto il lock: una cancellazione concorrente non può cambiare lo
+        # stato tra la lettura e l'UPDATE (e falsare il riepilogo)
+        candidati = list(
+            queryset.order_by('data_ora', 'id')
+            .values_list('id', 'barbiere_id', 'data_ora', 'servizio__durata_minuti', 'servizio_id', 'stato')
+        )
+        if not candidati:
+            return 0, 0
+        # Appuntamenti spostati su un altro barbiere nel frattempo
+        _blocca_barbieri(sorted({candidato[1] for candidato in candidati} - set(barbieri)))
+        barbieri = sorted({candidato[1] for candidato in candidati})
+
+        giorni = [giorno_e_minuto(candidato[2]) for candidato in candidati]
+        # Solo i giorni con candidati di ogni barbiere, non tutto l'intervallo tra il primo e l'ultimo
+        agende = carica_agende_giorni({
+            (candidato[1], giorno) for candidato, (giorno, _) in zip(candidati, giorni)
+        })
+        accettati, variazioni = [], []
+        for (pk, barbiere_id, _, durata, servizio_id, stato), (giorno, minuto) in zip(candidati, giorni):
+            agenda = agende[barbiere_id][giorno]
+            if agenda.entra(minuto, durata):
+                agenda.occupa(minuto, durata)
+                accettati.append(pk)
+                variazioni += [
+                    (-1, barbiere_id, giorno, servizio_id, stato),
+                    (1, barbiere_id, giorno, servizio_id, STATI_OCCUPANTI[0]),
+                ]
+
+        adesso = timezone.now()
+        confermati = 0
+        for inizio in range(0, len(accettati), LOTTO_ID):
+            confermati += Appuntamento.objects.filter(id__in=accettati[inizio:inizio + LOTTO_ID]).exclude(
+                stato__in=STATI_OCCUPANTI
+            ).update(stato=STATI_OCCUPANTI[0], modificato_il=adesso)
+        riepilogo.registra(variazioni)
+        _invalida_barbieri(barbieri)
+    return confermati, len(candidati) - len(accettati)
@@ -0,0 +1,97 @@
+"""
+Email di conferma e promemoria degli appuntamenti, inviate dalla coda dei
+lavori (vedi coda.py e lavori.py), mai dentro la richiesta.
+
+Lo scheduler (``pianifica``, lavoro periodico ogni PERIODO) non scorre la
+tabella: legge solo gli appuntamenti confermati con data_ora nella finestra
+[adesso, adesso + anticipo + PERIODO), un intervallo sull'indice
+app_data_id_idx. Per ognuno accoda un lavoro "invia_promemoria" da eseguire
+PROMEMORIA_ANTICIPO_ORE prima, con chiave appuntamento + orario: i giri
+successivi che rivedono lo stesso appuntamento non lo accodano di nuovo, uno
+spostato riceve il promemoria per il nuovo orario.
+
+Il lavoro ricontrolla l'appuntamento prima di inviare: cancellato o spostato
+nel frattempo, il promemoria non parte.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.utils import timezone
+
+from . import coda
+from .models import Appuntamento
+
+PERIODO = timedelta(minutes=15)
+STATO_DA_RICORDARE = 'confermato'
+FORMATO_DATA = '%d/%m/%Y alle %H:%M'
+
+
+def anticipo():
+    return timedelta(hours=settings.PROMEMORIA_ANTICIPO_ORE)
+
+
+def chiave(appuntamento_id, data_ora):
+    return f'promemoria:{appuntamento_id}:{int(data_ora.timestamp())}'
+
+
+def da_ricordare(dal, al):
+    """(id, data_ora) degli appuntamenti confermati con data_ora in [dal, al)"""
+    return (
+        Appuntamento.objects.filter(data_ora__gte=dal, data_ora__lt=al, stato=STATO_DA_RICORDARE)
+        .order_by()
+        .values_list('id', 'data_ora')
+    )
+
+
+def pianifica(adesso=None):
+    """Accoda i promemoria che scadono entro il prossimo giro; restituisce gli appuntamenti visti"""
+    adesso = adesso or timezone.now()
+    righe = list(da_ricordare(adesso, adesso + anticipo() + PERIODO))
+    coda.accoda_in_blocco(
+        (
+            'invia_promemoria',
+            {'appuntamento_id': pk, 'data_ora': data_ora.isoformat()},
+            max(adesso, data_ora - anticipo()),
+            chiave(pk, data_ora),
+        )
+        for pk, data_ora in righe
+    )
+    return len(righe)
+
+
+def _appuntamento(appuntamento_id):
+    return (
+        Appuntamento.objects.select_related('cliente', 'barbiere', 'servizio')
+        .filter(pk=appuntamento_id, stato=STATO_DA_RICORDARE)
+        .first()
+    )
+
+
+def _invia(appuntamento, oggetto, introduzione):
+    quando = timezone.localtime(appuntamento.data_ora).strftime(FORMATO_DATA)
+    send_mail(
+        oggetto,
+        f"Ciao {appuntamento.cliente.nome},\n\n"
+        f"{introduzione}: {appuntamento.servizio.nome} con {appuntamento.barbiere.nome} "
+        f"il {quando}.\n\nA presto!\nBarbershop",
+        None,
+        [appuntamento.cliente.email],
+    )
+
+
+def invia_conferma(appuntamento_id):
+    appuntamento = _appuntamento(appuntamento_id)
+    if appuntamento is None:
+        return False
+    _invia(appuntamento, "Appuntamento confermato", "il tuo appuntamento è confermato")
+    return True
+
+
+def invia_promemoria(appuntamento_id, data_ora):
+    """Promemoria per l'orario ``data_ora`` (ISO); niente se nel frattempo è cambiato"""
+    appuntamento = _appuntamento(appuntamento_id)
+    if appuntamento is None or appuntamento.data_ora != datetime.fromisoformat(data_ora) or appuntamento.is_passato():
+        return False
+    _invia(appuntamento, "Promemoria appuntamento", "ti ricordiamo il tuo appuntamento")
+    return True
@@ -0,0 +1,130 @@
+"""
+Ricerca full-text di clienti e note degli appuntamenti.
+
+Su SQLite la migrazione 0008 crea due tabelle FTS5 con tokenizer trigram:
+``appointments_ricerca_cliente`` (nome, email e telefono in sole cifre) e
+``appointments_ricerca_nota`` (note non vuote degli appuntamenti). Le tengono
+allineate dei trigger, che valgono anche per bulk_create, update() e SQL
+diretto. Il trigram trova le sottostringhe come il LIKE '%...%' della
+ricerca standard dell'admin, ma passando da un indice invece di scorrere
+le tabelle (vedi scripts/bench_ricerca.py).
+
+Come nell'admin ogni parola cercata deve comparire. Le parole di meno di
+MINIMO caratteri non sono indicizzabili: l'admin le cerca con LIKE solo tra
+le righe già trovate dall'indice. Senza FTS5 (altri database) si usa la
+ricerca standard.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.text import smart_split, unescape_string_literal
+
+from .models import Appuntamento, Cliente
+
+TABELLA_CLIENTI = 'appointments_ricerca_cliente'
+TABELLA_NOTE = 'appointments_ricerca_nota'
+MINIMO = 3
+RISULTATI = 20
+
+_SEPARATORI_TELEFONO = re.compile(r'[\s\-()+]')
+
+
+_presenti = {}
+
+
+def disponibile(using):
+    """True se il database ``using`` ha le tabelle FTS5 (controllato una volta per file)"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    # Per nome del database: i test passano da db.sqlite3 al database di test
+    chiave = (using, str(connection.settings_dict['NAME']))
+    if chiave not in _presenti:
+        _presenti[chiave] = TABELLA_CLIENTI in connection.introspection.table_names()
+    return _presenti[chiave]
+
+
+def dividi(testo):
+    """(parole indicizzabili, parole troppo corte) del testo cercato, come le divide l'admin"""
+    lunghe, corte = [], []
+    for parola in smart_split(testo):
+        if parola.startswith(('"', "'")) and parola[0] == parola[-1]:
+            parola = unescape_string_literal(parola)
+        (lunghe if len(parola) >= MINIMO else corte).append(parola)
+    return lunghe, corte
+
+
+def espressione(parole):
+    """Query MATCH di FTS5: tutte le parole, ognuna come sottostringa"""
+    frasi = []
+    for parola in parole:
+        frase = '"' + parola.replace('"', '""') + '"'
+        # Un numero di telefono scritto con spazi o trattini: si cerca anche in sole cifre
+        cifre = _SEPARATORI_TELEFONO.sub('', parola)
+        if cifre != parola and cifre.isdigit() and len(cifre) >= MINIMO:
+            frase = f'({frase} OR "{cifre}")'
+        frasi.append(frase)
+    return ' AND '.join(frasi)
+
+
+def _trovati(tabella, parole):
+    return RawSQL(f'SELECT rowid FROM {tabella} WHERE {tabella} MATCH %s', [espressione(parole)])
+
+
+def filtra_clienti(queryset, parole):
+    return queryset.filter(id__in=_trovati(TABELLA_CLIENTI, parole))
+
+
+def filtra_appuntamenti(queryset, parole, note=True):
+    """Appuntamenti del cliente cercato o, con ``note``, con le parole nelle note"""
+    condizione = Q(cliente_id__in=_trovati(TABELLA_CLIENTI, parole))
+    if note:
+        condizione |= Q(id__in=_trovati(TABELLA_NOTE, parole))
+    return queryset.filter(condizione)
+
+
+def _per_pertinenza(using, tabella, parole, colonne='rowid'):
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'SELECT {colonne} FROM {tabella} WHERE {tabella} MATCH %s ORDER BY rank LIMIT %s',
+            [espressione(parole), RISULTATI],
+        )
+        return cursor.fetchall()
+
+
+def cerca(testo, using):
+    """
+    Clienti e appuntamenti più pertinenti (bm25) per ``testo``, al massimo
+    RISULTATI per tipo; per le note anche un estratto con le parole trovate.
+    Restituisce None se il testo non ha parole di almeno MINIMO caratteri.
+    """
+    parole, _ = dividi(testo)
+    if not parole:
+        return None
+
+    if disponibile(using):
+        ids_clienti = [pk for pk, in _per_pertinenza(using, TABELLA_CLIENTI, parole)]
+        # snippet conta i token: con il trigram 64 sono circa 64 caratteri di nota
+        note = dict(_per_pertinenza(using, TABELLA_NOTE, parole, f"rowid, snippet({TABELLA_NOTE}, 0, '[', ']', '…', 64)"))
+        clienti = Cliente.objects.using(using).in_bulk(ids_clienti)
+        appuntamenti = Appuntamento.objects.using(using).select_related('cliente', 'barbiere').in_bulk(list(note))
+        return {
+            'clienti': [clienti[pk] for pk in ids_clienti if pk in clienti],
+            'appuntamenti': [(appuntamenti[pk], estratto) for pk, estratto in note.items() if pk in appuntamenti],
+        }
+
+    # Senza FTS5: LIKE sulle stesse colonne
+    condizione_clienti, condizione_note = Q(), Q()
+    for parola in parole:
+        condizione_clienti &= Q(nome__icontains=parola) | Q(email__icontains=parola) | Q(telefono__icontains=parola)
+        condizione_note &= Q(note__icontains=parola)
+    return {
+        'clienti': list(Cliente.objects.using(using).filter(condizione_clienti).order_by('nome')[:RISULTATI]),
+        'appuntamenti': [
+            (appuntamento, appuntamento.note)
+            for appuntamento in Appuntamento.objects.using(using).select_related('cliente', 'barbiere')
+            .filter(condizione_note).order_by('-data_ora')[:RISULTATI]
+        ],
+    }
@@ -0,0 +1,206 @@
+"""
+Riepilogo giornaliero per barbiere e servizio (RiepilogoGiornaliero).
+
+Ogni appuntamento conta nella riga (giorno locale, barbiere, servizio):
+confermati e completati con un appuntamento, la durata e il prezzo del
+servizio; i cancellati con una cancellazione; quelli in attesa per niente.
+
+A ogni salvataggio o eliminazione (signals.py) e nelle operazioni in blocco
+(prenotazioni.py) si toglie il contributo vecchio e si aggiunge il nuovo
+con UPDATE ... SET campo = campo + delta, nella stessa transazione
+dell'appuntamento. Archiviare e ripristinare non cambiano i totali: il
+riepilogo copre entrambe le tabelle.
+
+Durata e prezzo sono quelli del servizio al momento del conteggio. Quando
+cambiano, i segnali accodano il lavoro ``ricostruisci_riepilogo`` che
+ricalcola i giorni di quel servizio da oggi in poi: i giorni passati restano
+con la tariffa di allora. Le variazioni successive su un giorno passato
+(es. una cancellazione tardiva) usano però la tariffa nuova, e
+``ricostruisci`` senza ``dal`` riporta tutto lo storico alla tariffa attuale.
+``ricostruisci`` riempie anche la tabella la prima volta
+(python manage.py ricostruisci_riepilogo) e dopo scritture che saltano i
+segnali (bulk_create, SQL diretto).
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+
+from .catalogo import catalogo
+from .disponibilita import APERTURA, CHIUSURA, giorno_locale, intervallo_giorni
+from .models import Appuntamento, AppuntamentoArchiviato, RiepilogoGiornaliero, Servizio
+
+STATI_PRENOTATI = ('confermato', 'completato')
+STATO_CANCELLATO = 'cancellato'
+CAMPI = ('appuntamenti', 'minuti', 'ricavo', 'cancellati')
+LOTTO = 1000
+
+# Minuti di apertura di una giornata, per l'occupazione delle poltrone
+MINUTI_APERTURA = int(
+    (datetime.combine(date.min, CHIUSURA) - datetime.combine(date.min, APERTURA)).total_seconds() // 60
+)
+
+
+def _servizi(ids):
+    """{id: (durata, prezzo)} dal catalogo in cache, dal database per quelli che mancano"""
+    servizi = {servizio.pk: (servizio.durata_minuti, servizio.prezzo) for servizio in catalogo().servizi}
+    mancanti = set(ids) - set(servizi)
+    if mancanti:
+        servizi.update(
+            (pk, (durata, prezzo))
+            for pk, durata, prezzo in Servizio.objects.filter(pk__in=mancanti).values_list('pk', 'durata_minuti', 'prezzo')
+        )
+    return servizi
+
+
+def _applica(using, giorno, barbiere_id, servizio_id, delta):
+    righe = RiepilogoGiornaliero.objects.using(using).filter(
+        giorno=giorno, barbiere_id=barbiere_id, servizio_id=servizio_id
+    )
+    incrementi = {campo: F(campo) + valore for campo, valore in zip(CAMPI, delta) if valore}
+    if righe.update(**incrementi):
+        return
+    try:
+        with transaction.atomic(using=using):
+            RiepilogoGiornaliero.objects.using(using).create(
+                giorno=giorno, barbiere_id=barbiere_id, servizio_id=servizio_id, **dict(zip(CAMPI, delta))
+            )
+    except IntegrityError:
+        # Creata nel frattempo da un'altra transazione
+        righe.update(**incrementi)
+
+
+def registra(variazioni, using=None):
+    """
+    Aggiorna i riepiloghi con ``variazioni``: tuple (quanti, barbiere_id,
+    giorno, servizio_id, stato), con ``quanti`` positivo per gli appuntamenti
+    che entrano in quello stato e negativo per quelli che ne escono.
+    Una query per riga di riepilogo toccata.
+    """
+    servizi = _servizi({variazione[3] for variazione in variazioni})
+    totali = defaultdict(lambda: [0, 0, Decimal(0), 0])
+    for quanti, barbiere_id, giorno, servizio_id, stato in variazioni:
+        totale = totali[giorno, barbiere_id, servizio_id]
+        if stato in STATI_PRENOTATI:
+            durata, prezzo = servizi.get(servizio_id, (0, Decimal(0)))
+            totale[0] += quanti
+            totale[1] += quanti * durata
+            totale[2] += quanti * prezzo
+        elif stato == STATO_CANCELLATO:
+            totale[3] += quanti
+    for (giorno, barbiere_id, servizio_id), delta in totali.items():
+        if any(delta):
+            _applica(using, giorno, barbiere_id, servizio_id, delta)
+
+
+def variazione(quanti, appuntamento):
+    """La variazione di un singolo appuntamento (o della sua tupla barbiere, data_ora, servizio, stato)"""
+    if isinstance(appuntamento, tuple):
+        barbiere_id, data_ora, servizio_id, stato = appuntamento
+    else:
+        barbiere_id, data_ora = appuntamento.barbiere_id, appuntamento.data_ora
+        servizio_id, stato = appuntamento.servizio_id, appuntamento.stato
+    return (quanti, barbiere_id, giorno_locale(data_ora), servizio_id, stato)
+
+
+def variazioni_cambio_stato(queryset, stato):
+    """
+    Variazioni per portare a ``stato`` gli appuntamenti di ``queryset``, con
+    una query raggruppata per giorno invece di leggere ogni riga
+    """
+    gruppi = (
+        queryset.order_by()
+        .annotate(giorno=TruncDate('data_ora'))
+        .values_list('barbiere_id', 'giorno', 'servizio_id', 'stato')
+        .annotate(Count('id'))
+    )
+    variazioni = []
+    for barbiere_id, giorno, servizio_id, precedente, quanti in gruppi:
+        variazioni += [
+            (-quanti, barbiere_id, giorno, servizio_id, precedente),
+            (quanti, barbiere_id, giorno, servizio_id, stato),
+        ]
+    return variazioni
+
+
+def _aggrega(modello, filtro):
+    prenotati = Q(stato__in=STATI_PRENOTATI)
+    return (
+        modello.objects.filter(filtro)
+        .annotate(giorno=TruncDate('data_ora'))
+        .values_list('giorno', 'barbiere_id', 'servizio_id')
+        .order_by()
+        .annotate(
+            n_appuntamenti=Count('id', filter=prenotati),
+            n_minuti=Sum('servizio__durata_minuti', filter=prenotati),
+            n_ricavo=Sum('servizio__prezzo', filter=prenotati),
+            n_cancellati=Count('id', filter=Q(stato=STATO_CANCELLATO)),
+        )
+    )
+
+
+def ricostruisci(dal=None, al=None, servizi=None):
+    """
+    Ricalcola dalle tabelle degli appuntamenti i riepiloghi dei giorni da
+    ``dal`` ad ``al`` (compresi, default tutti) e dei ``servizi`` (id, default
+    tutti). Restituisce il numero di righe scritte.
+    """
+    filtro, filtro_riepilogo = Q(), Q()
+    if dal:
+        filtro &= Q(data_ora__gte=intervallo_giorni(dal)[0])
+        filtro_riepilogo &= Q(giorno__gte=dal)
+    if al:
+        filtro &= Q(data_ora__lt=intervallo_giorni(al)[1])
+        filtro_riepilogo &= Q(giorno__lte=al)
+    if servizi is not None:
+        filtro &= Q(servizio_id__in=servizi)
+        filtro_riepilogo &= Q(servizio_id__in=servizi)
+
+    with transaction.atomic():
+        # Prima la DELETE: su SQLite prende subito il lock di scrittura e le
+        # prenotazioni concorrenti aspettano invece di andare perse
+        RiepilogoGiornaliero.objects.filter(filtro_riepilogo).delete()
+        totali = defaultdict(lambda: [0, 0, Decimal(0), 0])
+        for modello in (Appuntamento, AppuntamentoArchiviato):
+            for giorno, barbiere_id, servizio_id, *valori in _aggrega(modello, filtro):
+                totale = totali[giorno, barbiere_id, servizio_id]
+                for indice, valore in enumerate(valori):
+                    totale[indice] += valore or 0
+        RiepilogoGiornaliero.objects.bulk_create(
+            (
+                RiepilogoGiornaliero(
+                    giorno=giorno, barbiere_id=barbiere_id, servizio_id=servizio_id, **dict(zip(CAMPI, valori))
+                )
+                for (giorno, barbiere_id, servizio_id), valori in totali.items()
+            ),
+            batch_size=LOTTO,
+        )
+    return len(totali)
+
+
+def totali(dal, al, per):
+    """
+    Somme dei riepiloghi dei giorni da ``dal`` ad ``al`` raggruppate per i campi
+    ``per`` (es. ['barbiere_id']), con i giorni con almeno un appuntamento
+    """
+    righe = (
+        RiepilogoGiornaliero.objects.filter(giorno__range=(dal, al))
+        .values(*per)
+        .order_by(*per)
+        .annotate(
+            giorni=Count('giorno', distinct=True, filter=Q(appuntamenti__gt=0)),
+            **{f'totale_{campo}': Sum(campo) for campo in CAMPI},
+        )
+    )
+    return [
+        {**{campo: riga[campo] for campo in (*per, 'giorni')}, **{campo: riga[f'totale_{campo}'] for campo in CAMPI}}
+        for riga in righe
+    ]
+
+
+def occupazione(minuti, giorni):
+    """Percentuale dell'orario di apertura occupata in ``giorni`` giornate di lavoro"""
+    return round(100 * minuti / (giorni * MINUTI_APERTURA), 1) if giorni else 0
@@ -0,0 +1,128 @@
+"""
+Router lettura/scrittura per l'app appointments.
+
+Le scritture vanno sempre al primario (``default``); le letture a una delle
+repliche in DATABASE_REPLICHE, scelta a caso. Restano sul primario:
+
+- le letture dentro una transazione del primario (es. il controllo delle
+  sovrapposizioni in prenotazioni.py, che deve vedere l'ultimo commit);
+- tutte le letture di una richiesta che scrive (POST, ...) e di quelle
+  dello stesso client nei REPLICHE_PRIMARIO_SECONDI successivi, così chi
+  ha appena prenotato o cancellato vede subito la modifica anche se la
+  replica è in ritardo (cookie impostato da PrimarioDopoScritturaMiddleware);
+- il codice dentro ``with usa_primario():``.
+
+Senza repliche configurate tutto va su ``default`` come prima.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+COOKIE_PRIMARIO = 'primario_fino'
+METODI_SICURI = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_solo_primario = ContextVar('router_solo_primario', default=False)
+
+
+def repliche():
+    return getattr(settings, 'DATABASE_REPLICHE', [])
+
+
+@contextmanager
+def usa_primario():
+    """Letture del blocco sul primario"""
+    token = _solo_primario.set(True)
+    try:
+        yield
+    finally:
+        _solo_primario.reset(token)
+
+
+class RouterLetturaScrittura:
+    app_labels = {'appointments'}
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in self.app_labels:
+            return None
+        disponibili = repliche()
+        if (
+            not disponibili
+            or _solo_primario.get()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(disponibili)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in self.app_labels:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primario e repliche hanno gli stessi dati
+        stesso_gruppo = {DEFAULT_DB_ALIAS, *repliche()}
+        if obj1._state.db in stesso_gruppo and obj2._state.db in stesso_gruppo:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Lo schema delle repliche arriva dal primario
+        if db in repliche():
+            return False
+        return None
+
+
+class PrimarioDopoScritturaMiddleware:
+    """
+    Read-your-writes: dopo una richiesta che scrive, per qualche secondo le
+    letture dello stesso client vanno al primario. Senza repliche Django lo
+    scarta all'avvio.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not repliche():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.durata = getattr(settings, 'REPLICHE_PRIMARIO_SECONDI', 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def primario(self, request):
+        if request.method not in METODI_SICURI:
+            return True
+        try:
+            return float(request.COOKIES.get(COOKIE_PRIMARIO, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def concludi(self, request, response):
+        if request.method not in METODI_SICURI and response.status_code < 400:
+            response.set_cookie(
+                COOKIE_PRIMARIO, str(int(time.time() + self.durata)),
+                max_age=self.durata, httponly=True, samesite='Lax',
+            )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.primario(request):
+            return self.get_response(request)
+        with usa_primario():
+            response = self.get_response(request)
+        return self.concludi(request, response)
+
+    async def __acall__(self, request):
+        if not self.primario(request):
+            return await self.get_response(request)
+        with usa_primario():
+            response = await self.get_response(request)
+        return self.concludi(request, response)
@@ -0,0 +1,162 @@
+"""
+Segnali dell'app appointments.
+
+Tengono allineate con il database la cache delle agende (vedi
+``disponibilita.py``), dove ogni salvataggio invalida esattamente le giornate
+coinvolte, quella utente -> cliente (vedi ``middleware.py``) e il catalogo
+di barbieri e servizi (vedi ``catalogo.py``). Aggiornano il riepilogo
+giornaliero (vedi ``riepilogo.py``) e accodano la generazione delle varianti
+delle foto dei barbieri (vedi ``immagini.py`` e ``coda.py``).
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import archivio, catalogo, coda, disponibilita, riepilogo
+from .middleware import invalida_cliente_utente
+from .models import Appuntamento, AppuntamentoArchiviato, Barbiere, Cliente, Servizio
+
+
+def _invalida(funzione, *args):
+    """
+    Invalida subito e di nuovo al commit: una richiesta concorrente potrebbe
+    aver rimesso in cache i dati vecchi prima che la transazione finisse.
+    """
+    funzione(*args)
+    transaction.on_commit(lambda: funzione(*args))
+
+
+@receiver(pre_save, sender=Appuntamento)
+def ricorda_giornata_precedente(sender, instance, using, **kwargs):
+    """Memorizza barbiere, giorno, servizio e stato prima della modifica (spostamenti e riepilogo)"""
+    instance._giornata_precedente = None
+    instance._precedente = None
+    if instance.pk:
+        # Dal database su cui si scrive, non da una replica in ritardo
+        precedente = (
+            Appuntamento.objects.using(using).filter(pk=instance.pk)
+            .values_list('barbiere_id', 'data_ora', 'servizio_id', 'stato')
+            .first()
+        )
+        if precedente:
+            barbiere_id, data_ora, _, _ = precedente
+            instance._giornata_precedente = (barbiere_id, disponibilita.giorno_locale(data_ora))
+            instance._precedente = precedente
+
+
+@receiver(post_save, sender=Appuntamento)
+def invalida_agenda_appuntamento(sender, instance, **kwargs):
+    """Nuovo appuntamento, spostamento o cambio di stato (es. cancellazione)"""
+    giornate = {(instance.barbiere_id, disponibilita.giorno_locale(instance.data_ora))}
+    precedente = getattr(instance, '_giornata_precedente', None)
+    if precedente:
+        giornate.add(precedente)
+    for barbiere_id, giorno in giornate:
+        _invalida(disponibilita.invalida_giorno, barbiere_id, giorno)
+
+
+@receiver(post_save, sender=Appuntamento)
+def aggiorna_riepilogo_appuntamento(sender, instance, using, **kwargs):
+    variazioni = [riepilogo.variazione(1, instance)]
+    precedente = getattr(instance, '_precedente', None)
+    if precedente:
+        variazioni.append(riepilogo.variazione(-1, precedente))
+    riepilogo.registra(variazioni, using=using)
+
+
+@receiver(post_delete, sender=Appuntamento)
+def invalida_agenda_appuntamento_eliminato(sender, instance, **kwargs):
+    # Gli stati archiviati non occupano la poltrona
+    if archivio.in_spostamento():
+        return
+    _invalida(
+        disponibilita.invalida_giorno,
+        instance.barbiere_id,
+        disponibilita.giorno_locale(instance.data_ora),
+    )
+
+
+@receiver(post_delete, sender=Appuntamento)
+@receiver(post_delete, sender=AppuntamentoArchiviato)
+def aggiorna_riepilogo_eliminato(sender, instance, using, origin=None, **kwargs):
+    # Eliminando un barbiere o un servizio se ne vanno anche le sue righe di riepilogo
+    if getattr(origin, 'model', type(origin)) in (Barbiere, Servizio):
+        return
+    # Archivio e ripristino spostano la riga: il riepilogo conta entrambe le tabelle
+    if archivio.in_spostamento():
+        return
+    riepilogo.registra([riepilogo.variazione(-1, instance)], using=using)
+
+
+@receiver(post_save, sender=Barbiere)
+def invalida_agenda_barbiere(sender, instance, **kwargs):
+    """Un barbiere disattivato non deve più avere slot in cache"""
+    if not instance.attivo:
+        _invalida(disponibilita.invalida_barbiere, instance.pk)
+
+
+@receiver(pre_save, sender=Barbiere)
+def ricorda_foto_precedente(sender, instance, using, **kwargs):
+    instance._foto_precedente = None
+    if instance.pk:
+        instance._foto_precedente = (
+            Barbiere.objects.using(using).filter(pk=instance.pk).values_list('foto', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Barbiere)
+def genera_varianti_foto(sender, instance, **kwargs):
+    """Foto nuova: varianti ridimensionate dalla coda in background, se il salvataggio va a buon fine"""
+    foto = instance.foto
+    if foto and foto.name != getattr(instance, '_foto_precedente', None):
+        coda.accoda('varianti_foto', nome_foto=foto.name)
+
+
+@receiver(pre_save, sender=Servizio)
+def ricorda_tariffa_precedente(sender, instance, using, **kwargs):
+    instance._tariffa_precedente = None
+    if instance.pk:
+        instance._tariffa_precedente = (
+            Servizio.objects.using(using).filter(pk=instance.pk).values_list('durata_minuti', 'prezzo').first()
+        )
+
+
+@receiver(post_save, sender=Servizio)
+def ricalcola_riepilogo_servizio(sender, instance, created, **kwargs):
+    """Nuova durata o nuovo prezzo: si ricalcolano i giorni del servizio da oggi in poi, nel worker"""
+    precedente = getattr(instance, '_tariffa_precedente', None)
+    if not created and precedente and precedente != (instance.durata_minuti, instance.prezzo):
+        coda.accoda('ricostruisci_riepilogo', servizio_id=instance.pk, dal=timezone.localdate().isoformat())
+
+
+@receiver(post_save, sender=Servizio)
+@receiver(post_delete, sender=Servizio)
+def invalida_agende_servizio(sender, instance, **kwargs):
+    """La durata di un servizio entra in tutte le agende"""
+    _invalida(disponibilita.invalida_tutto)
+
+
+@receiver(post_save, sender=Barbiere)
+@receiver(post_delete, sender=Barbiere)
+@receiver(post_save, sender=Servizio)
+@receiver(post_delete, sender=Servizio)
+def invalida_catalogo(sender, instance, **kwargs):
+    _invalida(catalogo.invalida_catalogo)
+
+
+@receiver(pre_save, sender=Cliente)
+def ricorda_utente_precedente(sender, instance, using, **kwargs):
+    instance._user_id_precedente = None
+    if instance.pk:
+        instance._user_id_precedente = (
+            Cliente.objects.using(using).filter(pk=instance.pk).values_list('user_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def invalida_cliente(sender, instance, **kwargs):
+    """Il profilo è stato creato, eliminato o riassegnato a un altro utente"""
+    for user_id in {instance.user_id, getattr(instance, '_user_id_precedente', None)}:
+        _invalida(invalida_cliente_utente, user_id)
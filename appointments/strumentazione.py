@@ -0,0 +1,225 @@
+"""
+Strumentazione per richiesta: query SQL, tempo SQL, tempo di rendering dei
+template e tempo totale, anche con DEBUG spento.
+
+Le misure sono raccolte in un oggetto ``Misure`` tenuto in una ContextVar:
+un execute wrapper installato su ogni connessione e il backend di template
+``TemplateMisurati`` lo aggiornano solo se una misura è in corso, quindi
+fuori da StrumentazioneMiddleware il costo è una lettura della ContextVar.
+La ContextVar segue anche le query delle viste asincrone (sync_to_async
+copia il contesto), per cui le stesse misure valgono con WSGI e ASGI.
+
+- ``StrumentazioneMiddleware`` (opt-in con ``STRUMENTAZIONE``) aggiunge
+  l'header Server-Timing e logga le richieste oltre le soglie con il loro SQL.
+- ``@budget_query(n)`` dichiara quante query può fare una vista; con
+  ``BUDGET_QUERY_ERRORE`` (attivo in appointments/tests.py) superarlo solleva un'eccezione.
+"""
+import logging
+import time as cronometro
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+# Query SQL conservate per richiesta (per il log delle richieste lente)
+MAX_SQL = 100
+# Query mostrate nel log, dalla più lenta
+SQL_NEL_LOG = 10
+
+_misure = ContextVar('strumentazione_misure', default=None)
+
+
+class BudgetQuerySuperato(AssertionError):
+    """Una vista ha fatto più query del budget dichiarato con @budget_query"""
+
+
+class Misure:
+    """Contatori di una richiesta; tempi in millisecondi"""
+
+    __slots__ = ('query', 'sql_ms', 'template_ms', 'sql')
+
+    def __init__(self):
+        self.query = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.sql = []  # (durata_ms, sql) delle prime MAX_SQL query
+
+    def sql_piu_lente(self, dal=0, quante=SQL_NEL_LOG):
+        return sorted(self.sql[dal:], key=lambda voce: voce[0], reverse=True)[:quante]
+
+
+@contextmanager
+def misura():
+    """Raccoglie le misure del blocco; riusa quelle già in corso se ci sono"""
+    correnti = _misure.get()
+    if correnti is not None:
+        yield correnti
+        return
+    misure = Misure()
+    token = _misure.set(misure)
+    try:
+        yield misure
+    finally:
+        _misure.reset(token)
+
+
+# ===== QUERY SQL =====
+
+def _registra_query(execute, sql, params, many, context):
+    misure = _misure.get()
+    if misure is None:
+        return execute(sql, params, many, context)
+    inizio = cronometro.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        durata = (cronometro.perf_counter() - inizio) * 1000
+        misure.query += 1
+        misure.sql_ms += durata
+        if len(misure.sql) < MAX_SQL:
+            misure.sql.append((durata, sql))
+
+
+def _aggiungi_wrapper(sender, connection, **kwargs):
+    if _registra_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _registra_query)
+
+
+def installa():
+    """Aggiunge il wrapper di misura a ogni nuova connessione (da AppConfig.ready)"""
+    connection_created.connect(_aggiungi_wrapper, dispatch_uid='appointments.strumentazione')
+
+
+# ===== TEMPLATE =====
+
+class TemplateMisurato:
+    """Template del backend Django che somma il tempo di render alle misure"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, nome):
+        return getattr(self.template, nome)
+
+    def render(self, context=None, request=None):
+        misure = _misure.get()
+        if misure is None:
+            return self.template.render(context, request)
+        inizio = cronometro.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            misure.template_ms += (cronometro.perf_counter() - inizio) * 1000
+
+
+class TemplateMisurati(DjangoTemplates):
+    """Backend DjangoTemplates con misura del tempo di rendering"""
+
+    def from_string(self, template_code):
+        return TemplateMisurato(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TemplateMisurato(super().get_template(template_name))
+
+
+# ===== BUDGET DI QUERY =====
+
+def _controlla_budget(request, view, misure, prima, massimo):
+    usate = misure.query - prima
+    if usate <= massimo:
+        return
+    messaggio = f"{view.__module__}.{view.__name__}: {usate} query, budget {massimo}"
+    if getattr(settings, 'BUDGET_QUERY_ERRORE', False):
+        raise BudgetQuerySuperato(messaggio)
+    logger.warning(
+        "%s (%s %s)\n%s", messaggio, request.method, request.path,
+        '\n'.join(f"{durata:8.2f} ms  {sql}" for durata, sql in misure.sql_piu_lente(prima)),
+    )
+
+
+def budget_query(massimo):
+    """
+    Numero massimo di query di una vista (compresi sessione e utente se la
+    vista li usa). Va messo sopra gli altri decoratori della vista.
+    """
+    def decoratore(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                with misura() as misure:
+                    prima = misure.query
+                    response = await view(request, *args, **kwargs)
+                    _controlla_budget(request, view, misure, prima, massimo)
+                return response
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                with misura() as misure:
+                    prima = misure.query
+                    response = view(request, *args, **kwargs)
+                    _controlla_budget(request, view, misure, prima, massimo)
+                return response
+
+        wrapper.budget_query = massimo
+        return wrapper
+    return decoratore
+
+
+# ===== MIDDLEWARE =====
+
+class StrumentazioneMiddleware:
+    """
+    Misura ogni richiesta e aggiunge l'header Server-Timing. Le richieste
+    oltre STRUMENTAZIONE_SOGLIA_MS o STRUMENTAZIONE_SOGLIA_QUERY finiscono
+    nel log con le query più lente. Va messo in cima a MIDDLEWARE; con
+    STRUMENTAZIONE = False Django lo scarta all'avvio.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'STRUMENTAZIONE', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.soglia_ms = getattr(settings, 'STRUMENTAZIONE_SOGLIA_MS', 500)
+        self.soglia_query = getattr(settings, 'STRUMENTAZIONE_SOGLIA_QUERY', 20)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with misura() as misure:
+            inizio = cronometro.perf_counter()
+            response = self.get_response(request)
+            self.concludi(request, response, misure, inizio)
+        return response
+
+    async def __acall__(self, request):
+        with misura() as misure:
+            inizio = cronometro.perf_counter()
+            response = await self.get_response(request)
+            self.concludi(request, response, misure, inizio)
+        return response
+
+    def concludi(self, request, response, misure, inizio):
+        totale = (cronometro.perf_counter() - inizio) * 1000
+        response['Server-Timing'] = (
+            f'sql;dur={misure.sql_ms:.1f};desc="{misure.query} query", '
+            f'tpl;dur={misure.template_ms:.1f}, total;dur={totale:.1f}'
+        )
+        if totale <= self.soglia_ms and misure.query <= self.soglia_query:
+            return
+        vista = request.resolver_match.view_name if request.resolver_match else '-'
+        logger.warning(
+            "Richiesta lenta %s %s [%s]: %.1f ms, %d query (%.1f ms SQL), template %.1f ms\n%s",
+            request.method, request.path, vista, totale, misure.query, misure.sql_ms, misure.template_ms,
+            '\n'.join(f"{durata:8.2f} ms  {sql}" for durata, sql in misure.sql_piu_lente()),
+        )
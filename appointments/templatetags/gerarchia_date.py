@@ -0,0 +1,27 @@
+"""
+Barra date_hierarchy dell'admin che non scorre la tabella.
+
+    {% load gerarchia_date %}
+    {% gerarchia_date cl %}
+
+Stesso markup e stessi link del tag ``date_hierarchy`` di Django, ma i
+periodi vengono da MIN/MAX sull'indice (vedi appointments/elenchi_admin.py).
+"""
+from django import template
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+from django.contrib.admin.templatetags.base import InclusionAdminNode
+
+from ..elenchi_admin import changelist_gerarchia
+
+register = template.Library()
+
+
+def gerarchia_date(cl):
+    return date_hierarchy(changelist_gerarchia(cl))
+
+
+@register.tag(name='gerarchia_date')
+def gerarchia_date_tag(parser, token):
+    return InclusionAdminNode(
+        parser, token, func=gerarchia_date, template_name='date_hierarchy.html', takes_context=False,
+    )
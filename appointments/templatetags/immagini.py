@@ -0,0 +1,46 @@
+"""
+Tag per le foto responsive.
+
+    {% load immagini %}
+    {% foto_responsive barbiere.foto barbiere.nome sizes="250px" %}
+
+Produce un <picture> con le varianti WebP e JPEG della foto (vedi
+appointments/immagini.py): il browser scarica solo la larghezza che gli
+serve. Finché le varianti non sono pronte mostra la foto originale.
+"""
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..immagini import varianti_disponibili
+
+register = template.Library()
+
+SIZES_PREDEFINITO = '(max-width: 600px) 100vw, 250px'
+
+
+def _srcset(storage, varianti):
+    return ', '.join(f'{storage.url(nome)} {larghezza}w' for larghezza, nome in varianti)
+
+
+@register.simple_tag
+def foto_responsive(foto, alt='', sizes=SIZES_PREDEFINITO, classe='foto'):
+    if not foto:
+        return ''
+    varianti = varianti_disponibili(foto.name, foto.storage)
+    jpg = varianti['jpg']
+    if not jpg:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy">', foto.url, alt, classe)
+
+    sorgenti = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (f'image/{formato}', _srcset(foto.storage, elenco), sizes)
+            for formato, elenco in varianti.items()
+            if formato != 'jpg' and elenco
+        ),
+    )
+    # La variante JPEG più piccola è il fallback per i browser senza srcset
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy" decoding="async"></picture>',
+        sorgenti, foto.storage.url(jpg[0][1]), _srcset(foto.storage, jpg), sizes, alt, classe,
+    )
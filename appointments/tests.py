@@ -1,3 +1,1316 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import shutil
+import tempfile
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import Permission, User
+from django.core.files.base import ContentFile
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import analitica, benchmark, coda, prenotazioni, promemoria, ricerca, riepilogo, urls, views_async
+from .admin import RicercaIndicizzataMixin
+from .archivio import archivia, archiviabili, ripristina
+from .catalogo import catalogo
+from .disponibilita import (
+    AgendaGiornaliera, agenda_giornaliera, agende, azzera_statistiche_cache, griglia_slot, invalida_tutto,
+    statistiche_cache,
+)
+from .forms import AppuntamentoForm
+from .immagini import e_gia_deduplicata, genera_varianti
+from .models import (
+    Appuntamento, AppuntamentoArchiviato, Barbiere, Cliente, Lavoro, RichiestaAttesa, RiepilogoGiornaliero, Servizio,
+)
+from .paginazione import codifica_cursore
+from .prenotazioni import cambia_stato_in_blocco, cancella_e_promuovi, conferma_in_blocco, salva_appuntamento
+from .router import COOKIE_PRIMARIO, PrimarioDopoScritturaMiddleware, RouterLetturaScrittura
+from .strumentazione import BudgetQuerySuperato, budget_query
+
+# URL con le viste asincrone al posto di quelle sincrone (per ROOT_URLCONF=__name__)
+VISTE_ASYNC = {
+    'home': views_async.home,
+    'lista_appuntamenti': views_async.lista_appuntamenti,
+    'api_slot': views_async.api_slot_disponibili,
+}
+urlpatterns = [
+    path(str(url.pattern), VISTE_ASYNC.get(url.name, url.callback), name=url.name)
+    for url in urls.urlpatterns
+]
+
+# In tutti i test una vista oltre il suo @budget_query fallisce invece di loggare
+_budget_query_errore = override_settings(BUDGET_QUERY_ERRORE=True)
+
+
+def setUpModule():
+    _budget_query_errore.enable()
+
+
+def tearDownModule():
+    _budget_query_errore.disable()
+
+
+class DatiDiProvaMixin:
+    """Cliente loggato, un barbiere, un servizio e un giorno di riferimento"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('mario@example.com', password='password123')
+        self.cliente = Cliente.objects.create(
+            user=self.user, nome='Mario Rossi', email='mario@example.com', telefono='333 1234567'
+        )
+        self.barbiere = Barbiere.objects.create(nome='Giuseppe', specialita='Tagli classici')
+        self.servizio = Servizio.objects.create(
+            nome='Taglio Capelli', descrizione='Taglio', durata_minuti=30, prezzo=20
+        )
+        self.giorno = timezone.localdate() + timedelta(days=7)
+        self.client.force_login(self.user)
+
+
+class DisponibilitaDurataTest(DatiDiProvaMixin, TestCase):
+    """Agenda a minuti: un servizio lungo occupa tutti gli slot che copre"""
+
+    def setUp(self):
+        super().setUp()
+        self.lungo = Servizio.objects.create(nome='Colore', descrizione='Colore', durata_minuti=90, prezzo=50)
+        self.alle_10 = timezone.make_aware(datetime.combine(self.giorno, time(10, 0)))
+
+    def dati_form(self, data_ora, **altri):
+        return {
+            'barbiere': self.barbiere.pk, 'servizio': self.servizio.pk,
+            'data_ora': timezone.localtime(data_ora).strftime('%Y-%m-%dT%H:%M'), 'note': '', **altri,
+        }
+
+    def test_agenda_con_servizi_lunghi(self):
+        agenda = AgendaGiornaliera.da_appuntamenti(self.giorno, [(self.alle_10, 90)])
+        liberi = {ora.strftime('%H:%M') for ora in agenda.slot_liberi(30)}
+        self.assertTrue({'10:00', '10:30', '11:00'}.isdisjoint(liberi))
+        self.assertTrue({'09:30', '11:30'} <= liberi)
+        # Un servizio di un'ora alle 9:30 finirebbe dentro il colore
+        self.assertNotIn('09:30', {ora.strftime('%H:%M') for ora in agenda.slot_liberi(60)})
+        self.assertFalse(agenda.entra(17 * 60 + 30, 60))
+        self.assertEqual(len(agenda.bitmap_slot()), len(griglia_slot()))
+
+    def test_form_controlla_durata_e_stato_scelto(self):
+        Appuntamento.objects.create(
+            cliente=self.cliente, barbiere=self.barbiere, servizio=self.lungo, data_ora=self.alle_10, stato='confermato'
+        )
+        sovrapposto = self.alle_10 + timedelta(minutes=60)
+        form = AppuntamentoForm(self.dati_form(sovrapposto, stato='confermato'), instance=Appuntamento())
+        self.assertFalse(form.is_valid())
+        dopo = self.alle_10 + timedelta(minutes=90)
+        form = AppuntamentoForm(self.dati_form(dopo, stato='confermato'), instance=Appuntamento())
+        self.assertTrue(form.is_valid(), form.errors)
+
+        # In attesa non occupa la poltrona, ma confermarlo nel form va controllato
+        in_attesa = Appuntamento.objects.create(
+            cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio, data_ora=sovrapposto, stato='in_attesa'
+        )
+        self.assertTrue(AppuntamentoForm(self.dati_form(sovrapposto, stato='in_attesa'), instance=in_attesa).is_valid())
+        self.assertFalse(AppuntamentoForm(self.dati_form(sovrapposto, stato='confermato'), instance=in_attesa).is_valid())
+
+        # Dalla vista di modifica: sovrapposto resta in attesa, spostato dopo il colore viene confermato
+        url = reverse('modifica_appuntamento', args=[in_attesa.pk])
+        self.client.post(url, self.dati_form(sovrapposto, stato='confermato'))
+        self.assertEqual(Appuntamento.objects.get(pk=in_attesa.pk).stato, 'in_attesa')
+        self.assertRedirects(self.client.post(url, self.dati_form(dopo, stato='confermato')), reverse('lista_appuntamenti'))
+        in_attesa.refresh_from_db()
+        self.assertEqual((in_attesa.stato, in_attesa.data_ora), ('confermato', dopo))
+
+
+class ApiDisponibilitaTest(DatiDiProvaMixin, TestCase):
+    """Disponibilità di più barbieri su più giorni"""
+
+    def setUp(self):
+        super().setUp()
+        self.secondo = Barbiere.objects.create(nome='Luca', specialita='Barba')
+        self.inattivo = Barbiere.objects.create(nome='Franco', specialita='Pensione', attivo=False)
+        Appuntamento.objects.create(
+            cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio,
+            data_ora=timezone.make_aware(datetime.combine(self.giorno + timedelta(days=1), time(10, 0))),
+        )
+
+    def disponibilita(self, **parametri):
+        return self.client.get(reverse('api_disponibilita'), parametri)
+
+    def test_giorni_e_barbieri(self):
+        dal, al = self.giorno, self.giorno + timedelta(days=2)
+        dati = self.disponibilita(dal=dal.isoformat(), al=al.isoformat()).json()
+        self.assertEqual(set(dati['barbieri']), {str(self.barbiere.pk), str(self.secondo.pk)})
+        giorni = dati['barbieri'][str(self.barbiere.pk)]['giorni']
+        self.assertEqual(len(giorni), 3)
+        occupato = giorni[(dal + timedelta(days=1)).isoformat()]
+        self.assertEqual(occupato[dati['orari'].index('10:00')], '0')
+        self.assertEqual(occupato.count('0'), 1)
+        self.assertNotIn('0', giorni[dal.isoformat()])
+        self.assertNotIn('0', dati['barbieri'][str(self.secondo.pk)]['giorni'][(dal + timedelta(days=1)).isoformat()])
+
+        # Un barbiere disattivato non ha orari prenotabili nemmeno se chiesto per id
+        richiesti = self.disponibilita(dal=dal.isoformat(), barbieri=f'{self.secondo.pk},{self.inattivo.pk}').json()
+        self.assertEqual(list(richiesti['barbieri']), [str(self.secondo.pk)])
+
+        self.assertEqual(self.disponibilita(dal=dal.isoformat(), al=(dal - timedelta(days=1)).isoformat()).status_code, 400)
+        self.assertEqual(self.disponibilita(dal=dal.isoformat(), barbieri='x').status_code, 400)
+
+    def test_una_query_per_qualsiasi_intervallo(self):
+        def query(**parametri):
+            # Catalogo in cache, agende no
+            catalogo()
+            invalida_tutto()
+            with CaptureQueriesContext(connection) as eseguite:
+                self.assertEqual(self.disponibilita(**parametri).status_code, 200)
+            return len(eseguite)
+
+        dal = self.giorno.isoformat()
+        self.assertEqual(
+            query(dal=dal, barbieri=str(self.barbiere.pk)),
+            query(dal=dal, al=(self.giorno + timedelta(days=30)).isoformat(), servizio=self.servizio.pk),
+        )
+
+
+class CacheAgendeTest(DatiDiProvaMixin, TestCase):
+    """Ogni modifica invalida solo le giornate coinvolte"""
+
+    def setUp(self):
+        super().setUp()
+        self.secondo = Barbiere.objects.create(nome='Luca', specialita='Barba')
+        self.domani = self.giorno + timedelta(days=1)
+        self.appuntamento = Appuntamento.objects.create(
+            cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio,
+            data_ora=timezone.make_aware(datetime.combine(self.giorno, time(10, 0))),
+        )
+        azzera_statistiche_cache()
+
+    def mancanti(self):
+        """Giornate non in cache tra quelle dei due barbieri nei due giorni (poi le rimette in cache)"""
+        azzera_statistiche_cache()
+        agende([self.barbiere.pk, self.secondo.pk], self.giorno, self.domani)
+        return statistiche_cache()['miss']
+
+    def test_invalidazione_per_giornata(self):
+        self.assertEqual(self.mancanti(), 4)
+        self.assertEqual(self.mancanti(), 0)
+
+        # Spostamento: il giorno vecchio e quello nuovo, non l'altro barbiere
+        self.appuntamento.data_ora += timedelta(days=1)
+        self.appuntamento.save()
+        self.assertEqual(self.mancanti(), 2)
+        self.assertNotIn(time(10, 0), agenda_giornaliera(self.barbiere.pk, self.domani).slot_liberi())
+
+        self.appuntamento.stato = 'cancellato'
+        self.appuntamento.save()
+        self.assertEqual(self.mancanti(), 1)
+        self.assertIn(time(10, 0), agenda_giornaliera(self.barbiere.pk, self.domani).slot_liberi())
+
+        self.secondo.attivo = False
+        self.secondo.save()
+        self.assertEqual(self.mancanti(), 2)
+
+    def test_contatori_hit_miss(self):
+        agenda_giornaliera(self.barbiere.pk, self.giorno)
+        agenda_giornaliera(self.barbiere.pk, self.giorno)
+        agenda_giornaliera(self.barbiere.pk, self.giorno)
+        self.assertEqual(statistiche_cache(), {'hit': 2, 'miss': 1, 'rapporto_hit': 2 / 3})
+
+        url = reverse('api_statistiche_cache')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(url).json()['miss'], 1)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN è specifico di SQLite')
+class PianoQueryTest(DatiDiProvaMixin, TestCase):
+    """Le query calde devono usare gli indici di Appuntamento (migrazione 0003)"""
+
+    def piani(self, url, params):
+        """Piano di esecuzione di ogni query su appointments_appuntamento eseguita dalla vista"""
+        with CaptureQueriesContext(connection) as contesto:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+
+        piani = []
+        with connection.cursor() as cursor:
+            for query in contesto.captured_queries:
+                if 'FROM "appointments_appuntamento"' not in query['sql']:
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                piani.append(' | '.join(riga[-1] for riga in cursor.fetchall()))
+        self.assertTrue(piani, 'nessuna query sugli appuntamenti')
+        return piani
+
+    def test_lista_filtrata_per_data_usa_indice_cliente(self):
+        for piano in self.piani(reverse('lista_appuntamenti'), {'data': self.giorno.isoformat()}):
+            self.assertIn('app_cliente_data_id_idx', piano)
+            self.assertNotIn('TEMP B-TREE', piano)
+
+    def test_pagina_successiva_usa_indice_senza_ordinamento(self):
+        cursore = codifica_cursore(timezone.now(), 10)
+        for piano in self.piani(reverse('lista_appuntamenti'), {'dopo': cursore}):
+            self.assertIn('app_cliente_data_id_idx', piano)
+            self.assertNotIn('TEMP B-TREE', piano)
+
+    def test_slot_disponibili_usa_indice_parziale(self):
+        params = {'data': self.giorno.isoformat(), 'barbiere': self.barbiere.id}
+        for piano in self.piani(reverse('api_slot'), params):
+            self.assertIn('app_barbiere_attivi_idx', piano)
+
+    def test_disponibilita_intervallo_usa_indice_parziale(self):
+        params = {'dal': self.giorno.isoformat(), 'al': (self.giorno + timedelta(days=30)).isoformat()}
+        for piano in self.piani(reverse('api_disponibilita'), params):
+            self.assertIn('app_barbiere_attivi_idx', piano)
+
+
+class ListaAppuntamentiPaginataTest(DatiDiProvaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        altro = Barbiere.objects.create(nome='Marco', specialita='Barbe')
+        inizio = timezone.now() - timedelta(days=400)
+        # Coppie con lo stesso data_ora: il cursore deve distinguerle con l'id
+        Appuntamento.objects.bulk_create([
+            Appuntamento(
+                cliente=self.cliente,
+                barbiere=self.barbiere if n % 3 else altro,
+                servizio=self.servizio,
+                data_ora=inizio + timedelta(days=n // 2),
+                stato='completato',
+            )
+            for n in range(90)
+        ])
+
+    def scorri(self, params):
+        """Segue i link 'pagina successiva' e restituisce gli id visti"""
+        visti = []
+        url = reverse('lista_appuntamenti') + '?' + params
+        while url:
+            with CaptureQueriesContext(connection) as contesto:
+                response = self.client.get(url)
+            # Una sola query per tabella (attivi e archivio) per pagina, senza query per riga
+            # (il resto: sessione, utente, cliente e catalogo se non in cache)
+            query_appuntamenti = [q for q in contesto.captured_queries if '"appointments_appuntamento"' in q['sql']]
+            self.assertEqual(len(query_appuntamenti), 1)
+            self.assertLessEqual(len(contesto.captured_queries), 7)
+            visti.extend(app.id for app in response.context['appuntamenti'])
+            successiva = response.context['pagina_successiva']
+            url = reverse('lista_appuntamenti') + '?' + successiva if successiva else None
+        return visti
+
+    def test_scorre_tutto_lo_storico_senza_duplicati(self):
+        visti = self.scorri('')
+        attesi = list(
+            Appuntamento.objects.filter(cliente=self.cliente).order_by('-data_ora', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(visti, attesi)
+
+    def test_filtri_mantenuti_tra_le_pagine(self):
+        visti = self.scorri(f'barbiere={self.barbiere.id}&stato=completato')
+        attesi = Appuntamento.objects.filter(barbiere=self.barbiere).count()
+        self.assertEqual(len(visti), attesi)
+        self.assertEqual(len(set(visti)), attesi)
+
+    def test_storico_comprende_gli_archiviati(self):
+        attesi = self.scorri('')
+        # Metà dello storico in archivio, a lotti piccoli
+        mediano = Appuntamento.objects.order_by('data_ora').values_list('data_ora', flat=True)[46]
+        self.assertEqual(archivia(archiviabili(mediano), lotto=7), 46)
+        self.assertEqual(AppuntamentoArchiviato.objects.count(), 46)
+        self.assertEqual(self.scorri(''), attesi)
+
+        call_command('archivia_appuntamenti', '--ripristina', f'--cliente={self.cliente.id}', stdout=StringIO())
+        self.assertFalse(AppuntamentoArchiviato.objects.exists())
+        self.assertEqual(
+            list(Appuntamento.objects.filter(cliente=self.cliente).order_by('-data_ora', '-id').values_list('id', flat=True)),
+            attesi,
+        )
+
+    def test_archivia_solo_completati_e_cancellati(self):
+        Appuntamento.objects.filter(id__in=self.scorri('')[:10]).update(stato='confermato')
+        call_command('archivia_appuntamenti', '--giorni=0', stdout=StringIO())
+        self.assertEqual(AppuntamentoArchiviato.objects.count(), 80)
+        self.assertEqual(Appuntamento.objects.filter(stato='confermato').count(), 10)
+
+
+class ClienteMiddlewareTest(DatiDiProvaMixin, TestCase):
+
+    def query_clienti(self, url):
+        with CaptureQueriesContext(connection) as contesto:
+            self.client.get(url)
+        return [q for q in contesto.captured_queries if 'FROM "appointments_cliente"' in q['sql']]
+
+    def test_cliente_risolto_dalla_cache_dopo_la_prima_richiesta(self):
+        url = reverse('lista_appuntamenti')
+        self.assertEqual(len(self.query_clienti(url)), 1)
+        self.assertEqual(len(self.query_clienti(url)), 0)
+
+    def test_profilo_creato_dopo_invalida_la_cache(self):
+        senza_profilo = User.objects.create_user('luca@example.com', password='password123')
+        self.client.force_login(senza_profilo)
+        self.assertRedirects(self.client.get(reverse('lista_appuntamenti')), reverse('home'))
+
+        Cliente.objects.create(user=senza_profilo, nome='Luca', email='luca@example.com', telefono='02 9876543')
+        self.assertEqual(self.client.get(reverse('lista_appuntamenti')).status_code, 200)
+
+
+class SalvaAppuntamentoConcorrenzaTest(TransactionTestCase):
+    """Molte prenotazioni parallele sullo stesso barbiere e giorno"""
+
+    THREAD = 8
+    PRENOTAZIONI = 64
+
+    def setUp(self):
+        cache.clear()
+        self.barbiere = Barbiere.objects.create(nome='Giuseppe', specialita='Tagli classici')
+        self.servizio = Servizio.objects.create(
+            nome='Taglio + Shampoo', descrizione='Taglio e shampoo', durata_minuti=45, prezzo=25
+        )
+        self.clienti = [
+            Cliente.objects.create(nome=f'Cliente {n}', email=f'cliente{n}@example.com', telefono='333 1234567')
+            for n in range(self.THREAD)
+        ]
+        self.giorno = timezone.localdate() + timedelta(days=7)
+
+    def prenota(self, n, minuti=None):
+        # Orari a passi di 15 minuti: un servizio da 45 minuti si sovrappone ai vicini
+        if minuti is None:
+            minuti = 9 * 60 + (n * 15) % (8 * 60)
+        data_ora = timezone.make_aware(datetime.combine(self.giorno, time(minuti // 60, minuti % 60)))
+        try:
+            return salva_appuntamento(Appuntamento(
+                cliente=self.clienti[n % self.THREAD],
+                barbiere=self.barbiere,
+                servizio=self.servizio,
+                data_ora=data_ora,
+            ))
+        finally:
+            connection.close()
+
+    def test_stesso_orario_una_sola_prenotazione(self):
+        with ThreadPoolExecutor(max_workers=self.THREAD) as pool:
+            esiti = list(pool.map(lambda n: self.prenota(n, minuti=10 * 60), range(self.THREAD * 2)))
+
+        riusciti = [esito for esito in esiti if esito]
+        self.assertEqual(len(riusciti), 1)
+        for esito in esiti:
+            if esito is not riusciti[0]:
+                self.assertTrue(esito.conflitto)
+                self.assertTrue(esito.messaggio)
+        self.assertEqual(
+            list(Appuntamento.objects.filter(barbiere=self.barbiere).values_list('pk', flat=True)),
+            [riusciti[0].appuntamento.pk],
+        )
+
+    def test_nessuna_sovrapposizione_sotto_carico(self):
+        with ThreadPoolExecutor(max_workers=self.THREAD) as pool:
+            esiti = list(pool.map(self.prenota, range(self.PRENOTAZIONI)))
+
+        riusciti = [esito for esito in esiti if esito]
+        # 32 orari a passi di 15 minuti, servizi da 45: al massimo uno ogni tre orari
+        self.assertTrue(0 < len(riusciti) <= 11)
+
+        # Nel database ci sono esattamente i riusciti e nessuna coppia si sovrappone
+        appuntamenti = Appuntamento.objects.filter(barbiere=self.barbiere)
+        self.assertEqual(
+            set(appuntamenti.values_list('pk', flat=True)), {esito.appuntamento.pk for esito in riusciti}
+        )
+        intervalli = sorted(
+            (data_ora, data_ora + timedelta(minutes=self.servizio.durata_minuti))
+            for data_ora in appuntamenti.values_list('data_ora', flat=True)
+        )
+        for (_, fine), (inizio_successivo, _) in zip(intervalli, intervalli[1:]):
+            self.assertLessEqual(fine, inizio_successivo)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class VisteAsyncTest(DatiDiProvaMixin, TestCase):
+    """Le viste di views_async rispondono come quelle sincrone"""
+
+    def setUp(self):
+        super().setUp()
+        data_ora = timezone.make_aware(datetime.combine(self.giorno, time(10, 0)))
+        Appuntamento.objects.create(
+            cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio, data_ora=data_ora
+        )
+
+    async def test_slot_disponibili(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            reverse('api_slot'), {'data': self.giorno.isoformat(), 'barbiere': self.barbiere.id}
+        )
+        orari = [slot['ora'] for slot in response.json()['slot']]
+        self.assertEqual(len(orari), 17)
+        self.assertNotIn('10:00', orari)
+
+    async def test_lista_appuntamenti(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('lista_appuntamenti'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['appuntamenti']), 1)
+
+    async def test_home_anonima(self):
+        response = await self.async_client.get(reverse('home'))
+        self.assertContains(response, self.barbiere.nome)
+
+
+class ConfrontoBenchmarkTest(TestCase):
+
+    def risultati(self, p95, query):
+        return {'scenari': {'home': {'p95_ms': p95, 'query': query}}}
+
+    def test_regressioni_oltre_soglia_e_query_in_piu(self):
+        baseline = self.risultati(10.0, 2)
+        self.assertEqual(benchmark.confronta(self.risultati(11.9, 2), baseline, 20), [])
+        regressioni = benchmark.confronta(self.risultati(12.5, 3), baseline, 20)
+        self.assertEqual(len(regressioni), 2)
+        self.assertIn('p95', regressioni[0])
+        self.assertIn('3 query', regressioni[1])
+
+    def test_scenari_nuovi_ignorati(self):
+        self.assertEqual(benchmark.confronta(self.risultati(50.0, 9), {'scenari': {}}, 20), [])
+
+
+@override_settings(STRUMENTAZIONE=True)
+class StrumentazioneTest(DatiDiProvaMixin, TestCase):
+
+    def test_header_server_timing(self):
+        response = self.client.get(reverse('lista_appuntamenti'))
+        timing = response['Server-Timing']
+        for metrica in ('sql;dur=', 'tpl;dur=', 'total;dur='):
+            self.assertIn(metrica, timing)
+        self.assertRegex(timing, r'desc="[1-9]\d* query"')
+
+    @override_settings(STRUMENTAZIONE_SOGLIA_QUERY=0)
+    def test_richiesta_oltre_soglia_loggata_con_sql(self):
+        with self.assertLogs('appointments.strumentazione', 'WARNING') as log:
+            self.client.get(reverse('lista_appuntamenti'))
+        self.assertIn('appointments_appuntamento', log.output[0])
+
+    def test_budget_query_superato(self):
+        @budget_query(1)
+        def vista(request):
+            list(Barbiere.objects.all())
+            list(Servizio.objects.all())
+            return HttpResponse()
+
+        with self.assertRaises(BudgetQuerySuperato):
+            vista(RequestFactory().get('/'))
+        with override_settings(BUDGET_QUERY_ERRORE=False), self.assertLogs('appointments.strumentazione', 'WARNING'):
+            vista(RequestFactory().get('/'))
+
+
+class CatalogoCacheTest(DatiDiProvaMixin, TestCase):
+
+    def test_home_anonima_in_cache_e_invalidata_dal_catalogo(self):
+        self.client.logout()
+        self.assertContains(self.client.get(reverse('home')), 'Giuseppe')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Giuseppe')
+        self.assertIn('Cookie', response['Vary'])
+
+        self.barbiere.nome = 'Giuseppe Junior'
+        self.barbiere.save()
+        self.assertContains(self.client.get(reverse('home')), 'Giuseppe Junior')
+
+    def test_home_utente_loggato_non_usa_la_pagina_anonima(self):
+        self.client.logout()
+        self.client.get(reverse('home'))
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('home')), 'Prenota Appuntamento')
+
+    def test_form_prenotazione_senza_query_sul_catalogo(self):
+        self.client.get(reverse('crea_appuntamento'))
+        with CaptureQueriesContext(connection) as contesto:
+            response = self.client.get(reverse('crea_appuntamento'))
+        self.assertContains(response, self.servizio.nome)
+        tabelle = ('"appointments_barbiere"', '"appointments_servizio"')
+        self.assertFalse([q for q in contesto.captured_queries if any(t in q['sql'] for t in tabelle)])
+
+
+class FotoBarbiereTest(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        impostazioni = override_settings(MEDIA_ROOT=self.media)
+        impostazioni.enable()
+        self.addCleanup(impostazioni.disable)
+
+    def png(self, larghezza=400, altezza=300):
+        buffer = BytesIO()
+        Image.new('RGBA', (larghezza, altezza), (200, 50, 50, 255)).save(buffer, 'PNG')
+        return ContentFile(buffer.getvalue())
+
+    def test_upload_identici_deduplicati(self):
+        primo = Barbiere(nome='Giuseppe', specialita='Tagli')
+        primo.foto.save('giuseppe.png', self.png())
+        secondo = Barbiere(nome='Antonio', specialita='Barbe')
+        secondo.foto.save('giuseppe_copia.png', self.png())
+        self.assertEqual(primo.foto.name, secondo.foto.name)
+        self.assertEqual(len(primo.foto.storage.listdir('barbieri')[1]), 1)
+        self.assertTrue(e_gia_deduplicata(primo.foto.name))
+        self.assertFalse(e_gia_deduplicata('barbieri/giuseppe.png'))
+        # Venti caratteri ma non un'impronta
+        self.assertFalse(e_gia_deduplicata('barbieri/Salvone_il_barbiere1.png'))
+
+    def test_varianti_e_srcset(self):
+        barbiere = Barbiere(nome='Giuseppe', specialita='Tagli')
+        barbiere.foto.save('giuseppe.png', self.png())
+        create = genera_varianti(barbiere.foto.name, barbiere.foto.storage)
+        # 160, 320 e la larghezza originale (nessun ingrandimento), in WebP e JPEG
+        self.assertEqual(len(create), 6)
+        self.assertEqual(genera_varianti(barbiere.foto.name, barbiere.foto.storage), [])
+
+        html = Template('{% load immagini %}{% foto_responsive b.foto "Giuseppe" %}').render(Context({'b': barbiere}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('-320.webp 320w', html)
+        self.assertIn('-400.jpg 400w', html)
+        self.assertNotIn('.png', html)
+
+
+class ServiMediaTest(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        impostazioni = override_settings(MEDIA_ROOT=self.media)
+        impostazioni.enable()
+        self.addCleanup(impostazioni.disable)
+        self.contenuto = bytes(range(256)) * 8
+        self.nome = 'barbieri/0123456789abcdef0123-320.jpg'
+        os.makedirs(f'{self.media}/barbieri')
+        with open(f'{self.media}/{self.nome}', 'wb') as f:
+            f.write(self.contenuto)
+        self.url = f'/media/{self.nome}'
+
+    def test_etag_e_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), self.contenuto)
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.contenuto)}')
+        self.assertEqual(b''.join(response.streaming_content), self.contenuto[100:200])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=5000-').status_code, 416)
+
+        # File vuoto: nessun suffisso soddisfacibile
+        open(f'{self.media}/barbieri/vuoto.txt', 'wb').close()
+        response = self.client.get('/media/barbieri/vuoto.txt', HTTP_RANGE='bytes=-10')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */0'))
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect')
+    def test_x_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.nome}')
+        self.assertEqual(response.content, b'')
+
+        # Spazi e caratteri non ASCII arrivano a nginx codificati
+        with open(f'{self.media}/barbieri/sanvito locaèo.png', 'wb') as f:
+            f.write(self.contenuto)
+        response = self.client.get('/media/barbieri/sanvito locaèo.png')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/barbieri/sanvito%20loca%C3%A8o.png')
+
+    def test_percorsi_fuori_da_media_root(self):
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/barbieri/').status_code, 404)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'profilo specifico di SQLite')
+class ProfiloSqliteTest(TestCase):
+
+    def pragma(self, nome):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {nome}')
+            return cursor.fetchone()[0]
+
+    @skipUnless(
+        connection.settings_dict['OPTIONS'].get('transaction_mode') == 'IMMEDIATE',
+        'richiede il profilo "ottimizzato"',
+    )
+    def test_pragma_del_profilo_ottimizzato(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('cache_size'), -64000)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+@override_settings(DATABASE_REPLICHE=['replica'])
+class RouterLetturaScritturaTest(TestCase):
+    """Solo le decisioni del router: la replica non deve esistere davvero"""
+
+    def setUp(self):
+        self.router = RouterLetturaScrittura()
+        self.fabbrica = RequestFactory()
+
+    def db_letto_dalla_vista(self, request):
+        letto = {}
+
+        def vista(request):
+            letto['db'] = self.router.db_for_read(Appuntamento)
+            return HttpResponse()
+
+        response = PrimarioDopoScritturaMiddleware(vista)(request)
+        return letto['db'], response
+
+    def test_letture_sulla_replica_scritture_sul_primario(self):
+        # TestCase apre una transazione sul primario: fuori da essa si legge dalla replica
+        self.assertEqual(self.router.db_for_read(Appuntamento), 'default')
+        with mock.patch.object(connection, 'in_atomic_block', False):
+            self.assertEqual(self.router.db_for_read(Appuntamento), 'replica')
+            self.assertIsNone(self.router.db_for_read(User))
+        self.assertEqual(self.router.db_for_write(Appuntamento), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'appointments'))
+
+    def test_read_your_writes_dopo_una_prenotazione(self):
+        with mock.patch.object(connection, 'in_atomic_block', False):
+            db, response = self.db_letto_dalla_vista(self.fabbrica.post('/appuntamenti/nuovo/'))
+            self.assertEqual(db, 'default')
+            cookie = response.cookies[COOKIE_PRIMARIO].value
+
+            successiva = self.fabbrica.get('/appuntamenti/')
+            successiva.COOKIES[COOKIE_PRIMARIO] = cookie
+            self.assertEqual(self.db_letto_dalla_vista(successiva)[0], 'default')
+
+            # Scaduto il cookie si torna alla replica
+            self.assertEqual(self.db_letto_dalla_vista(self.fabbrica.get('/appuntamenti/'))[0], 'replica')
+
+
+class EsportazioneTest(DatiDiProvaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        inizio = timezone.make_aware(datetime.combine(self.giorno, time(10, 0)))
+        self.appuntamenti = Appuntamento.objects.bulk_create([
+            Appuntamento(
+                cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio,
+                data_ora=inizio - timedelta(days=400 * (n % 2)) + timedelta(hours=n),
+                stato='completato' if n % 2 else 'confermato',
+                note='=SOMMA(A1); pieghe, "virgolette"\nè una nota lunga ' * 3 * (n == 2),
+            )
+            for n in range(6)
+        ])
+        archivia(archiviabili(timezone.now()))
+
+    def contenuto(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_del_cliente_comprende_archivio_e_filtri(self):
+        response = self.client.get(reverse('esporta_appuntamenti', args=['csv']))
+        righe = list(csv.reader(StringIO(self.contenuto(response).lstrip('\ufeff'))))
+        self.assertEqual(righe[0][0], 'id')
+        self.assertEqual(len(righe), 7)
+        # In ordine di data: prima gli archiviati, di 400 giorni fa
+        self.assertEqual([riga[9] for riga in righe[1:]], ['completato'] * 3 + ['confermato'] * 3)
+        self.assertTrue(righe[5][10].startswith("'=SOMMA"))
+
+        response = self.client.get(reverse('esporta_appuntamenti', args=['csv']), {'stato': 'confermato'})
+        self.assertEqual(self.contenuto(response).count('\r\n'), 4)
+
+    def test_ics_valido(self):
+        testo = self.contenuto(self.client.get(reverse('esporta_appuntamenti', args=['ics'])))
+        self.assertTrue(testo.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertTrue(testo.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(testo.count('BEGIN:VEVENT'), 6)
+        for linea in testo.split('\r\n'):
+            self.assertLessEqual(len(linea.encode()), 75)
+        srotolato = testo.replace('\r\n ', '')
+        self.assertIn('DESCRIPTION:=SOMMA(A1)\\; pieghe\\, "virgolette"\\nè una nota lunga', srotolato)
+        inizio = self.appuntamenti[0].data_ora.astimezone(dt_timezone.utc)
+        self.assertIn('DTSTART:' + inizio.strftime('%Y%m%dT%H%M%SZ'), srotolato)
+
+    def test_agenda_barbiere_solo_staff(self):
+        url = reverse('esporta_agenda_barbiere', args=[self.barbiere.id, 'ics'])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        testo = self.contenuto(self.client.get(url, {'dal': self.giorno.isoformat()}))
+        # Solo i prossimi appuntamenti, non quelli archiviati
+        self.assertEqual(testo.count('BEGIN:VEVENT'), 3)
+        self.assertIn('SUMMARY:Taglio Capelli - Mario Rossi', testo)
+        self.assertEqual(self.client.get(reverse('esporta_agenda_barbiere', args=[self.barbiere.id, 'pdf'])).status_code, 404)
+
+    async def test_asgi_consuma_a_blocchi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('esporta_appuntamenti', args=['csv']))
+        with warnings.catch_warnings():
+            # StreamingHttpResponse avvisa se deve caricare tutto un iteratore sincrono
+            warnings.simplefilter('error')
+            contenuto = b''.join([parte async for parte in response])
+        self.assertEqual(contenuto.decode().count('\r\n'), 7)
+
+
+class AdminAppuntamentiTest(DatiDiProvaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.url = reverse('admin:appointments_appuntamento_changelist')
+        data_ora = timezone.make_aware(datetime.combine(self.giorno, time(10, 0)))
+        # Due richieste in attesa per lo stesso orario
+        self.in_attesa = Appuntamento.objects.bulk_create([
+            Appuntamento(
+                cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio,
+                data_ora=data_ora + timedelta(minutes=15 * n), stato='in_attesa',
+            )
+            for n in range(2)
+        ])
+
+    def azione(self, nome, appuntamenti):
+        return self.client.post(self.url, {
+            'action': nome, '_selected_action': [appuntamento.pk for appuntamento in appuntamenti],
+        }, follow=True)
+
+    def orari_liberi(self):
+        response = self.client.get(reverse('api_slot'), {'data': self.giorno.isoformat(), 'barbiere': self.barbiere.id})
+        return [slot['ora'] for slot in response.json()['slot']]
+
+    def test_azioni_in_blocco_aggiornano_le_agende(self):
+        self.assertIn('10:00', self.orari_liberi())
+        with CaptureQueriesContext(connection) as contesto:
+            response = self.azione('conferma_selezionati', self.in_attesa)
+        self.assertContains(response, 'Appuntamenti confermati: 1')
+        self.assertContains(response, 'sovrapposti ad altri appuntamenti: 1')
+        self.assertEqual(
+            len([q for q in contesto.captured_queries if q['sql'].startswith('UPDATE "appointments_appuntamento"')]), 1
+        )
+        self.assertNotIn('10:00', self.orari_liberi())
+
+        self.azione('cancella_selezionati', self.in_attesa)
+        self.assertEqual(Appuntamento.objects.filter(stato='cancellato').count(), 2)
+        self.assertIn('10:00', self.orari_liberi())
+
+    def test_completa_solo_gli_appuntamenti_confermati(self):
+        ieri = timezone.now() - timedelta(days=1)
+        confermato, cancellato = Appuntamento.objects.bulk_create([
+            Appuntamento(cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio, data_ora=ieri, stato=stato)
+            for stato in ('confermato', 'cancellato')
+        ])
+        self.assertContains(self.azione('completa_selezionati', [confermato, cancellato]), 'Appuntamenti completati: 1')
+        self.assertEqual(
+            dict(Appuntamento.objects.filter(data_ora=ieri).values_list('pk', 'stato')),
+            {confermato.pk: 'completato', cancellato.pk: 'cancellato'},
+        )
+
+    def test_archiviazione_dall_admin_rispetta_l_orizzonte(self):
+        vecchio, recente = Appuntamento.objects.bulk_create([
+            Appuntamento(
+                cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio,
+                data_ora=timezone.now() - timedelta(days=giorni), stato='cancellato',
+            )
+            for giorni in (settings.ARCHIVIO_ORIZZONTE_GIORNI + 1, 1)
+        ])
+        response = self.azione('archivia_selezionati', [vecchio, recente, *self.in_attesa])
+        self.assertContains(response, 'Appuntamenti archiviati: 1')
+        self.assertContains(response, 'Non archiviati perché non completati o cancellati')
+        self.assertEqual(list(AppuntamentoArchiviato.objects.values_list('pk', flat=True)), [vecchio.pk])
+
+        # Sposta righe fuori dalla tabella: non per chi può solo consultare
+        self.user.is_superuser = False
+        self.user.save()
+        self.user.user_permissions.add(Permission.objects.get(codename='view_appuntamento'))
+        azioni = dict(self.client.get(self.url).context['action_form'].fields['action'].choices)
+        self.assertIn('esporta_csv', azioni)
+        self.assertNotIn('archivia_selezionati', azioni)
+
+    @override_settings(ADMIN_LIMITE_CONTEGGIO=1)
+    def test_changelist_con_conteggio_stimato(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        # Senza statistiche del database il totale si ferma al limite
+        self.assertEqual(response.context['cl'].result_count, 1)
+        # Stesso giorno: la gerarchia di date propone solo quel giorno
+        scelte = response.context['choices']
+        self.assertEqual(len(scelte), 1)
+        self.assertIn(f'data_ora__day={self.giorno.day}', scelte[0]['link'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Indice FTS5 solo su SQLite')
+class RicercaTest(DatiDiProvaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.altro = Cliente.objects.create(nome='Luca Bianchi', email='luca.b@example.com', telefono='+39 347-9876543')
+        self.appuntamento = Appuntamento.objects.create(
+            cliente=self.altro, barbiere=self.barbiere, servizio=self.servizio,
+            data_ora=timezone.make_aware(datetime.combine(self.giorno, time(10, 0))), note='Pelle sensibile al rasoio',
+        )
+
+    def cerca_clienti(self, testo):
+        response = self.client.get(reverse('admin:appointments_cliente_changelist'), {'q': testo})
+        return sorted(cliente.nome for cliente in response.context['cl'].result_list)
+
+    def test_ricerca_admin_sull_indice(self):
+        self.assertEqual(self.cerca_clienti('ssi'), ['Mario Rossi'])
+        self.assertEqual(self.cerca_clienti('LUCA.B@'), ['Luca Bianchi'])
+        self.assertEqual(self.cerca_clienti('347 987'), ['Luca Bianchi'])
+        # Parola corta: LIKE, ma solo tra i clienti trovati dall'indice
+        self.assertEqual(self.cerca_clienti('example lu'), ['Luca Bianchi'])
+
+        # I trigger seguono anche update() e delete()
+        Cliente.objects.filter(pk=self.cliente.pk).update(nome='Mario Verdi')
+        self.assertEqual(self.cerca_clienti('ssi'), [])
+        self.assertEqual(self.cerca_clienti('verdi'), ['Mario Verdi'])
+        self.altro.delete()
+        self.assertEqual(self.cerca_clienti('bianchi'), [])
+
+        # Senza ricerca_indicizzata il mixin usa la ricerca standard
+        class SenzaIndice(RicercaIndicizzataMixin, admin.ModelAdmin):
+            search_fields = ['nome']
+
+        trovati, _ = SenzaIndice(Cliente, admin.site).get_search_results(None, Cliente.objects.all(), 'verdi')
+        self.assertEqual([cliente.nome for cliente in trovati], ['Mario Verdi'])
+
+    def test_note_e_api_staff(self):
+        response = self.client.get(reverse('admin:appointments_appuntamento_changelist'), {'q': 'rasoio'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.appuntamento])
+
+        risultati = self.client.get(reverse('api_ricerca'), {'q': 'sensibile'}).json()
+        self.assertEqual([a['id'] for a in risultati['appuntamenti']], [self.appuntamento.pk])
+        self.assertIn('[sensibile]', risultati['appuntamenti'][0]['estratto'])
+        self.assertEqual(self.client.get(reverse('api_ricerca'), {'q': 'ab'}).status_code, 400)
+
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('api_ricerca'), {'q': 'rossi'}).status_code, 302)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportazioneClientiTest(DatiDiProvaMixin, TestCase):
+
+    def test_comando_csv_a_lotti_con_scarti(self):
+        cartella = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cartella)
+        percorso, scarti = os.path.join(cartella, 'clienti.csv'), os.path.join(cartella, 'scarti.csv')
+        with open(percorso, 'w', encoding='utf-8-sig', newline='') as f:
+            csv.writer(f).writerows([
+                ['nome', 'email', 'telefono', 'password'],
+                ['Anna Neri', 'anna@example.com', '+39 347 1112233', 'segreta123'],
+                ['Paolo Gialli', 'paolo@example.com', '02 9876543', ''],
+                ['Telefono Sbagliato', 'tel@example.com', 'chiamami', 'x'],
+                ['Anna Doppia', 'anna@example.com', '333 1', 'x'],
+                ['Già Registrato', 'mario@example.com', '333 2', 'x'],
+                ['', 'senza-nome-e-email', '333 3', 'x'],
+                ['Elena Blu', 'elena@example.com', '333 4445566', 'altra456'],
+            ])
+        call_command('importa_clienti', percorso, lotto=2, processi=1, scarti=scarti, stdout=StringIO())
+
+        self.assertEqual(
+            sorted(Cliente.objects.exclude(pk=self.cliente.pk).values_list('email', flat=True)),
+            ['anna@example.com', 'elena@example.com', 'paolo@example.com'],
+        )
+        self.assertTrue(User.objects.get(username='anna@example.com').check_password('segreta123'))
+        self.assertFalse(User.objects.get(username='paolo@example.com').has_usable_password())
+        self.assertEqual(Cliente.objects.get(email='elena@example.com').user.username, 'elena@example.com')
+        with open(scarti, encoding='utf-8') as f:
+            motivi = {int(riga['riga']): riga['motivo'] for riga in csv.DictReader(f)}
+        self.assertEqual(sorted(motivi), [4, 5, 6, 7])
+        self.assertIn('telefono', motivi[4])
+        self.assertEqual(motivi[5], 'email ripetuta nel file')
+        self.assertEqual(motivi[6], 'email già registrata')
+        self.assertIn('nome', motivi[7])
+
+    @override_settings(IMPORTAZIONE_PROCESSI=2)
+    def test_upload_admin_json_con_pool(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        clienti = [
+            {'nome': f'Cliente {n}', 'email': f'cliente{n}@example.com', 'telefono': f'333 {n:07d}', 'password': f'pw{n}'}
+            for n in range(30)
+        ] + ['non un oggetto']
+        upload = ContentFile(json.dumps(clienti, indent=1).encode(), name='clienti.json')
+        # Blocchi piccoli: gli oggetti si trovano a cavallo tra un blocco e l'altro
+        with mock.patch('appointments.importazione.BLOCCO_JSON', 50):
+            response = self.client.post(reverse('admin:appointments_cliente_importa'), {'file': upload})
+
+        self.assertContains(response, 'Clienti importati: 30, scartati: 1')
+        self.assertEqual([scarto.riga for scarto in response.context['scarti']], [31])
+        self.assertTrue(User.objects.get(username='cliente29@example.com').check_password('pw29'))
+
+
+    def test_upload_admin_csv_malformato(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        # Un campo oltre csv.field_size_limit(): csv.Error, come nel comando
+        upload = ContentFile(f'nome,email,telefono\n{"x" * 200000},a@example.com,333\n'.encode(), name='clienti.csv')
+        response = self.client.post(reverse('admin:appointments_cliente_importa'), {'file': upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('field larger than field limit', response.context['form'].errors['file'][0])
+        self.assertFalse(Cliente.objects.filter(email='a@example.com').exists())
+
+class RiepilogoGiornalieroTest(DatiDiProvaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.barba = Servizio.objects.create(nome='Barba', descrizione='Barba', durata_minuti=20, prezzo=15)
+
+    def riepilogo(self):
+        return {
+            (riga.giorno, riga.barbiere_id, riga.servizio_id): (riga.appuntamenti, riga.minuti, riga.ricavo, riga.cancellati)
+            for riga in RiepilogoGiornaliero.objects.all()
+            if riga.appuntamenti or riga.minuti or riga.ricavo or riga.cancellati
+        }
+
+    def assertRiepilogoAllineato(self):
+        incrementale = self.riepilogo()
+        riepilogo.ricostruisci()
+        self.assertEqual(incrementale, self.riepilogo())
+        return incrementale
+
+    def test_aggiornamenti_incrementali_come_la_ricostruzione(self):
+        ieri = timezone.make_aware(datetime.combine(self.giorno - timedelta(days=30), time(10, 0)))
+        data_ora = timezone.make_aware(datetime.combine(self.giorno, time(10, 0)))
+        appuntamenti = [
+            salva_appuntamento(Appuntamento(
+                cliente=self.cliente, barbiere=self.barbiere, servizio=servizio, data_ora=data_ora + timedelta(hours=n),
+            )).appuntamento
+            for n, servizio in enumerate([self.servizio, self.servizio, self.barba])
+        ]
+        self.assertEqual(
+            self.assertRiepilogoAllineato(),
+            {
+                (self.giorno, self.barbiere.pk, self.servizio.pk): (2, 60, 40, 0),
+                (self.giorno, self.barbiere.pk, self.barba.pk): (1, 20, 15, 0),
+            },
+        )
+
+        # Spostamento in un altro giorno con un altro servizio, cancellazione ed eliminazione
+        appuntamenti[0].data_ora, appuntamenti[0].servizio = ieri, self.barba
+        appuntamenti[0].save()
+        appuntamenti[1].stato = 'cancellato'
+        appuntamenti[1].save()
+        appuntamenti[2].delete()
+        self.assertRiepilogoAllineato()
+
+        # Operazioni in blocco dell'admin, archivio e ripristino
+        cambia_stato_in_blocco(Appuntamento.objects.filter(pk=appuntamenti[0].pk), 'completato')
+        self.assertEqual(conferma_in_blocco(Appuntamento.objects.filter(pk=appuntamenti[1].pk)), (1, 0))
+        self.assertRiepilogoAllineato()
+        prima = self.riepilogo()
+        archivia(Appuntamento.objects.filter(pk=appuntamenti[0].pk))
+        self.assertEqual(self.riepilogo(), prima)
+        self.assertRiepilogoAllineato()
+        self.assertEqual(ripristina(), 1)
+        self.assertEqual(self.riepilogo(), prima)
+        self.assertRiepilogoAllineato()
+
+        # Nuovo prezzo: il worker ricalcola i giorni da oggi in poi, lo storico resta com'era
+        salva_appuntamento(Appuntamento(
+            cliente=self.cliente, barbiere=self.barbiere, servizio=self.barba, data_ora=data_ora + timedelta(hours=2),
+        ))
+        self.barba.prezzo = 18
+        self.barba.save()
+        self.assertEqual(self.riepilogo()[self.giorno, self.barbiere.pk, self.barba.pk], (1, 20, 15, 0))
+        self.assertTrue(Lavoro.objects.filter(tipo='ricostruisci_riepilogo').exists())
+        self.assertEqual(coda.esegui_tutti()[1], 0)
+        totali = self.riepilogo()
+        self.assertEqual(totali[ieri.date(), self.barbiere.pk, self.barba.pk], (1, 20, 15, 0))
+        self.assertEqual(totali[self.giorno, self.barbiere.pk, self.barba.pk], (1, 20, 18, 0))
+
+    def test_conferma_in_blocco_legge_gli_stati_sotto_il_lock(self):
+        data_ora = timezone.make_aware(datetime.combine(self.giorno, time(10, 0)))
+        in_attesa = Appuntamento.objects.create(
+            cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio, data_ora=data_ora, stato='in_attesa'
+        )
+        blocca = prenotazioni._blocca_barbiere
+
+        def cancellato_mentre_aspetta_il_lock(barbiere_id):
+            # Una cancellazione concorrente fa il commit prima che il lock arrivi
+            Appuntamento.objects.filter(pk=in_attesa.pk).update(stato='cancellato')
+            riepilogo.registra([riepilogo.variazione(1, (self.barbiere.pk, data_ora, self.servizio.pk, 'cancellato'))])
+            blocca(barbiere_id)
+
+        with mock.patch.object(prenotazioni, '_blocca_barbiere', cancellato_mentre_aspetta_il_lock):
+            self.assertEqual(conferma_in_blocco(Appuntamento.objects.filter(pk=in_attesa.pk)), (1, 0))
+        self.assertEqual(self.assertRiepilogoAllineato(), {(self.giorno, self.barbiere.pk, self.servizio.pk): (1, 30, 20, 0)})
+
+    def test_conferma_in_blocco_carica_solo_i_giorni_dei_candidati(self):
+        def alle(giorno, ora):
+            return timezone.make_aware(datetime.combine(giorno, time(ora, 0)))
+
+        tra_un_anno = self.giorno + timedelta(days=365)
+        Appuntamento.objects.create(
+            cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio, data_ora=alle(tra_un_anno, 10)
+        )
+        candidati = [
+            Appuntamento.objects.create(
+                cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio, data_ora=data_ora, stato='in_attesa'
+            )
+            for data_ora in (alle(self.giorno, 10), alle(tra_un_anno, 10), alle(tra_un_anno + timedelta(days=1), 10))
+        ]
+        with mock.patch.object(prenotazioni, 'carica_agende_giorni', wraps=prenotazioni.carica_agende_giorni) as carica:
+            esito = conferma_in_blocco(Appuntamento.objects.filter(pk__in=[a.pk for a in candidati]))
+        self.assertEqual(esito, (2, 1))
+        (coppie,), _ = carica.call_args
+        self.assertEqual(
+            coppie,
+            {(self.barbiere.pk, self.giorno), (self.barbiere.pk, tra_un_anno), (self.barbiere.pk, tra_un_anno + timedelta(days=1))},
+        )
+        self.assertEqual(
+            set(Appuntamento.objects.filter(pk__in=[a.pk for a in candidati], stato='confermato').values_list('pk', flat=True)),
+            {candidati[0].pk, candidati[2].pk},
+        )
+
+    def test_dashboard_legge_solo_il_riepilogo(self):
+        data_ora = timezone.make_aware(datetime.combine(timezone.localdate() - timedelta(days=1), time(10, 0)))
+        Appuntamento.objects.create(cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio, data_ora=data_ora)
+        self.assertEqual(self.client.get(reverse('riepilogo')).status_code, 302)
+
+        self.user.is_staff = True
+        self.user.save()
+        with CaptureQueriesContext(connection) as contesto:
+            response = self.client.get(reverse('riepilogo'))
+        self.assertEqual(response.context['totale'], {'appuntamenti': 1, 'minuti': 30, 'ricavo': 20, 'cancellati': 0})
+        riga = response.context['per_barbiere'][0]
+        self.assertEqual((riga['nome'], riga['giorni'], riga['occupazione']), ('Giuseppe', 1, round(100 * 30 / 540, 1)))
+        self.assertFalse([q for q in contesto.captured_queries if 'appointments_appuntamento' in q['sql']])
+
+
+class AnaliticaTest(DatiDiProvaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.passato = timezone.localdate() - timedelta(days=14)
+        inizio = timezone.make_aware(datetime.combine(self.passato, time(10, 30)))
+        lungo = Servizio.objects.create(nome='Completo', descrizione='Completo', durata_minuti=60, prezzo=35)
+        for servizio, ore, stato in [
+            (lungo, 0, 'completato'),     # 10:30-11:30: mezz'ora alle 10 e alle 11
+            (self.servizio, 2, 'confermato'),  # passato e mai completato: assenza
+            (self.servizio, 3, 'cancellato'),
+            (self.servizio, 4, 'completato'),
+        ]:
+            Appuntamento.objects.create(
+                cliente=self.cliente, barbiere=self.barbiere, servizio=servizio,
+                data_ora=inizio + timedelta(hours=ore), stato=stato,
+            )
+        archivia(Appuntamento.objects.filter(stato='completato', servizio=self.servizio))
+
+    def test_occupazione_e_tassi_vettoriali(self):
+        risultato = analitica.analisi(self.passato, self.passato)
+        riga, = risultato['barbieri']
+        mappa = dict(zip(risultato['ore'], riga['occupazione'][self.passato.weekday()]))
+        self.assertEqual((mappa[10], mappa[11], mappa[12], mappa[13], mappa[14]), (50.0, 50.0, 50.0, 0.0, 50.0))
+        self.assertEqual(sum(map(sum, riga['occupazione'])), 200.0)
+        self.assertEqual((riga['appuntamenti'], riga['minuti_prenotati']), (4, 120))
+        self.assertEqual((riga['tasso_cancellazioni'], riga['tasso_assenze']), (0.25, round(1 / 3, 4)))
+        self.assertEqual(riga['ora_di_punta']['ora'], 10)
+        self.assertEqual(len(risultato['negozio']['picchi']), 4)
+
+        # Su due settimane lo stesso giorno della settimana compare due volte
+        risultato = analitica.analisi(self.passato - timedelta(days=7), self.passato)
+        self.assertEqual(risultato['barbieri'][0]['ora_di_punta']['occupazione'], 25.0)
+
+    def test_endpoint_staff(self):
+        self.assertEqual(self.client.get(reverse('api_analitica')).status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('api_analitica'), {'dal': 'ieri'}).status_code, 400)
+        self.assertEqual(
+            self.client.get(reverse('api_analitica'), {'dal': '2020-01-01', 'al': '2025-01-01'}).status_code, 400
+        )
+        dati = self.client.get(reverse('api_analitica'), {'barbiere': self.barbiere.pk}).json()
+        self.assertEqual(dati['barbieri'][0]['nome'], 'Giuseppe')
+        self.assertEqual(dati['negozio']['appuntamenti'], 4)
+        self.assertFalse(self.client.get(reverse('api_analitica'), {'barbiere': self.barbiere.pk + 1}).json()['barbieri'])
+
+
+class ListaAttesaTest(DatiDiProvaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.altro = Cliente.objects.create(nome='Luca Bianchi', email='luca@example.com', telefono='333 7654321')
+        self.barba = Servizio.objects.create(nome='Barba', descrizione='Barba', durata_minuti=20, prezzo=15)
+        self.alle_dieci = timezone.make_aware(datetime.combine(self.giorno, time(10, 0)))
+
+    def richiesta(self, servizio, dalle, alle, cliente=None):
+        return RichiestaAttesa.objects.create(
+            cliente=cliente or self.altro, barbiere=self.barbiere, servizio=servizio,
+            giorno=self.giorno, dalle=dalle, alle=alle,
+        )
+
+    def test_cancellazione_promuove_la_richiesta_migliore(self):
+        occupato = Appuntamento.objects.create(
+            cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio, data_ora=self.alle_dieci
+        )
+        breve = self.richiesta(self.barba, time(10, 0), time(10, 30))
+        lunga = self.richiesta(self.servizio, time(9, 45), time(10, 30))
+        fuori = self.richiesta(self.servizio, time(15, 0), time(17, 0))
+
+        self.client.post(reverse('cancella_appuntamento', args=[occupato.pk]))
+        lunga.refresh_from_db()
+        # Riempie tutto il posto liberato; la più vecchia (20 minuti) non entra più
+        self.assertIsNotNone(lunga.promossa_il)
+        self.assertEqual(
+            (lunga.appuntamento.cliente, lunga.appuntamento.data_ora, lunga.appuntamento.stato),
+            (self.altro, self.alle_dieci, 'confermato'),
+        )
+        self.assertTrue(RichiestaAttesa.objects.get(pk=breve.pk).in_attesa())
+        # Fuori dal posto liberato: non viene nemmeno letta
+        self.assertTrue(RichiestaAttesa.objects.get(pk=fuori.pk).in_attesa())
+        self.assertEqual(
+            riepilogo.totali(self.giorno, self.giorno, ['barbiere_id'])[0]['appuntamenti'], 1
+        )
+
+    def test_iscrizione_e_appuntamenti_in_attesa(self):
+        Appuntamento.objects.create(
+            cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio, data_ora=self.alle_dieci
+        )
+        dati = {
+            'barbiere': self.barbiere.pk, 'servizio': self.servizio.pk,
+            'giorno': self.giorno.isoformat(), 'dalle': '10:00', 'alle': '10:30',
+        }
+        self.client.post(reverse('lista_attesa'), dati)
+        richiesta = RichiestaAttesa.objects.get(cliente=self.cliente)
+        self.assertTrue(richiesta.in_attesa())
+        self.assertContains(self.client.get(reverse('lista_attesa')), 'In attesa')
+
+        # Con posto libero nella fascia si prenota subito
+        response = self.client.post(reverse('lista_attesa'), {**dati, 'dalle': '10:00', 'alle': '11:30'})
+        self.assertRedirects(response, reverse('lista_appuntamenti'))
+        self.assertEqual(
+            Appuntamento.objects.get(note='Prenotato dalla lista d\'attesa').data_ora, self.alle_dieci + timedelta(minutes=30)
+        )
+
+        # Cancellazione in blocco dall'admin: vince l'iscrizione, che riempie
+        # i 30 minuti liberati, sull'appuntamento in attesa da 20
+        in_attesa = Appuntamento.objects.create(
+            cliente=self.altro, barbiere=self.barbiere, servizio=self.barba, data_ora=self.alle_dieci, stato='in_attesa'
+        )
+        cambia_stato_in_blocco(Appuntamento.objects.filter(data_ora=self.alle_dieci, stato='confermato'), 'cancellato')
+        richiesta.refresh_from_db()
+        self.assertEqual(richiesta.appuntamento.data_ora, self.alle_dieci)
+        in_attesa.refresh_from_db()
+        self.assertEqual(in_attesa.stato, 'in_attesa')
+
+        # Se si libera di nuovo tocca all'appuntamento in attesa
+        self.assertEqual(cancella_e_promuovi(richiesta.appuntamento), [in_attesa])
+        in_attesa.refresh_from_db()
+        self.assertEqual(in_attesa.stato, 'confermato')
+
+
+class ListaAttesaArchivioTest(DatiDiProvaMixin, TransactionTestCase):
+    """TransactionTestCase: il vincolo di chiave esterna si controlla al commit"""
+
+    def test_archivia_appuntamento_promosso(self):
+        data_ora = timezone.make_aware(datetime.combine(timezone.localdate() - timedelta(days=400), time(10, 0)))
+        promosso = Appuntamento.objects.create(
+            cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio, data_ora=data_ora, stato='completato',
+        )
+        richiesta = RichiestaAttesa.objects.create(
+            cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio, giorno=data_ora.date(),
+            dalle=time(9, 0), alle=time(12, 0), promossa_il=data_ora, appuntamento=promosso,
+        )
+
+        self.assertEqual(archivia(), 1)
+        self.assertTrue(AppuntamentoArchiviato.objects.filter(pk=promosso.pk).exists())
+        richiesta.refresh_from_db()
+        # Resta promossa, senza il collegamento all'appuntamento ormai archiviato
+        self.assertIsNone(richiesta.appuntamento)
+        self.assertFalse(richiesta.in_attesa())
+
+
+class CodaLavoriTest(DatiDiProvaMixin, TransactionTestCase):
+    """TransactionTestCase: i thread del worker usano connessioni proprie"""
+
+    def setUp(self):
+        super().setUp()
+        self.chiamate = []
+        nome = f'prova_{id(self)}'
+        coda.lavoro(nome, tentativi=2)(self.lavoro_di_prova)
+        self.addCleanup(coda._registro.pop, nome)
+        self.nome = nome
+
+    def lavoro_di_prova(self, fallisci=False):
+        self.chiamate.append(fallisci)
+        if fallisci:
+            raise RuntimeError('errore di prova')
+
+    def test_prelievo_nuovi_tentativi_e_visibilita(self):
+        ok = coda.accoda(self.nome)
+        ko = coda.accoda(self.nome, fallisci=True)
+        futuro = coda.accoda(self.nome, esegui_dal=timezone.now() + timedelta(hours=1))
+        self.assertEqual(coda.accoda(self.nome, chiave='unica').chiave, 'unica')
+        coda.accoda(self.nome, chiave='unica')
+        self.assertEqual(Lavoro.objects.filter(chiave='unica').count(), 1)
+
+        presi = coda.preleva(10)
+        self.assertEqual({preso.pk for preso in presi} & {ok.pk, ko.pk, futuro.pk}, {ok.pk, ko.pk})
+        # Presi da un worker: invisibili agli altri
+        self.assertEqual(coda.preleva(10), [])
+        with self.assertLogs('appointments.coda', 'WARNING'):
+            for preso in presi:
+                coda.esegui(preso)
+        ok.refresh_from_db()
+        ko.refresh_from_db()
+        self.assertEqual((ok.stato, ko.stato, ko.tentativi), ('completato', 'in_coda', 1))
+        self.assertIn('errore di prova', ko.errore)
+        self.assertGreater(ko.disponibile_dal, timezone.now() + timedelta(seconds=20))
+
+        # Secondo e ultimo tentativo, poi fallito; un worker in ritardo non lo chiude
+        Lavoro.objects.filter(pk=ko.pk).update(disponibile_dal=timezone.now())
+        preso, = coda.preleva(10)
+        Lavoro.objects.filter(pk=ko.pk).update(disponibile_dal=timezone.now())
+        ripreso, = coda.preleva(10)
+        with self.assertLogs('appointments.coda', 'WARNING'):
+            coda.esegui(preso)
+        self.assertEqual(Lavoro.objects.get(pk=ko.pk).stato, 'in_corso')
+        with self.assertLogs('appointments.coda', 'ERROR'):
+            coda.esegui(ripreso)
+        self.assertEqual(Lavoro.objects.get(pk=ko.pk).stato, 'fallito')
+
+    def test_worker_conferme_e_promemoria(self):
+        data_ora = timezone.now() + timedelta(hours=3)
+        appuntamento = salva_appuntamento(Appuntamento(
+            cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio, data_ora=data_ora,
+        )).appuntamento
+        Appuntamento.objects.create(
+            cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio,
+            data_ora=data_ora + timedelta(days=3), stato='confermato',
+        )
+        cancellato = Appuntamento.objects.create(
+            cliente=self.cliente, barbiere=self.barbiere, servizio=self.servizio,
+            data_ora=data_ora + timedelta(hours=1), stato='cancellato',
+        )
+
+        # Solo la finestra dei prossimi giorni, solo i confermati, una volta sola
+        self.assertEqual(promemoria.pianifica(), 1)
+        self.assertEqual(promemoria.pianifica(), 1)
+        self.assertEqual(Lavoro.objects.filter(tipo='invia_promemoria').count(), 1)
+        self.assertFalse(Lavoro.objects.filter(chiave__startswith=f'promemoria:{cancellato.pk}:').exists())
+
+        worker = coda.Worker(thread=2, intervallo=0.01)
+        self.assertEqual(worker.avvia(una_volta=True), (4, 0))
+        self.assertEqual(
+            sorted(messaggio.subject for messaggio in mail.outbox), ['Appuntamento confermato', 'Promemoria appuntamento']
+        )
+        self.assertEqual(mail.outbox[0].to, ['mario@example.com'])
+        # Periodici: pianifica_promemoria e pulisci_coda, una volta per periodo
+        self.assertEqual(
+            set(Lavoro.objects.exclude(tipo__in=['invia_promemoria', 'conferma_prenotazione']).values_list('tipo', flat=True)),
+            {'pianifica_promemoria', 'pulisci_coda'},
+        )
+        self.assertTrue(Lavoro.objects.filter(chiave=promemoria.chiave(appuntamento.pk, appuntamento.data_ora)).exists())
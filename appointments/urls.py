@@ -1,19 +1,38 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, views_async
+
+# Con VISTE_ASYNC le viste più lette usano l'ORM asincrono (da servire via ASGI)
+viste_lettura = views_async if settings.VISTE_ASYNC else views
 
 urlpatterns = [
     # Pagine principali
-    path('', views.home, name='home'),
+    path('', viste_lettura.home, name='home'),
     path('registrazione/', views.registrazione, name='registrazione'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     
     # Gestione appuntamenti
-    path('appuntamenti/', views.lista_appuntamenti, name='lista_appuntamenti'),
+    path('appuntamenti/', viste_lettura.lista_appuntamenti, name='lista_appuntamenti'),
     path('appuntamenti/nuovo/', views.crea_appuntamento, name='crea_appuntamento'),
     path('appuntamenti/<int:appuntamento_id>/modifica/', views.modifica_appuntamento, name='modifica_appuntamento'),
     path('appuntamenti/<int:appuntamento_id>/cancella/', views.cancella_appuntamento, name='cancella_appuntamento'),
     
+    # Lista d'attesa
+    path('attesa/', views.lista_attesa, name='lista_attesa'),
+    path('attesa/<int:richiesta_id>/esci/', views.esci_attesa, name='esci_attesa'),
+    
+    # Esportazioni CSV / iCalendar in streaming
+    path('appuntamenti/esporta.<str:formato>', views.esporta_appuntamenti, name='esporta_appuntamenti'),
+    path('barbieri/<int:barbiere_id>/agenda.<str:formato>', views.esporta_agenda_barbiere, name='esporta_agenda_barbiere'),
+    
+    # Riepilogo per lo staff (dal riepilogo giornaliero)
+    path('staff/riepilogo/', views.riepilogo_staff, name='riepilogo'),
+    
     # API JSON
-    path('api/slot-disponibili/', views.api_slot_disponibili, name='api_slot'),
+    path('api/slot-disponibili/', viste_lettura.api_slot_disponibili, name='api_slot'),
+    path('api/disponibilita/', views.api_disponibilita, name='api_disponibilita'),
+    path('api/disponibilita/statistiche/', views.api_statistiche_cache, name='api_statistiche_cache'),
+    path('api/ricerca/', views.api_ricerca, name='api_ricerca'),
+    path('api/analitica/', views.api_analitica, name='api_analitica'),
 ]
\ No newline at end of file
@@ -1,26 +1,94 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
-from .models import Appuntamento, Cliente, Barbiere, Servizio
-from .forms import RegistrazioneForm, AppuntamentoForm
+from django.db import router
+from .models import Appuntamento, AppuntamentoArchiviato, Cliente, Barbiere, RichiestaAttesa, Servizio
+from .archivio import STATI_ARCHIVIABILI
+from .catalogo import catalogo, durata_servizio, nomi, pagina_in_cache, salva_pagina_in_cache, versione as versione_catalogo
+from .forms import RegistrazioneForm, AppuntamentoForm, RichiestaAttesaForm
+from .esportazione import FORMATI as FORMATI_ESPORTAZIONE, esporta, sommario_barbiere
+from .disponibilita import DURATA_SLOT, agende, griglia_slot, intervallo_giorni, slot_liberi, statistiche_cache
+from .paginazione import pagina_keyset_unita
+from .prenotazioni import cancella_e_promuovi, iscrivi_in_attesa, salva_appuntamento
+from . import analitica, ricerca
+from .riepilogo import occupazione, totali as totali_riepilogo
+from .middleware import aget_cliente_id, get_cliente_id
+from .strumentazione import budget_query
+from asgiref.sync import iscoroutinefunction
 from datetime import datetime, timedelta
+from functools import wraps
+
+
+# ===== DECORATORI =====
+def cliente_richiesto(view):
+    """
+    Lascia passare solo gli utenti con un profilo Cliente.
+    Il cliente è risolto una volta sola per richiesta (vedi middleware.py).
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper_async(request, *args, **kwargs):
+            if await aget_cliente_id(request) is None:
+                messages.error(request, 'Profilo cliente non trovato.')
+                return redirect('home')
+            return await view(request, *args, **kwargs)
+        return wrapper_async
+    
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if get_cliente_id(request) is None:
+            messages.error(request, 'Profilo cliente non trovato.')
+            return redirect('home')
+        return view(request, *args, **kwargs)
+    return wrapper
 
 
 # ===== HOME PAGE (GET) =====
+@budget_query(4)
 def home(request):
     """
     Home page - usa solo GET
+    Per i visitatori anonimi senza messaggi in sospeso la pagina intera
+    è in cache, legata alla versione del catalogo (vedi catalogo.py)
     """
-    context = {
-        'barbieri': Barbiere.objects.filter(attivo=True),
-        'servizi': Servizio.objects.all(),
+    versione = versione_catalogo()
+    anonima = home_anonima(request)
+    if anonima:
+        contenuto = pagina_in_cache('home', versione)
+        if contenuto is not None:
+            return risposta_home(contenuto)
+    
+    response = render(request, 'appointments/home.html', contesto_home(catalogo(versione), versione))
+    if anonima:
+        salva_pagina_in_cache('home', versione, response.content)
+    return risposta_home(response)
+
+
+def home_anonima(request):
+    """La home è uguale per tutti solo per gli anonimi senza messaggi da mostrare"""
+    return not request.user.is_authenticated and not messages.get_messages(request)
+
+
+def contesto_home(dati_catalogo, versione):
+    return {
+        'barbieri': dati_catalogo.barbieri,
+        'servizi': dati_catalogo.servizi,
+        'versione_catalogo': versione,
     }
-    return render(request, 'appointments/home.html', context)
+
+
+def risposta_home(contenuto):
+    """Risposta della home; varia con il cookie di sessione (utente loggato o no)"""
+    response = contenuto if isinstance(contenuto, HttpResponse) else HttpResponse(contenuto)
+    patch_vary_headers(response, ('Cookie',))
+    return response
 
 
 # ===== REGISTRAZIONE (GET + POST) =====
@@ -103,76 +171,129 @@ def logout_view(request):
 
 
 # ===== LISTA APPUNTAMENTI CON FILTRI (GET) =====
-@login_required
-def lista_appuntamenti(request):
+def appuntamenti_cliente(cliente_id, modello=Appuntamento):
     """
-    GET con parametri URL per filtrare
-    Esempio: /appuntamenti/?data=2025-10-15&barbiere=1&stato=confermato
+    Tutti gli appuntamenti del cliente, con barbiere e servizio nella stessa
+    query: niente query extra per riga nel template
     """
-    # Prendi il cliente loggato
-    try:
-        cliente = Cliente.objects.get(user=request.user)
-    except Cliente.DoesNotExist:
-        messages.error(request, 'Profilo cliente non trovato.')
-        return redirect('home')
-    
-    # Inizia con tutti gli appuntamenti del cliente
-    appuntamenti = Appuntamento.objects.filter(cliente=cliente)
-    
+    return modello.objects.filter(cliente_id=cliente_id).select_related(
+        'barbiere', 'servizio'
+    ).only(
+        'data_ora', 'stato', 'barbiere__nome', 'servizio__nome', 'servizio__prezzo'
+    )
+
+
+def filtri_lista(request):
+    """Filtri GET data/barbiere/stato della lista appuntamenti, come argomenti di filter()"""
     # 📖 LEGGI i parametri GET dall'URL
     data_filtro = request.GET.get('data')
     barbiere_id = request.GET.get('barbiere')
     stato_filtro = request.GET.get('stato')
+    filtri = {}
     
     # Applica i filtri se presenti
     if data_filtro:
-        appuntamenti = appuntamenti.filter(data_ora__date=data_filtro)
+        try:
+            giorno = datetime.strptime(data_filtro, '%Y-%m-%d').date()
+        except ValueError:
+            messages.error(request, 'Data non valida.')
+        else:
+            # Intervallo semiaperto sul giorno locale: usa l'indice (cliente, data_ora)
+            filtri['data_ora__gte'], filtri['data_ora__lt'] = intervallo_giorni(giorno)
     
     if barbiere_id:
-        appuntamenti = appuntamenti.filter(barbiere_id=barbiere_id)
+        filtri['barbiere_id'] = barbiere_id
     
     if stato_filtro:
-        appuntamenti = appuntamenti.filter(stato=stato_filtro)
+        filtri['stato'] = stato_filtro
     
-    context = {
-        'appuntamenti': appuntamenti,
-        'barbieri': Barbiere.objects.filter(attivo=True),
-        'stati': Appuntamento.STATI,
+    return filtri
+
+
+def storico_cliente(request, cliente_id):
+    """
+    Queryset filtrati dello storico: appuntamenti attivi e archiviati (vedi
+    archivio.py). L'archivio si salta se il filtro di stato lo esclude.
+    """
+    filtri = filtri_lista(request)
+    querysets = [appuntamenti_cliente(cliente_id).filter(**filtri)]
+    if filtri.get('stato') in (None, *STATI_ARCHIVIABILI):
+        querysets.append(appuntamenti_cliente(cliente_id, AppuntamentoArchiviato).filter(**filtri))
+    return querysets
+
+
+def contesto_lista(request, pagina, cursore_successivo, dati_catalogo):
+    """Contesto del template della lista, con i link di paginazione"""
+    # Link alle altre pagine mantenendo i filtri attivi
+    parametri = request.GET.copy()
+    parametri.pop('dopo', None)
+    pagina_successiva = None
+    if cursore_successivo:
+        parametri['dopo'] = cursore_successivo
+        pagina_successiva = parametri.urlencode()
+        parametri.pop('dopo')
+    
+    return {
+        'appuntamenti': pagina,
+        'pagina_successiva': pagina_successiva,
+        'prima_pagina': parametri.urlencode() if request.GET.get('dopo') else None,
+        # Per i link di esportazione: stessi filtri, nessun cursore
+        'filtri': parametri.urlencode(),
+        'barbieri': dati_catalogo.barbieri,
+        'stati': dati_catalogo.stati,
         # Mantieni i filtri selezionati
-        'filtro_data': data_filtro,
-        'filtro_barbiere': barbiere_id,
-        'filtro_stato': stato_filtro,
+        'filtro_data': request.GET.get('data'),
+        'filtro_barbiere': request.GET.get('barbiere'),
+        'filtro_stato': request.GET.get('stato'),
     }
+
+
+@budget_query(7)
+@login_required
+@cliente_richiesto
+def lista_appuntamenti(request):
+    """
+    GET con parametri URL per filtrare
+    Esempio: /appuntamenti/?data=2025-10-15&barbiere=1&stato=confermato
+    Paginata a cursore con ?dopo=<cursore> (vedi paginazione.py),
+    comprende gli appuntamenti archiviati
+    """
+    querysets = storico_cliente(request, get_cliente_id(request))
     
+    # Paginazione a cursore: ?dopo=<cursore> riparte dall'ultima riga vista
+    pagina, cursore_successivo = pagina_keyset_unita(querysets, request.GET.get('dopo'))
+    
+    context = contesto_lista(request, pagina, cursore_successivo, catalogo())
     return render(request, 'appointments/lista_appuntamenti.html', context)
 
 
 # ===== CREA APPUNTAMENTO (GET + POST) =====
+@budget_query(14)
 @login_required
+@cliente_richiesto
 def crea_appuntamento(request):
     """
     GET  -> Mostra il form per creare appuntamento
     POST -> Crea l'appuntamento nel database
     """
-    try:
-        cliente = Cliente.objects.get(user=request.user)
-    except Cliente.DoesNotExist:
-        messages.error(request, 'Profilo cliente non trovato.')
-        return redirect('home')
-    
     if request.method == 'POST':
         # 📝 POST: Crea l'appuntamento
         form = AppuntamentoForm(request.POST)
         
         if form.is_valid():
             appuntamento = form.save(commit=False)
-            appuntamento.cliente = cliente
-            appuntamento.save()
+            appuntamento.cliente_id = get_cliente_id(request)
+            # Salvataggio atomico con controllo delle sovrapposizioni
+            esito = salva_appuntamento(appuntamento)
             
-            messages.success(request, f'Appuntamento prenotato per il {appuntamento.data_ora.strftime("%d/%m/%Y alle %H:%M")}!')
+            if esito:
+                messages.success(request, f'Appuntamento prenotato per il {appuntamento.data_ora.strftime("%d/%m/%Y alle %H:%M")}!')
+                
+                # Redirect dopo POST di successo
+                return redirect('lista_appuntamenti')
             
-            # Redirect dopo POST di successo
-            return redirect('lista_appuntamenti')
+            form.add_error(None, esito.messaggio)
+            messages.error(request, esito.messaggio)
         else:
             messages.error(request, 'Per favore controlla la data e anche i dati mancanti per favore')
     
@@ -180,39 +301,46 @@ def crea_appuntamento(request):
         # 📖 GET: Mostra il form vuoto
         form = AppuntamentoForm()
     
+    dati_catalogo = catalogo()
     context = {
         'form': form,
-        'barbieri': Barbiere.objects.filter(attivo=True),
-        'servizi': Servizio.objects.all(),
+        'barbieri': dati_catalogo.barbieri,
+        'servizi': dati_catalogo.servizi,
     }
     
     return render(request, 'appointments/crea_appuntamento.html', context)
 
 
 # ===== MODIFICA APPUNTAMENTO (GET + POST) =====
+# Cambio di stato: anche la riga del riepilogo, creata se è la prima del giorno
+@budget_query(17)
 @login_required
+@cliente_richiesto
 def modifica_appuntamento(request, appuntamento_id):
     """
     GET  -> Mostra il form pre-compilato
     POST -> Aggiorna l'appuntamento
     """
-    try:
-        cliente = Cliente.objects.get(user=request.user)
-    except Cliente.DoesNotExist:
-        messages.error(request, 'Profilo cliente non trovato.')
-        return redirect('home')
-    
     # Prendi l'appuntamento (solo se appartiene al cliente)
-    appuntamento = get_object_or_404(Appuntamento, id=appuntamento_id, cliente=cliente)
+    appuntamento = get_object_or_404(Appuntamento, id=appuntamento_id, cliente_id=get_cliente_id(request))
     
     if request.method == 'POST':
         # 📝 POST: Aggiorna l'appuntamento
         form = AppuntamentoForm(request.POST, instance=appuntamento)
         
         if form.is_valid():
-            form.save()
-            messages.success(request, 'Appuntamento modificato con successo!')
-            return redirect('lista_appuntamenti')
+            modificato = form.save(commit=False)
+            # 'stato' è escluso dal ModelForm: si applica qui, così il controllo
+            # dell'agenda in salva_appuntamento vale per lo stato scelto
+            modificato.stato = form.cleaned_data['stato']
+            esito = salva_appuntamento(modificato)
+            
+            if esito:
+                messages.success(request, 'Appuntamento modificato con successo!')
+                return redirect('lista_appuntamenti')
+            
+            form.add_error(None, esito.messaggio)
+            messages.error(request, esito.messaggio)
         else:
             messages.error(request, 'Per favore controlla la data e anche i dati mancanti per favore')
     
@@ -231,34 +359,118 @@ def modifica_appuntamento(request, appuntamento_id):
 
 # ===== CANCELLA APPUNTAMENTO (POST) =====
 @login_required
+@cliente_richiesto
 @require_http_methods(["POST"])
 def cancella_appuntamento(request, appuntamento_id):
     """
     Solo POST per sicurezza!
     Non usare mai GET per cancellare dati!
     """
-    try:
-        cliente = Cliente.objects.get(user=request.user)
-    except Cliente.DoesNotExist:
-        messages.error(request, 'Profilo cliente non trovato.')
-        return redirect('home')
+    appuntamento = get_object_or_404(
+        Appuntamento.objects.select_related('servizio'), id=appuntamento_id, cliente_id=get_cliente_id(request)
+    )
     
-    appuntamento = get_object_or_404(Appuntamento, id=appuntamento_id, cliente=cliente)
-    
-    # Cambia lo stato invece di eliminare
-    appuntamento.stato = 'cancellato'
-    appuntamento.save()
+    # Cambia lo stato invece di eliminare; il posto va a chi è in lista d'attesa
+    cancella_e_promuovi(appuntamento)
     
     messages.success(request, 'Appuntamento cancellato.')
     return redirect('lista_appuntamenti')
 
 
+# ===== LISTA D'ATTESA (GET + POST) =====
+@login_required
+@cliente_richiesto
+def lista_attesa(request):
+    """
+    GET  -> Le iscrizioni del cliente e il form per una nuova
+    POST -> Iscrive alla lista d'attesa (o prenota subito, se c'è già posto)
+    """
+    cliente_id = get_cliente_id(request)
+    if request.method == 'POST':
+        form = RichiestaAttesaForm(request.POST)
+        if form.is_valid():
+            richiesta = form.save(commit=False)
+            richiesta.cliente_id = cliente_id
+            appuntamento = iscrivi_in_attesa(richiesta)
+            if appuntamento:
+                messages.success(request, f"C'era posto: appuntamento prenotato per il {timezone.localtime(appuntamento.data_ora).strftime('%d/%m/%Y alle %H:%M')}!")
+                return redirect('lista_appuntamenti')
+            messages.success(request, "Sei in lista d'attesa: se si libera un posto ti prenotiamo automaticamente.")
+            return redirect('lista_attesa')
+        messages.error(request, 'Per favore controlla i dati della richiesta.')
+    else:
+        form = RichiestaAttesaForm()
+    
+    richieste = (
+        RichiestaAttesa.objects.filter(cliente_id=cliente_id, giorno__gte=timezone.localdate())
+        .select_related('barbiere', 'servizio', 'appuntamento')
+    )
+    return render(request, 'appointments/lista_attesa.html', {'form': form, 'richieste': richieste})
+
+
+@login_required
+@cliente_richiesto
+@require_http_methods(["POST"])
+def esci_attesa(request, richiesta_id):
+    """Ritira un'iscrizione ancora in attesa"""
+    richiesta = get_object_or_404(
+        RichiestaAttesa, id=richiesta_id, cliente_id=get_cliente_id(request), promossa_il__isnull=True
+    )
+    richiesta.delete()
+    messages.success(request, "Iscrizione alla lista d'attesa ritirata.")
+    return redirect('lista_attesa')
+
+
+# ===== ESPORTAZIONE CSV / iCalendar (GET) =====
+GIORNI_AGENDA = 90
+
+
+@login_required
+@cliente_richiesto
+def esporta_appuntamenti(request, formato):
+    """
+    Appuntamenti del cliente, archiviati compresi, con gli stessi filtri della lista
+    GET: /appuntamenti/esporta.csv?stato=completato  (oppure esporta.ics)
+    """
+    if formato not in FORMATI_ESPORTAZIONE:
+        raise Http404("Formato non supportato")
+    querysets = storico_cliente(request, get_cliente_id(request))
+    return esporta(request, formato, 'appuntamenti', *querysets, nome_calendario='I miei appuntamenti')
+
+
+@staff_member_required
+def esporta_agenda_barbiere(request, barbiere_id, formato):
+    """
+    Agenda di un barbiere senza gli appuntamenti cancellati, per default
+    da oggi ai prossimi GIORNI_AGENDA giorni
+    GET: /barbieri/3/agenda.ics?dal=2025-10-01&al=2025-12-31
+    """
+    if formato not in FORMATI_ESPORTAZIONE:
+        raise Http404("Formato non supportato")
+    barbiere = get_object_or_404(Barbiere, id=barbiere_id)
+    try:
+        dal = datetime.strptime(request.GET['dal'], '%Y-%m-%d').date() if request.GET.get('dal') else timezone.localdate()
+        al = datetime.strptime(request.GET['al'], '%Y-%m-%d').date() if request.GET.get('al') else dal + timedelta(days=GIORNI_AGENDA)
+    except ValueError:
+        return JsonResponse({'error': 'Parametri non validi'}, status=400)
+    
+    inizio, fine = intervallo_giorni(dal, al)
+    agenda = Appuntamento.objects.filter(
+        barbiere=barbiere, data_ora__gte=inizio, data_ora__lt=fine
+    ).exclude(stato='cancellato')
+    return esporta(
+        request, formato, f'agenda-{barbiere.pk}-{dal.isoformat()}', agenda,
+        nome_calendario=f'Agenda {barbiere.nome}', sommario=sommario_barbiere,
+    )
+
+
 # ===== API JSON: SLOT DISPONIBILI (GET) =====
+@budget_query(5)
 @login_required
 def api_slot_disponibili(request):
     """
     Restituisce gli slot orari disponibili in formato JSON
-    GET: /api/slot-disponibili/?data=2025-10-15&barbiere=1
+    GET: /api/slot-disponibili/?data=2025-10-15&barbiere=1[&servizio=3]
     """
     data_str = request.GET.get('data')
     barbiere_id = request.GET.get('barbiere')
@@ -272,33 +484,201 @@ def api_slot_disponibili(request):
     except (ValueError, Barbiere.DoesNotExist):
         return JsonResponse({'error': 'Parametri non validi'}, status=400)
     
-    # Trova appuntamenti già prenotati
-    appuntamenti_occupati = Appuntamento.objects.filter(
-        barbiere=barbiere,
-        data_ora__date=data,
-        stato='confermato'
-    ).values_list('data_ora', flat=True)
+    # Durata del servizio richiesto (default: uno slot della griglia)
+    durata = DURATA_SLOT
+    servizio_id = request.GET.get('servizio')
+    if servizio_id:
+        try:
+            durata = durata_servizio(servizio_id)
+        except Servizio.DoesNotExist:
+            return JsonResponse({'error': 'Parametri non validi'}, status=400)
     
-    orari_occupati = [app.time() for app in appuntamenti_occupati]
-    
-    # Genera slot dalle 9:00 alle 18:00 ogni 30 minuti
-    slot_disponibili = []
-    ora_corrente = datetime.min.time().replace(hour=9, minute=0)
-    ora_fine = datetime.min.time().replace(hour=18, minute=0)
-    
-    current_time = datetime.combine(datetime.today(), ora_corrente)
-    end_time = datetime.combine(datetime.today(), ora_fine)
-    
-    while current_time < end_time:
-        if current_time.time() not in orari_occupati:
-            slot_disponibili.append({
-                'ora': current_time.strftime('%H:%M'),
-                'disponibile': True
-            })
-        current_time += timedelta(minutes=30)
+    # Gli slot tengono conto della durata di ogni appuntamento già prenotato
+    slot_disponibili = [
+        {'ora': ora.strftime('%H:%M'), 'disponibile': True}
+        for ora in slot_liberi(barbiere.id, data, durata)
+    ] if barbiere.attivo else []
     
     return JsonResponse({
         'data': data_str,
         'barbiere': barbiere.nome,
         'slot': slot_disponibili
     })
+
+
+# ===== API JSON: DISPONIBILITÀ SU PIÙ GIORNI E BARBIERI (GET) =====
+MAX_GIORNI_DISPONIBILITA = 62
+
+
+@budget_query(5)
+@login_required
+def api_disponibilita(request):
+    """
+    Disponibilità di più barbieri su un intervallo di date, con una sola query
+    sugli appuntamenti. Ogni giorno è codificato come stringa di '0'/'1',
+    un carattere per ogni orario della lista 'orari'.
+    GET: /api/disponibilita/?dal=2025-10-01&al=2025-10-31[&barbieri=1,2][&servizio=3]
+    Senza 'barbieri' restituisce tutti i barbieri attivi.
+    """
+    dal_str = request.GET.get('dal')
+    al_str = request.GET.get('al') or dal_str
+    
+    if not dal_str:
+        return JsonResponse({'error': 'Parametri mancanti'}, status=400)
+    
+    try:
+        dal = datetime.strptime(dal_str, '%Y-%m-%d').date()
+        al = datetime.strptime(al_str, '%Y-%m-%d').date()
+        barbieri_ids = [int(i) for i in request.GET.get('barbieri', '').split(',') if i]
+    except ValueError:
+        return JsonResponse({'error': 'Parametri non validi'}, status=400)
+    
+    if al < dal or (al - dal).days >= MAX_GIORNI_DISPONIBILITA:
+        return JsonResponse({'error': f'Intervallo non valido (massimo {MAX_GIORNI_DISPONIBILITA} giorni)'}, status=400)
+    
+    durata = DURATA_SLOT
+    servizio_id = request.GET.get('servizio')
+    if servizio_id:
+        try:
+            durata = durata_servizio(servizio_id)
+        except Servizio.DoesNotExist:
+            return JsonResponse({'error': 'Parametri non validi'}, status=400)
+    
+    # Solo barbieri attivi, come api_slot_disponibili
+    barbieri = Barbiere.objects.filter(attivo=True)
+    if barbieri_ids:
+        barbieri = barbieri.filter(id__in=barbieri_ids)
+    nomi_barbieri = dict(barbieri.values_list('id', 'nome'))
+    
+    agende_barbieri = agende(list(nomi_barbieri), dal, al)
+    
+    return JsonResponse({
+        'dal': dal.isoformat(),
+        'al': al.isoformat(),
+        'orari': [ora.strftime('%H:%M') for ora in griglia_slot()],
+        'barbieri': {
+            barbiere_id: {
+                'nome': nomi_barbieri[barbiere_id],
+                'giorni': {
+                    giorno.isoformat(): agenda.bitmap_slot(durata)
+                    for giorno, agenda in giorni.items()
+                },
+            }
+            for barbiere_id, giorni in agende_barbieri.items()
+        },
+    })
+
+
+# ===== API JSON: STATISTICHE CACHE DISPONIBILITÀ (GET, solo staff) =====
+@staff_member_required
+def api_statistiche_cache(request):
+    """
+    Contatori hit/miss della cache delle agende del processo che risponde
+    GET: /api/disponibilita/statistiche/
+    """
+    return JsonResponse(statistiche_cache())
+
+
+# ===== API JSON: RICERCA CLIENTI E NOTE (GET, solo staff) =====
+@staff_member_required
+def api_ricerca(request):
+    """
+    Clienti (nome, email, telefono) e note degli appuntamenti più pertinenti
+    GET: /api/ricerca/?q=rossi
+    """
+    testo = request.GET.get('q', '').strip()
+    risultati = ricerca.cerca(testo, router.db_for_read(Cliente))
+    if risultati is None:
+        return JsonResponse({'error': f'Cerca almeno {ricerca.MINIMO} caratteri'}, status=400)
+    return JsonResponse({
+        'q': testo,
+        'clienti': [
+            {'id': cliente.pk, 'nome': cliente.nome, 'email': cliente.email, 'telefono': cliente.telefono}
+            for cliente in risultati['clienti']
+        ],
+        'appuntamenti': [
+            {
+                'id': appuntamento.pk,
+                'data_ora': appuntamento.data_ora.isoformat(),
+                'cliente': appuntamento.cliente.nome,
+                'barbiere': appuntamento.barbiere.nome,
+                'stato': appuntamento.stato,
+                'estratto': estratto,
+            }
+            for appuntamento, estratto in risultati['appuntamenti']
+        ],
+    })
+
+
+# ===== RIEPILOGO PER LO STAFF (GET) =====
+GIORNI_RIEPILOGO = 30
+
+
+@budget_query(7)
+@staff_member_required
+def riepilogo_staff(request):
+    """
+    Appuntamenti, minuti, ricavo, cancellazioni e occupazione per barbiere,
+    servizio e giorno, letti solo dal riepilogo giornaliero: il costo non
+    cresce con lo storico. Default: gli ultimi GIORNI_RIEPILOGO giorni.
+    GET: /staff/riepilogo/?dal=2025-10-01&al=2025-10-31
+    """
+    try:
+        al = datetime.strptime(request.GET['al'], '%Y-%m-%d').date() if request.GET.get('al') else timezone.localdate()
+        dal = datetime.strptime(request.GET['dal'], '%Y-%m-%d').date() if request.GET.get('dal') else al - timedelta(days=GIORNI_RIEPILOGO - 1)
+    except ValueError:
+        return JsonResponse({'error': 'Parametri non validi'}, status=400)
+    if dal > al:
+        dal, al = al, dal
+    
+    nomi_barbieri, nomi_servizi = dict(nomi(Barbiere)), dict(nomi(Servizio))
+    per_barbiere = [
+        {**riga, 'nome': nomi_barbieri.get(riga['barbiere_id']), 'occupazione': occupazione(riga['minuti'], riga['giorni'])}
+        for riga in totali_riepilogo(dal, al, ['barbiere_id'])
+    ]
+    per_servizio = [
+        {**riga, 'nome': nomi_servizi.get(riga['servizio_id'])}
+        for riga in totali_riepilogo(dal, al, ['servizio_id'])
+    ]
+    totale = {
+        campo: sum(riga[campo] for riga in per_barbiere)
+        for campo in ('appuntamenti', 'minuti', 'ricavo', 'cancellati')
+    }
+    return render(request, 'appointments/riepilogo.html', {
+        'dal': dal,
+        'al': al,
+        'totale': totale,
+        'per_barbiere': per_barbiere,
+        'per_servizio': per_servizio,
+        'per_giorno': totali_riepilogo(dal, al, ['giorno']),
+    })
+
+
+GIORNI_ANALITICA = 90
+GIORNI_ANALITICA_MASSIMI = 731
+
+
+@staff_member_required
+def api_analitica(request):
+    """
+    Occupazione giorno della settimana × ora per barbiere, tassi di
+    cancellazione e di mancata presentazione, ore di punta (vedi analitica.py).
+    Default: gli ultimi GIORNI_ANALITICA giorni.
+    GET: /api/analitica/?dal=2025-01-01&al=2025-06-30&barbiere=3
+    """
+    try:
+        al = datetime.strptime(request.GET['al'], '%Y-%m-%d').date() if request.GET.get('al') else timezone.localdate()
+        dal = datetime.strptime(request.GET['dal'], '%Y-%m-%d').date() if request.GET.get('dal') else al - timedelta(days=GIORNI_ANALITICA - 1)
+        barbieri = [int(valore) for valore in request.GET.getlist('barbiere')]
+    except ValueError:
+        return JsonResponse({'error': 'Parametri non validi'}, status=400)
+    if dal > al:
+        dal, al = al, dal
+    if (al - dal).days >= GIORNI_ANALITICA_MASSIMI:
+        return JsonResponse({'error': f'Periodo massimo: {GIORNI_ANALITICA_MASSIMI} giorni'}, status=400)
+    
+    risultato = analitica.analisi(dal, al, barbieri)
+    nomi_barbieri = dict(nomi(Barbiere))
+    for riga in risultato['barbieri']:
+        riga['nome'] = nomi_barbieri.get(riga['barbiere_id'])
+    return JsonResponse(risultato)
@@ -0,0 +1,102 @@
+"""
+Versioni asincrone delle viste più lette: home, lista appuntamenti e API slot.
+
+Usano l'ORM e la cache asincroni di Django, così sotto un server ASGI
+(uvicorn, daphne, ...) una richiesta in attesa del database non tiene
+occupato un thread. Si attivano con VISTE_ASYNC = True in settings.py
+(vedi appointments/urls.py); il comportamento è identico a views.py.
+"""
+from datetime import datetime
+
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import render
+
+from .catalogo import acatalogo, adurata_servizio, apagina_in_cache, asalva_pagina_in_cache, aversione
+from .disponibilita import DURATA_SLOT, aagende
+from .middleware import aget_cliente_id
+from .models import Barbiere, Servizio
+from .paginazione import apagina_keyset_unita
+from .strumentazione import budget_query
+from .views import (
+    cliente_richiesto, contesto_home, contesto_lista, home_anonima, risposta_home, storico_cliente,
+)
+
+
+async def _prepara_utente(request):
+    """
+    Risolve l'utente in modo asincrono: i context processor dei template
+    leggono request.user, che altrimenti farebbe una query sincrona.
+    """
+    request.user = await request.auser()
+
+
+# ===== HOME PAGE (GET) =====
+@budget_query(4)
+async def home(request):
+    await _prepara_utente(request)
+    versione = await aversione()
+    anonima = home_anonima(request)
+    if anonima:
+        contenuto = await apagina_in_cache('home', versione)
+        if contenuto is not None:
+            return risposta_home(contenuto)
+    
+    context = contesto_home(await acatalogo(versione), versione)
+    response = render(request, 'appointments/home.html', context)
+    if anonima:
+        await asalva_pagina_in_cache('home', versione, response.content)
+    return risposta_home(response)
+
+
+# ===== LISTA APPUNTAMENTI CON FILTRI (GET) =====
+@budget_query(7)
+@login_required
+@cliente_richiesto
+async def lista_appuntamenti(request):
+    await _prepara_utente(request)
+    querysets = storico_cliente(request, await aget_cliente_id(request))
+    pagina, cursore_successivo = await apagina_keyset_unita(querysets, request.GET.get('dopo'))
+    
+    context = contesto_lista(request, pagina, cursore_successivo, await acatalogo())
+    return render(request, 'appointments/lista_appuntamenti.html', context)
+
+
+# ===== API JSON: SLOT DISPONIBILI (GET) =====
+@budget_query(5)
+@login_required
+async def api_slot_disponibili(request):
+    """GET: /api/slot-disponibili/?data=2025-10-15&barbiere=1[&servizio=3]"""
+    data_str = request.GET.get('data')
+    barbiere_id = request.GET.get('barbiere')
+    
+    if not data_str or not barbiere_id:
+        return JsonResponse({'error': 'Parametri mancanti'}, status=400)
+    
+    try:
+        data = datetime.strptime(data_str, '%Y-%m-%d').date()
+        barbiere = await Barbiere.objects.aget(id=barbiere_id)
+    except (ValueError, Barbiere.DoesNotExist):
+        return JsonResponse({'error': 'Parametri non validi'}, status=400)
+    
+    durata = DURATA_SLOT
+    servizio_id = request.GET.get('servizio')
+    if servizio_id:
+        try:
+            durata = await adurata_servizio(servizio_id)
+        except Servizio.DoesNotExist:
+            return JsonResponse({'error': 'Parametri non validi'}, status=400)
+    
+    slot_disponibili = []
+    if barbiere.attivo:
+        agenda = (await aagende([barbiere.id], data, data))[barbiere.id][data]
+        slot_disponibili = [
+            {'ora': ora.strftime('%H:%M'), 'disponibile': True}
+            for ora in agenda.slot_liberi(durata)
+        ]
+    
+    return JsonResponse({
+        'data': data_str,
+        'barbiere': barbiere.nome,
+        'slot': slot_disponibili
+    })
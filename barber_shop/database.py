@@ -0,0 +1,58 @@
+"""
+Profili di configurazione per i database SQLite del progetto.
+
+- ``standard``: SQLite come lo configura Django, una connessione per richiesta.
+- ``ottimizzato``: journal WAL (i lettori non aspettano lo scrittore e
+  viceversa), pragma per cache e I/O a ogni connessione, attesa sul lock
+  invece dell'errore immediato, connessioni persistenti con controllo di
+  salute e ``BEGIN IMMEDIATE`` per le transazioni: chi scrive prende il lock
+  all'inizio invece di scoprire il conflitto al primo UPDATE, quando SQLite
+  non può più aspettare e solleva "database is locked". Il prezzo: anche un
+  ``atomic()`` che legge soltanto prende il lock e si mette in fila dietro
+  le scritture, quindi le letture restano in autocommit (nessun BEGIN).
+
+Vedi scripts/bench_sqlite_concorrenza.py per il confronto tra i due profili.
+"""
+
+PROFILI = ('standard', 'ottimizzato')
+
+PRAGMA_OTTIMIZZATI = {
+    'journal_mode': 'WAL',
+    # Con WAL è sicuro: un crash del sistema può perdere solo gli ultimi commit
+    'synchronous': 'NORMAL',
+    # Negativo = KiB: 64 MB di cache per connessione
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# Secondi di attesa su un database bloccato prima di "database is locked"
+ATTESA_LOCK = 20
+# Durata delle connessioni persistenti (secondi)
+DURATA_CONNESSIONI = 600
+
+
+def sqlite(nome, profilo='ottimizzato', test_nome=None):
+    """Voce di DATABASES per il file ``nome`` con il profilo richiesto"""
+    if profilo not in PROFILI:
+        raise ValueError(f"Profilo SQLite sconosciuto: {profilo!r} (validi: {', '.join(PROFILI)})")
+
+    database = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': nome,
+    }
+    if test_nome:
+        database['TEST'] = {'NAME': test_nome}
+    if profilo == 'ottimizzato':
+        database.update({
+            'CONN_MAX_AGE': DURATA_CONNESSIONI,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': ATTESA_LOCK,
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': ';'.join(
+                    f'PRAGMA {pragma}={valore}' for pragma, valore in PRAGMA_OTTIMIZZATI.items()
+                ),
+            },
+        })
+    return database
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from barber_shop.database import sqlite
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,11 +44,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "appointments.strumentazione.StrumentazioneMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "appointments.router.PrimarioDopoScritturaMiddleware",
+    "appointments.middleware.ClienteMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -54,7 +60,8 @@ ROOT_URLCONF = "barber_shop.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates con misura del tempo di render (appointments.strumentazione)
+        "BACKEND": "appointments.strumentazione.TemplateMisurati",
         "DIRS": [],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -70,17 +77,116 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "barber_shop.wsgi.application"
 
+# Viste asincrone per home, lista appuntamenti e API slot (appointments.views_async).
+# Da attivare quando il sito è servito via ASGI, es.:
+#   BARBER_VISTE_ASYNC=1 uvicorn barber_shop.asgi:application
+VISTE_ASYNC = os.environ.get("BARBER_VISTE_ASYNC") == "1"
+
+# Strumentazione per richiesta (appointments.strumentazione): header
+# Server-Timing e log delle richieste oltre le soglie. Opt-in, es.:
+#   BARBER_STRUMENTAZIONE=1 gunicorn barber_shop.wsgi
+STRUMENTAZIONE = os.environ.get("BARBER_STRUMENTAZIONE") == "1"
+STRUMENTAZIONE_SOGLIA_MS = 500
+STRUMENTAZIONE_SOGLIA_QUERY = 20
+
+# True: le viste oltre il budget di @budget_query sollevano un'eccezione
+# (i test lo attivano con override_settings); False: il superamento viene solo loggato
+BUDGET_QUERY_ERRORE = False
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Profilo SQLite (vedi barber_shop/database.py): "ottimizzato" (WAL, pragma,
+# connessioni persistenti, BEGIN IMMEDIATE) oppure "standard". Con
+# "ottimizzato" ogni atomic() prende il lock di scrittura, anche se legge
+# soltanto: le letture (esportazioni, analitica, elenchi) vanno lasciate
+# in autocommit, fuori da atomic(), dove non aspettano nessuno.
+SQLITE_PROFILO = os.environ.get("BARBER_SQLITE_PROFILO", "ottimizzato")
+
 DATABASES = {
+    "default": sqlite(
+        os.environ.get("BARBER_DB") or BASE_DIR / "db.sqlite3",
+        SQLITE_PROFILO,
+        # Database di test su file (non in memoria): i test di concorrenza
+        # aprono una connessione per thread
+        test_nome=BASE_DIR / "test_db.sqlite3",
+    ),
+}
+
+# Repliche in sola lettura per l'app appointments (appointments.router).
+# In locale fa da replica una copia del database aggiornata periodicamente:
+#   python scripts/sincronizza_replica.py db.sqlite3 db_replica.sqlite3 &
+#   BARBER_DB_REPLICA=db_replica.sqlite3 python manage.py runserver
+DATABASE_REPLICHE = []
+if os.environ.get("BARBER_DB_REPLICA"):
+    DATABASES["replica"] = sqlite(os.environ["BARBER_DB_REPLICA"], SQLITE_PROFILO)
+    # Nei test la replica è lo stesso database di test del primario
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+    DATABASE_REPLICHE = ["replica"]
+
+DATABASE_ROUTERS = ["appointments.router.RouterLetturaScrittura"]
+# Per quanti secondi dopo una scrittura un client legge dal primario
+REPLICHE_PRIMARIO_SECONDI = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Di default in memoria locale; basta cambiare BACKEND (es. Redis o Memcached)
+# per condividerla tra più processi.
+
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "barber-shop",
     }
 }
 
+# Alias della cache usata per le agende dei barbieri (appointments.disponibilita)
+DISPONIBILITA_CACHE = "default"
+DISPONIBILITA_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Alias della cache del catalogo (barbieri, servizi) e della home per gli
+# anonimi (appointments.catalogo); invalidata dai segnali di Barbiere e Servizio
+CATALOGO_CACHE = "default"
+CATALOGO_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Alias della cache utente -> cliente (appointments.middleware); None la disattiva
+CLIENTE_CACHE = "default"
+
+# Archivio degli appuntamenti (appointments.archivio): completati e cancellati
+# più vecchi di così passano in AppuntamentoArchiviato, a lotti di ARCHIVIO_LOTTO
+# (python manage.py archivia_appuntamenti, da lanciare periodicamente)
+ARCHIVIO_ORIZZONTE_GIORNI = 365
+ARCHIVIO_LOTTO = 1000
+
+# Importazione dei clienti (appointments.importazione): righe per bulk_create
+# e processi per gli hash delle password (None = tutti i core)
+IMPORTAZIONE_LOTTO = 1000
+IMPORTAZIONE_PROCESSI = None
+
+# Changelist dell'admin (appointments.elenchi_admin): oltre questo numero di
+# righe il totale mostrato è una stima invece di un COUNT(*) esatto
+ADMIN_LIMITE_CONTEGGIO = 10000
+
+# Coda dei lavori in background (appointments.coda, python manage.py lavora):
+# tentativi per lavoro, secondi prima del nuovo tentativo (raddoppiano a ogni
+# fallimento fino a CODA_ATTESA_MASSIMA), secondi dopo i quali un lavoro preso
+# da un worker che non ha risposto torna disponibile, giorni di conservazione
+# dei lavori chiusi
+CODA_TENTATIVI = 5
+CODA_ATTESA_BASE = 30
+CODA_ATTESA_MASSIMA = 60 * 60
+CODA_VISIBILITA = 5 * 60
+CODA_CONSERVA_GIORNI = 7
+
+# Promemoria per email (appointments.promemoria): ore prima dell'appuntamento
+PROMEMORIA_ANTICIPO_ORE = 24
+
+# Email (conferme e promemoria): in sviluppo stampate sulla console
+EMAIL_BACKEND = os.environ.get("BARBER_EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend")
+DEFAULT_FROM_EMAIL = os.environ.get("BARBER_EMAIL_MITTENTE", "Barbershop <noreply@barbershop.local>")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -126,6 +232,13 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Serviti da appointments.media.servi_media. In produzione il file può
+# inviarlo il server davanti: "x-sendfile" (Apache mod_xsendfile) oppure
+# "x-accel-redirect" (nginx, location internal su MEDIA_ACCEL_PREFIX)
+MEDIA_SENDFILE = os.environ.get("BARBER_MEDIA_SENDFILE") or None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Cache-Control dei media senza hash nel nome (i nomi con hash durano un anno)
+MEDIA_MAX_AGE = 60 * 60
 
 # Login settings
 LOGIN_URL = '/login/'
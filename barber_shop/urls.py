@@ -1,13 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
+
+from appointments.media import servi_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('appointments.urls')),
+    # File caricati (foto dei barbieri), anche in produzione: vedi appointments/media.py
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:percorso>", servi_media, name='media'),
 ]
-
-# Serve media files in development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
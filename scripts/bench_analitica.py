@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Benchmark: mappe di occupazione e tassi calcolati con un ciclo Python sulle
+righe contro il calcolo vettoriale di appointments/analitica.py.
+
+Genera ``--righe`` appuntamenti sintetici in memoria (barbiere, data_ora come
+testo UTC alla maniera di SQLite, durata, stato) su ``--giorni`` giorni e
+misura le due strade a partire dalle stesse colonne, controllando che diano
+lo stesso risultato. Con ``--database`` misura anche la lettura delle colonne
+dal database configurato (``carica``) sugli ultimi ``--giorni`` giorni.
+
+Uso: python scripts/bench_analitica.py [--righe 2000000] [--barbieri 20] [--giorni 730] [--database]
+"""
+import argparse
+import os
+import sys
+import time as cronometro
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def genera(righe, barbieri, giorni, seed):
+    """Colonne sintetiche con la stessa forma di quelle lette da ``colonne()``"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    primo = np.datetime64('2024-01-01T00:00:00', 's')
+    giorno = rng.integers(0, giorni, righe)
+    # Dalle 8 alle 17 UTC a quarti d'ora: in ora locale l'orario di apertura
+    minuto = rng.integers(8 * 4, 17 * 4, righe) * 15
+    inizio = primo + giorno * 86400 + minuto * 60
+    testi = np.datetime_as_string(inizio, unit='s').astype(object)
+    return {
+        'barbiere': rng.integers(1, barbieri + 1, righe),
+        'testi': [testo.replace('T', ' ') for testo in testi],
+        'durata': rng.choice(np.array([15, 30, 45, 60, 90], dtype=np.int32), righe),
+        'stato': rng.choice(
+            np.array(['confermato', 'completato', 'cancellato', 'in_attesa']), righe, p=[0.2, 0.6, 0.15, 0.05]
+        ),
+    }
+
+
+def ciclo_python(barbieri, testi, durate, stati, adesso, fuso):
+    """Lo stesso calcolo riga per riga, come si farebbe iterando sugli oggetti"""
+    minuti = defaultdict(lambda: [[0] * 24 for _ in range(7)])
+    conteggi = defaultdict(Counter)
+    for barbiere, testo, durata, stato in zip(barbieri, testi, durate, stati):
+        inizio = datetime.strptime(testo, '%Y-%m-%d %H:%M:%S').replace(tzinfo=dt_timezone.utc)
+        conteggi[barbiere]['totale'] += 1
+        if stato == 'cancellato':
+            conteggi[barbiere]['cancellati'] += 1
+        elif inizio < adesso:
+            conteggi[barbiere]['passati'] += 1
+            if stato == 'confermato':
+                conteggi[barbiere]['assenti'] += 1
+        if stato not in ('confermato', 'completato'):
+            continue
+        locale = inizio.astimezone(fuso)
+        minuto, fine = locale.hour * 60 + locale.minute, locale.hour * 60 + locale.minute + durata
+        while minuto < fine:
+            ora = minuto // 60
+            passati = min(fine, (ora + 1) * 60) - minuto
+            minuti[barbiere][(locale.weekday() + ora // 24) % 7][ora % 24] += passati
+            minuto += passati
+    return minuti, conteggi
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--righe', type=int, default=2000000)
+    parser.add_argument('--barbieri', type=int, default=20)
+    parser.add_argument('--giorni', type=int, default=730)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database', action='store_true', help="misura anche la lettura dal database")
+    args = parser.parse_args()
+
+    sys.path.insert(0, RADICE)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'barber_shop.settings')
+    import django
+    django.setup()
+
+    import numpy as np
+    from django.utils import timezone
+
+    from appointments import analitica
+
+    dal = date(2024, 1, 1)
+    al = dal + timedelta(days=args.giorni - 1)
+    adesso = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+    print(f"Genero {args.righe} appuntamenti su {args.giorni} giorni...")
+    sintetici = genera(args.righe, args.barbieri, args.giorni, args.seed)
+
+    inizio = cronometro.perf_counter()
+    dati = {
+        'barbiere': sintetici['barbiere'],
+        'inizio': analitica._secondi_utc(sintetici['testi']),
+        'durata': sintetici['durata'],
+        'stato': sintetici['stato'],
+    }
+    conversione = cronometro.perf_counter() - inizio
+    inizio = cronometro.perf_counter()
+    risultato = analitica.analizza(dati, dal, al, adesso)
+    vettoriale = cronometro.perf_counter() - inizio
+
+    inizio = cronometro.perf_counter()
+    minuti, conteggi = ciclo_python(
+        sintetici['barbiere'].tolist(), sintetici['testi'], sintetici['durata'].tolist(),
+        sintetici['stato'].tolist(), adesso, timezone.get_current_timezone(),
+    )
+    python = cronometro.perf_counter() - inizio
+
+    for riga in risultato['barbieri']:
+        barbiere = riga['barbiere_id']
+        assert riga['minuti_prenotati'] == sum(map(sum, minuti[barbiere])), barbiere
+        assert riga['appuntamenti'] == conteggi[barbiere]['totale'], barbiere
+        assert riga['tasso_cancellazioni'] == round(conteggi[barbiere]['cancellati'] / conteggi[barbiere]['totale'], 4)
+        assert riga['tasso_assenze'] == round(conteggi[barbiere]['assenti'] / max(1, conteggi[barbiere]['passati']), 4)
+    capienza = analitica.conta_giorni_settimana(dal, al)[:, None] * 60
+    ore = risultato['ore']
+    for riga in risultato['barbieri']:
+        attesa = 100 * np.array(minuti[riga['barbiere_id']]) / capienza
+        assert np.allclose(np.array(riga['occupazione']), np.round(attesa[:, ore], 1))
+
+    print(f"\n{'':<28}{'secondi':>10}{'righe/s':>14}")
+    print(f"{'ciclo Python':<28}{python:>10.2f}{args.righe / python:>14,.0f}")
+    print(f"{'NumPy (date da testo)':<28}{conversione:>10.2f}{args.righe / conversione:>14,.0f}")
+    print(f"{'NumPy (calcolo)':<28}{vettoriale:>10.2f}{args.righe / vettoriale:>14,.0f}")
+    print(f"\nStessi risultati; NumPy {python / (conversione + vettoriale):.0f}x più veloce")
+
+    if args.database:
+        oggi = timezone.localdate()
+        inizio = cronometro.perf_counter()
+        dati = analitica.carica(oggi - timedelta(days=args.giorni - 1), oggi)
+        lettura = cronometro.perf_counter() - inizio
+        print(f"\nLettura dal database: {len(dati['barbiere'])} righe in {lettura:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Benchmark: vecchio ciclo di api_slot_disponibili contro il motore di disponibilità.
+
+Genera in memoria migliaia di appuntamenti per un barbiere distribuiti su
+un intervallo di giorni e misura, per entrambi gli algoritmi, il tempo per
+calcolare gli slot liberi di ogni giorno. Riporta anche quanti slot il
+vecchio ciclo dichiarava liberi pur essendo sovrapposti a un servizio lungo.
+
+Uso: python scripts/bench_disponibilita.py [--appuntamenti 5000] [--giorni 365]
+"""
+import argparse
+import os
+import random
+import sys
+import time as cronometro
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'barber_shop.settings')
+django.setup()
+
+from appointments.disponibilita import AgendaGiornaliera, DURATA_SLOT
+
+DURATE = [15, 20, 30, 45, 50, 75]
+
+
+def genera(n_appuntamenti, n_giorni, seed):
+    """Appuntamenti (data_ora, durata) allineati a 15 minuti dentro l'orario di apertura"""
+    rnd = random.Random(seed)
+    primo = date(2025, 1, 1)
+    per_giorno = defaultdict(list)
+    for _ in range(n_appuntamenti):
+        giorno = primo + timedelta(days=rnd.randrange(n_giorni))
+        durata = rnd.choice(DURATE)
+        inizio = rnd.randrange(9 * 4, 18 * 4 - (durata + 14) // 15) * 15
+        data_ora = datetime.combine(giorno, time(inizio // 60, inizio % 60))
+        per_giorno[giorno].append((data_ora, durata))
+    return per_giorno
+
+
+def vecchio_ciclo(appuntamenti):
+    """Copia fedele del vecchio algoritmo: scarta solo gli slot che iniziano esattamente a un orario occupato"""
+    orari_occupati = [data_ora.time() for data_ora, _ in appuntamenti]
+    slot = []
+    current_time = datetime.combine(datetime.today(), time(9, 0))
+    end_time = datetime.combine(datetime.today(), time(18, 0))
+    while current_time < end_time:
+        if current_time.time() not in orari_occupati:
+            slot.append(current_time.time())
+        current_time += timedelta(minutes=DURATA_SLOT)
+    return slot
+
+
+def motore(giorno, appuntamenti):
+    return AgendaGiornaliera.da_appuntamenti(giorno, appuntamenti).slot_liberi()
+
+
+def misura(funzione, per_giorno, ripetizioni):
+    migliore = float('inf')
+    for _ in range(ripetizioni):
+        inizio = cronometro.perf_counter()
+        for giorno, appuntamenti in per_giorno.items():
+            funzione(giorno, appuntamenti)
+        migliore = min(migliore, cronometro.perf_counter() - inizio)
+    return migliore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--appuntamenti', type=int, default=5000)
+    parser.add_argument('--giorni', type=int, default=365)
+    parser.add_argument('--ripetizioni', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    per_giorno = genera(args.appuntamenti, args.giorni, args.seed)
+
+    t_vecchio = misura(lambda g, a: vecchio_ciclo(a), per_giorno, args.ripetizioni)
+    t_motore = misura(motore, per_giorno, args.ripetizioni)
+
+    # Slot dichiarati liberi dal vecchio ciclo ma in realtà sovrapposti
+    errati = sum(
+        len(set(vecchio_ciclo(app)) - set(motore(giorno, app)))
+        for giorno, app in per_giorno.items()
+    )
+
+    print(f"Appuntamenti: {args.appuntamenti} su {len(per_giorno)} giorni")
+    print(f"Vecchio ciclo: {t_vecchio * 1000:.2f} ms")
+    print(f"Motore bitmap: {t_motore * 1000:.2f} ms ({t_vecchio / t_motore:.2f}x)")
+    print(f"Slot sovrapposti che il vecchio ciclo lasciava prenotabili: {errati}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+Benchmark: ricerca standard dell'admin (LIKE '%...%') contro l'indice FTS5.
+
+Crea un database temporaneo, lo popola con popola_dati (``--clienti``
+clienti, note su una parte degli appuntamenti) e per ogni parola cercata
+misura quello che fa una pagina della changelist: COUNT dei risultati e
+prima pagina da 100 righe, sia con la ricerca standard di Django sia con
+quella indicizzata di ClienteAdmin e AppuntamentoAdmin.
+
+Uso: python scripts/bench_ricerca.py [--clienti 100000] [--appuntamenti 100000] [--ripetizioni 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time as cronometro
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAROLE_NOTE = [
+    'sfumatura', 'barba lunga', 'pelle sensibile', 'allergia', 'ritardo', 'prima visita',
+    'capelli ricci', 'regalo', 'taglio corto', 'rasatura', 'trattamento', 'cliente abituale',
+]
+
+
+def percentile(valori, p):
+    return statistics.quantiles(valori, n=100)[p - 1] if len(valori) > 1 else valori[0]
+
+
+def misura(funzione, ripetizioni):
+    tempi = []
+    for _ in range(ripetizioni):
+        inizio = cronometro.perf_counter()
+        funzione()
+        tempi.append(cronometro.perf_counter() - inizio)
+    return tempi
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clienti', type=int, default=100000)
+    parser.add_argument('--appuntamenti', type=int, default=100000)
+    parser.add_argument('--ripetizioni', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    cartella = tempfile.TemporaryDirectory()
+    os.environ['BARBER_DB'] = os.path.join(cartella.name, 'bench.sqlite3')
+    sys.path.insert(0, RADICE)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'barber_shop.settings')
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.contrib import admin
+    from django.core.management import call_command
+    from django.db import connection
+
+    from appointments.models import Appuntamento, Cliente
+
+    settings.MEDIA_ROOT = os.path.join(cartella.name, 'media')
+    call_command('migrate', verbosity=0)
+    print(f"Popolo {args.clienti} clienti...")
+    call_command(
+        'popola_dati', clienti=args.clienti, appuntamenti=args.appuntamenti, barbieri=20, anni=3,
+        seed=args.seed, stdout=open(os.devnull, 'w'),
+    )
+
+    # Note su un appuntamento su cinque (i trigger aggiornano l'indice)
+    rnd = random.Random(args.seed)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT id FROM appointments_appuntamento WHERE id % 5 = 0')
+        note = [(rnd.choice(PAROLE_NOTE) + ' ' + rnd.choice(PAROLE_NOTE), pk) for pk, in cursor.fetchall()]
+        cursor.executemany('UPDATE appointments_appuntamento SET note = %s WHERE id = %s', note)
+        cursor.execute('ANALYZE')
+
+    campione = list(Cliente.objects.order_by('?').values_list('nome', 'email', 'telefono')[:3])
+    termini = []
+    for nome, email, telefono in campione:
+        termini += [nome.split()[-1][:5].lower(), email.split('@')[0][-6:], telefono.replace(' ', '')[-6:]]
+    termini += ['allergia', 'nessuno-trova-questo']
+
+    amministrazioni = [
+        (Cliente, admin.site._registry[Cliente]),
+        (Appuntamento, admin.site._registry[Appuntamento]),
+    ]
+    print(f"{Appuntamento.objects.count()} appuntamenti, {Appuntamento.objects.exclude(note=None).count()} con note\n")
+    print(f"{'modello':<14}{'cerca':<22}{'righe LIKE/FTS':>16}{'LIKE p50':>10}{'LIKE p99':>10}{'FTS p50':>10}{'FTS p99':>10}  (ms)")
+
+    for modello, model_admin in amministrazioni:
+        for termine in termini:
+            def pagina(ricerca):
+                queryset, _ = ricerca(None, modello.objects.all(), termine)
+                return queryset.count(), list(queryset.order_by('-pk')[:100])
+
+            standard = lambda: pagina(lambda *a: admin.ModelAdmin.get_search_results(model_admin, *a))
+            indicizzata = lambda: pagina(model_admin.get_search_results)
+            # Possono differire: l'indice trova anche i telefoni scritti con spazi o trattini
+            righe_standard, _ = standard()
+            righe, _ = indicizzata()
+            tempi_standard = misura(standard, args.ripetizioni)
+            tempi = misura(indicizzata, args.ripetizioni)
+            print(
+                f"{modello.__name__:<14}{termine:<22}{f'{righe_standard}/{righe}':>16}"
+                f"{percentile(tempi_standard, 50) * 1000:>10.1f}{percentile(tempi_standard, 99) * 1000:>10.1f}"
+                f"{percentile(tempi, 50) * 1000:>10.1f}{percentile(tempi, 99) * 1000:>10.1f}"
+            )
+
+    connection.close()
+    cartella.cleanup()
+
+
+if __name__ == '__main__':
+    main()
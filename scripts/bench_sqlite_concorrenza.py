@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+Benchmark di concorrenza SQLite: profilo "standard" contro "ottimizzato".
+
+Per ogni profilo (vedi barber_shop/database.py) crea un database temporaneo,
+lo popola con popola_dati e per ``--secondi`` secondi fa girare insieme:
+
+- ``--scrittori`` thread che prenotano con salva_appuntamento
+- ``--lettori`` thread che leggono le agende di tutti i barbieri su 30 giorni
+  (senza cache, direttamente dal database)
+
+Riporta operazioni al secondo, errori "database is locked" e latenze p50/p99.
+Ogni profilo gira in un processo separato, perché DATABASES si legge una
+volta sola all'avvio di Django.
+
+Uso: python scripts/bench_sqlite_concorrenza.py [--scrittori 4] [--lettori 8] [--secondi 10]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time as cronometro
+from datetime import datetime, time, timedelta
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(valori, p):
+    if not valori:
+        return 0
+    return statistics.quantiles(valori, n=100)[p - 1] if len(valori) > 1 else valori[0]
+
+
+def esegui_profilo(args):
+    """Processo figlio: misura un profilo e stampa i risultati in JSON"""
+    sys.path.insert(0, RADICE)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'barber_shop.settings')
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import OperationalError, connection
+    from django.utils import timezone
+
+    from appointments.disponibilita import carica_agende
+    from appointments.models import Appuntamento, Barbiere, Cliente, Servizio
+    from appointments.prenotazioni import salva_appuntamento
+
+    # Le foto dei barbieri demo vanno accanto al database temporaneo
+    settings.MEDIA_ROOT = os.path.join(os.path.dirname(settings.DATABASES['default']['NAME']), 'media')
+    call_command('migrate', verbosity=0)
+    call_command('popola_dati', clienti=200, barbieri=6, appuntamenti=10000, anni=1, stdout=open(os.devnull, 'w'))
+
+    barbieri = list(Barbiere.objects.filter(attivo=True).values_list('id', flat=True))
+    clienti = list(Cliente.objects.values_list('id', flat=True)[:200])
+    servizi = list(Servizio.objects.all())
+    oggi = timezone.localdate()
+    connection.close()
+
+    risultati = {'scritture': [], 'letture': [], 'bloccati': 0, 'conflitti': 0}
+    lock = threading.Lock()
+    scadenza = cronometro.perf_counter() + args.secondi
+
+    def scrittore(seed):
+        rnd = random.Random(seed)
+        try:
+            while cronometro.perf_counter() < scadenza:
+                giorno = oggi + timedelta(days=rnd.randrange(60, 400))
+                minuti = rnd.randrange(9 * 4, 17 * 4) * 15
+                data_ora = timezone.make_aware(datetime.combine(giorno, time(minuti // 60, minuti % 60)))
+                inizio = cronometro.perf_counter()
+                try:
+                    esito = salva_appuntamento(Appuntamento(
+                        cliente_id=rnd.choice(clienti), barbiere_id=rnd.choice(barbieri),
+                        servizio=rnd.choice(servizi), data_ora=data_ora,
+                    ))
+                except OperationalError:
+                    with lock:
+                        risultati['bloccati'] += 1
+                    continue
+                with lock:
+                    risultati['scritture'].append(cronometro.perf_counter() - inizio)
+                    risultati['conflitti'] += not esito
+        finally:
+            connection.close()
+
+    def lettore(seed):
+        rnd = random.Random(seed)
+        try:
+            while cronometro.perf_counter() < scadenza:
+                dal = oggi + timedelta(days=rnd.randrange(0, 60))
+                inizio = cronometro.perf_counter()
+                try:
+                    carica_agende(barbieri, dal, dal + timedelta(days=30))
+                except OperationalError:
+                    with lock:
+                        risultati['bloccati'] += 1
+                    continue
+                with lock:
+                    risultati['letture'].append(cronometro.perf_counter() - inizio)
+        finally:
+            connection.close()
+
+    thread = [threading.Thread(target=scrittore, args=(n,)) for n in range(args.scrittori)]
+    thread += [threading.Thread(target=lettore, args=(1000 + n,)) for n in range(args.lettori)]
+    for t in thread:
+        t.start()
+    for t in thread:
+        t.join()
+
+    print(json.dumps({
+        'scritture_s': len(risultati['scritture']) / args.secondi,
+        'letture_s': len(risultati['letture']) / args.secondi,
+        'bloccati': risultati['bloccati'],
+        'conflitti': risultati['conflitti'],
+        'scrittura_p50_ms': percentile(risultati['scritture'], 50) * 1000,
+        'scrittura_p99_ms': percentile(risultati['scritture'], 99) * 1000,
+        'lettura_p50_ms': percentile(risultati['letture'], 50) * 1000,
+        'lettura_p99_ms': percentile(risultati['letture'], 99) * 1000,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scrittori', type=int, default=4)
+    parser.add_argument('--lettori', type=int, default=8)
+    parser.add_argument('--secondi', type=float, default=10)
+    parser.add_argument('--profilo', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profilo:
+        esegui_profilo(args)
+        return
+
+    print(f"{'profilo':<13}{'scritt./s':>10}{'lett./s':>10}{'locked':>8}"
+          f"{'scr p50':>9}{'scr p99':>9}{'let p50':>9}{'let p99':>9}  (ms)")
+    for profilo in ('standard', 'ottimizzato'):
+        with tempfile.TemporaryDirectory() as cartella:
+            ambiente = dict(
+                os.environ,
+                BARBER_SQLITE_PROFILO=profilo,
+                BARBER_DB=os.path.join(cartella, 'bench.sqlite3'),
+            )
+            uscita = subprocess.run(
+                [sys.executable, __file__, '--profilo', profilo, '--scrittori', str(args.scrittori),
+                 '--lettori', str(args.lettori), '--secondi', str(args.secondi)],
+                env=ambiente, capture_output=True, text=True, check=True,
+            )
+        r = json.loads(uscita.stdout.strip().splitlines()[-1])
+        print(f"{profilo:<13}{r['scritture_s']:>10.1f}{r['letture_s']:>10.1f}{r['bloccati']:>8}"
+              f"{r['scrittura_p50_ms']:>9.1f}{r['scrittura_p99_ms']:>9.1f}"
+              f"{r['lettura_p50_ms']:>9.1f}{r['lettura_p99_ms']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+Load test dell'API slot: WSGI sincrono contro ASGI asincrono.
+
+Avvia prima i due server sullo stesso database, ad esempio:
+
+    gunicorn barber_shop.wsgi -w 4 -b 127.0.0.1:8000
+    BARBER_VISTE_ASYNC=1 uvicorn barber_shop.asgi:application --workers 4 --port 8001
+
+poi lancia:
+
+    python scripts/load_test_slot.py --utente mario.rossi@example.com \\
+        --target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001
+
+Per ogni target apre ``--client`` connessioni concorrenti (client HTTP
+asincrono minimale, solo libreria standard) che chiamano
+/api/slot-disponibili/ per ``--secondi`` secondi su date e barbieri diversi,
+e riporta richieste/s, errori e latenza p50/p95/p99.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time as cronometro
+from datetime import timedelta
+from urllib.parse import urlencode, urlsplit
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'barber_shop.settings')
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.utils import timezone
+
+from appointments.models import Barbiere
+
+
+def crea_sessione(email):
+    """Sessione autenticata per l'utente, come dopo un login"""
+    user = User.objects.get(username=email)
+    sessione = SessionStore()
+    sessione[SESSION_KEY] = str(user.pk)
+    sessione[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    sessione[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    sessione.create()
+    return sessione.session_key
+
+
+async def get(host, porta, percorso, cookie):
+    """Una GET HTTP/1.1 con connessione dedicata; restituisce lo status"""
+    reader, writer = await asyncio.open_connection(host, porta)
+    writer.write((
+        f'GET {percorso} HTTP/1.1\r\nHost: {host}\r\nCookie: {cookie}\r\n'
+        'Connection: close\r\n\r\n'
+    ).encode())
+    await writer.drain()
+    risposta = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    return int(risposta.split(b' ', 2)[1])
+
+
+async def client(url, cookie, percorsi, scadenza, latenze, errori):
+    parti = urlsplit(url)
+    while cronometro.perf_counter() < scadenza:
+        inizio = cronometro.perf_counter()
+        try:
+            status = await get(parti.hostname, parti.port or 80, random.choice(percorsi), cookie)
+        except OSError:
+            status = None
+        if status == 200:
+            latenze.append(cronometro.perf_counter() - inizio)
+        else:
+            errori.append(status)
+
+
+async def misura(url, cookie, percorsi, n_client, secondi):
+    latenze, errori = [], []
+    scadenza = cronometro.perf_counter() + secondi
+    await asyncio.gather(*(
+        client(url, cookie, percorsi, scadenza, latenze, errori) for _ in range(n_client)
+    ))
+    return latenze, errori
+
+
+def percentile(valori, p):
+    return statistics.quantiles(valori, n=100)[p - 1] if len(valori) > 1 else valori[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--utente', required=True, help='email di un utente esistente')
+    parser.add_argument('--target', action='append', required=True, help='nome=url, ripetibile')
+    parser.add_argument('--client', type=int, default=100)
+    parser.add_argument('--secondi', type=float, default=20)
+    parser.add_argument('--giorni', type=int, default=30)
+    args = parser.parse_args()
+
+    cookie = f'{settings.SESSION_COOKIE_NAME}={crea_sessione(args.utente)}'
+    oggi = timezone.localdate()
+    percorsi = [
+        '/api/slot-disponibili/?' + urlencode({
+            'data': (oggi + timedelta(days=n)).isoformat(), 'barbiere': barbiere_id,
+        })
+        for barbiere_id in Barbiere.objects.filter(attivo=True).values_list('id', flat=True)
+        for n in range(args.giorni)
+    ]
+
+    print(f"{'target':<10}{'req/s':>10}{'errori':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for target in args.target:
+        nome, url = target.split('=', 1)
+        latenze, errori = asyncio.run(misura(url, cookie, percorsi, args.client, args.secondi))
+        if not latenze:
+            print(f'{nome:<10} nessuna risposta valida ({len(errori)} errori)')
+            continue
+        print(
+            f'{nome:<10}{len(latenze) / args.secondi:>10.1f}{len(errori):>8}'
+            f'{percentile(latenze, 50) * 1000:>10.1f}'
+            f'{percentile(latenze, 95) * 1000:>10.1f}'
+            f'{percentile(latenze, 99) * 1000:>10.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
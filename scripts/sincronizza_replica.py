@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Replica locale per provare il router lettura/scrittura (appointments/router.py).
+
+Copia periodicamente il database primario in un secondo file SQLite con la
+backup API di sqlite3 (copia coerente anche mentre il primario riceve
+scritture). L'intervallo simula il ritardo di una replica vera.
+
+    python scripts/sincronizza_replica.py db.sqlite3 db_replica.sqlite3 --ogni 2
+    BARBER_DB_REPLICA=db_replica.sqlite3 python manage.py runserver
+
+Con --una-volta copia e termina.
+"""
+import argparse
+import sqlite3
+import time as cronometro
+
+
+def copia(primario, replica):
+    sorgente = sqlite3.connect(f'file:{primario}?mode=ro', uri=True)
+    destinazione = sqlite3.connect(replica)
+    try:
+        sorgente.backup(destinazione)
+    finally:
+        destinazione.close()
+        sorgente.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('primario')
+    parser.add_argument('replica')
+    parser.add_argument('--ogni', type=float, default=2, help="secondi tra una copia e l'altra")
+    parser.add_argument('--una-volta', action='store_true')
+    args = parser.parse_args()
+
+    while True:
+        inizio = cronometro.perf_counter()
+        copia(args.primario, args.replica)
+        print(f"Replica aggiornata in {(cronometro.perf_counter() - inizio) * 1000:.0f} ms", flush=True)
+        if args.una_volta:
+            return
+        cronometro.sleep(args.ogni)
+
+
+if __name__ == '__main__':
+    main()